@@ -0,0 +1,170 @@
+"""
+Compara a busca de voos sob gunicorn/WSGI (view síncrona) e sob uvicorn/ASGI
+(view assíncrona), com a Amadeus simulada por um servidor local.
+
+Uso (na raiz do projeto):
+    python benchmarks/asgi_vs_wsgi.py --requests 400 --concurrency 100 --latency 0.3
+
+Cada servidor roda com o mesmo número de workers e o cache de ofertas
+desligado, para que toda requisição chegue ao servidor falso. O resultado
+é impresso e salvo em JSON (--output, por padrão em benchmarks/results/).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+SERVERS = {
+    'wsgi': {
+        'command': ['gunicorn', '--workers', '{workers}', '--bind', '127.0.0.1:{port}',
+                    'config.wsgi:application'],
+        'path': '/api/v1/search-flights/',
+    },
+    'asgi': {
+        'command': [sys.executable, '-m', 'uvicorn', '--workers', '{workers}',
+                    '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning',
+                    'config.asgi:application'],
+        'path': '/api/v1/async/search-flights/',
+    },
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(process, port, name):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"O servidor {name} não subiu na porta {port}")
+
+
+def start_fake_amadeus(latency, error_rate=0.0, offers=5):
+    """Sobe a Amadeus falsa em outro processo, fora do GIL do gerador de carga."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flights.fake_amadeus', '--port', str(port),
+         '--latency', str(latency), '--error-rate', str(error_rate),
+         '--offers', str(offers)],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL)
+    wait_for_port(process, port, 'fake_amadeus')
+    return process, f"http://127.0.0.1:{port}"
+
+
+def start_server(name, workers, amadeus_url):
+    port = free_port()
+    command = [part.format(workers=workers, port=port) for part in SERVERS[name]['command']]
+    env = {
+        **os.environ,
+        'AMADEUS_BASE_URL': amadeus_url,
+        'AMADEUS_API_KEY': 'fake-id',
+        'AMADEUS_API_SECRET': 'fake-secret',
+        'USE_MOCK_AMADEUS': 'False',
+        'FLIGHT_CACHE_TTL': '0',
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1',
+    }
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(process, port, name)
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def drive(url, params, total, concurrency):
+    """
+    Faz `total` GETs em `url` com no máximo `concurrency` simultâneos. Com
+    uma lista em `params`, as requisições alternam entre os parâmetros.
+    """
+    params_list = params if isinstance(params, list) else [params]
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def one(params):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url, params=params)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(params_list[i % len(params_list)])
+                               for i in range(total)])
+        elapsed = time.perf_counter() - started
+
+    # quantiles precisa de pelo menos dois pontos
+    quantiles = statistics.quantiles(latencies * (2 if len(latencies) == 1 else 1), n=100)
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 1),
+        'p95_ms': round(quantiles[94] * 1000, 1),
+        'p99_ms': round(quantiles[98] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.3,
+                        help='latência simulada da Amadeus, em segundos')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'asgi_vs_wsgi.json'))
+    args = parser.parse_args()
+
+    params = {'origem': 'GRU', 'destino': 'GIG',
+              'data': (date.today() + timedelta(days=30)).isoformat()}
+    results = {'upstream_latency_s': args.latency, 'workers': args.workers}
+
+    fake_process, amadeus_url = start_fake_amadeus(args.latency)
+    try:
+        for name, server in SERVERS.items():
+            process, base_url = start_server(name, args.workers, amadeus_url)
+            try:
+                url = base_url + server['path']
+                # aquecimento: token OAuth e imports de cada worker
+                asyncio.run(drive(url, params, args.workers * 4, args.workers))
+                results[name] = asyncio.run(
+                    drive(url, params, args.requests, args.concurrency))
+            finally:
+                process.terminate()
+                process.wait()
+            print(name, json.dumps(results[name]))
+    finally:
+        fake_process.terminate()
+        fake_process.wait()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados salvos em {args.output}")
+
+
+if __name__ == '__main__':
+    main()
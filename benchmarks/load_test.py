@@ -0,0 +1,248 @@
+"""
+Teste de carga dos endpoints com a Amadeus simulada por um servidor local.
+
+Para cada quantidade de alertas (--alerts), cria um banco SQLite novo,
+semeia os PriceAlert em --routes rotas e mede, cada cenário com um
+gunicorn recém-iniciado apontando para a Amadeus falsa (latência, taxa de
+erros e ofertas por resposta configuráveis):
+  - search: GET /api/v1/search-flights/, alternando entre as rotas semeadas
+  - check-alerts: GET /api/v1/check-alerts/
+  - dashboard: GET /dashboard/
+
+Por cenário: latência p50/p95/p99, requisições por segundo, chamadas
+recebidas pela Amadeus falsa e pico de memória (RSS) dos workers. Os preços
+alvo ficam abaixo dos preços da Amadeus falsa, então nenhum alerta dispara e
+toda verificação refaz o mesmo trabalho.
+
+Uso (na raiz do projeto):
+    python benchmarks/load_test.py --alerts 1000,10000,100000 --requests 500 --concurrency 50
+
+O resultado é impresso e salvo em JSON (--output, por padrão em
+benchmarks/results/), com a data e o commit, para comparar execuções ao
+longo do tempo.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import httpx
+
+from asgi_vs_wsgi import (
+    BASE_DIR, RESULTS_DIR, drive, free_port, start_fake_amadeus, wait_for_port)
+
+SCENARIOS = {
+    'search': '/api/v1/search-flights/',
+    'check-alerts': '/api/v1/check-alerts/',
+    'dashboard': '/dashboard/',
+}
+
+AIRPORTS = ['GRU', 'GIG', 'BSB', 'CNF', 'SSA', 'REC', 'FOR', 'POA', 'CWB', 'BEL',
+            'MAO', 'FLN', 'NAT', 'MCZ', 'VIX', 'GYN', 'CGB', 'SLZ', 'THE', 'AJU']
+
+
+def benchmark_routes(count):
+    """As `count` primeiras rotas entre os aeroportos, sempre na mesma ordem."""
+    routes = [(origin, destination) for origin in AIRPORTS for destination in AIRPORTS
+              if origin != destination]
+    return routes[:count]
+
+
+def seed(database_url, alerts, routes):
+    """Cria as tabelas e semeia os alertas (roda em um processo próprio)."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    sys.path.insert(0, BASE_DIR)
+
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+
+    from flights.models import PriceAlert
+
+    call_command('migrate', verbosity=0)
+    rng = random.Random(alerts)
+    route_list = benchmark_routes(routes)
+    PriceAlert.objects.bulk_create(
+        (PriceAlert(user_whatsapp_id=f"55859{i:08d}",
+                    origin_code=route_list[i % len(route_list)][0],
+                    destination_code=route_list[i % len(route_list)][1],
+                    # Abaixo do menor preço da Amadeus falsa (300.00)
+                    target_price=f"{rng.uniform(100, 299):.2f}")
+         for i in range(alerts)),
+        batch_size=5000)
+
+
+def start_server(workers, database_url, amadeus_url, extra_env):
+    port = free_port()
+    env = {
+        **os.environ,
+        'DATABASE_URL': database_url,
+        'AMADEUS_BASE_URL': amadeus_url,
+        'AMADEUS_API_KEY': 'fake-id',
+        'AMADEUS_API_SECRET': 'fake-secret',
+        'USE_MOCK_AMADEUS': 'False',
+        'DJANGO_ALLOWED_HOSTS': '127.0.0.1',
+        **extra_env,
+    }
+    process = subprocess.Popen(
+        ['gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--timeout', '600', 'config.wsgi:application'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(process, port, 'gunicorn')
+    return process, f"http://127.0.0.1:{port}"
+
+
+def peak_rss_mb(pid):
+    """
+    Pico de memória (VmHWM) do master do gunicorn e dos workers, em MB.
+    Depende do /proc; retorna None fora do Linux.
+    """
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            workers = [int(child) for child in f.read().split()]
+        peaks = {}
+        for process_id in [pid, *workers]:
+            with open(f'/proc/{process_id}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peaks[process_id] = int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    worker_peaks = [peaks[worker] for worker in workers if worker in peaks]
+    return {
+        'max_worker_mb': round(max(worker_peaks, default=0), 1),
+        'total_mb': round(sum(peaks.values()), 1),
+    }
+
+
+def upstream_counters(amadeus_url):
+    return httpx.get(f"{amadeus_url}/__stats").json()
+
+
+def run_scenario(name, args, database_url, amadeus_url, route_params):
+    process, base_url = start_server(args.workers, database_url, amadeus_url, {
+        'FLIGHT_CACHE_TTL': str(args.cache_ttl),
+        # Sem reaproveitar observações: toda verificação consulta as rotas
+        'PRICE_OBSERVATION_MAX_AGE': '0',
+        **({'AMADEUS_RATE_LIMIT': str(args.rate_limit)} if args.rate_limit else {}),
+    })
+    try:
+        # aquecimento: imports e conexões de cada worker
+        asyncio.run(drive(f"{base_url}/api/v1/cache-stats/", {}, args.workers * 4, args.workers))
+
+        if name == 'check-alerts':
+            total, concurrency, params = args.check_requests, args.check_concurrency, {}
+        elif name == 'search':
+            total, concurrency, params = args.requests, args.concurrency, route_params
+        else:
+            total, concurrency, params = args.requests, args.concurrency, {}
+
+        before = upstream_counters(amadeus_url)
+        result = asyncio.run(drive(base_url + SCENARIOS[name], params, total, concurrency))
+        after = upstream_counters(amadeus_url)
+
+        result['upstream'] = {counter: after[counter] - before[counter]
+                              for counter in ('search_requests', 'token_requests', 'errors')}
+        result['peak_rss_mb'] = peak_rss_mb(process.pid)
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--alerts', default='1000,10000,100000',
+                        help='quantidades de alertas, separadas por vírgula')
+    parser.add_argument('--routes', type=int, default=100,
+                        help=f'rotas distintas dos alertas (até {len(AIRPORTS) * (len(AIRPORTS) - 1)})')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--check-requests', type=int, default=3)
+    parser.add_argument('--check-concurrency', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='latência simulada da Amadeus, em segundos')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fração das buscas em que a Amadeus falsa responde 500')
+    parser.add_argument('--offers', type=int, default=20,
+                        help='ofertas por resposta da Amadeus falsa')
+    parser.add_argument('--cache-ttl', type=int, default=0,
+                        help='FLIGHT_CACHE_TTL dos workers (0 desliga o cache)')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='AMADEUS_RATE_LIMIT dos workers (padrão: o do projeto)')
+    parser.add_argument('--output', default=None,
+                        help='arquivo JSON (padrão: benchmarks/results/load_test-<data>.json)')
+    # Uso interno: semeia o banco em um processo separado
+    parser.add_argument('--seed-database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_database:
+        seed(args.seed_database, int(args.alerts), args.routes)
+        return
+
+    started_at = datetime.now()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load_test-{started_at:%Y%m%d-%H%M%S}.json")
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+
+    travel_date = (date.today() + timedelta(days=30)).isoformat()
+    route_params = [{'origem': origin, 'destino': destination, 'data': travel_date}
+                    for origin, destination in benchmark_routes(args.routes)]
+    results = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key != 'seed_database'},
+        'runs': [],
+    }
+
+    fake_process, amadeus_url = start_fake_amadeus(args.latency, args.error_rate, args.offers)
+    try:
+        for alerts in (int(count) for count in args.alerts.split(',')):
+            with tempfile.TemporaryDirectory() as tmp:
+                database_url = f"sqlite:///{os.path.join(tmp, 'db.sqlite3')}"
+                seed_started = time.perf_counter()
+                subprocess.run([sys.executable, os.path.abspath(__file__),
+                                '--seed-database', database_url, '--alerts', str(alerts),
+                                '--routes', str(args.routes)], cwd=BASE_DIR, check=True)
+                run = {'alerts': alerts, 'seed_s': round(time.perf_counter() - seed_started, 2),
+                       'scenarios': {}}
+
+                for name in scenarios:
+                    run['scenarios'][name] = run_scenario(
+                        name, args, database_url, amadeus_url, route_params)
+                    print(alerts, name, json.dumps(run['scenarios'][name]))
+            results['runs'].append(run)
+    finally:
+        fake_process.terminate()
+        fake_process.wait()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados salvos em {output}")
+
+
+if __name__ == '__main__':
+    main()
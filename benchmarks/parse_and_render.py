@@ -0,0 +1,149 @@
+"""
+Mede o parse das ofertas da Amadeus e a serialização da resposta da busca:
+o parser antigo (um dict por oferta) com o JSONRenderer do DRF contra os
+FlightOption com o FastJSONRenderer.
+
+A comparação usa ofertas só de ida, que o parser antigo cobre por inteiro;
+as de ida e volta são medidas só no parser atual, já que o antigo ignora
+a volta.
+
+Uso (na raiz do projeto):
+    python benchmarks/parse_and_render.py --offers 250 --repeat 200
+
+O resultado é impresso e salvo em JSON (--output).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from flights.fake_amadeus import build_offer  # noqa: E402
+from flights.offers import parse_amadeus_response  # noqa: E402
+from flights.renderers import FastJSONRenderer, orjson  # noqa: E402
+
+
+def legacy_parse_amadeus_response(amadeus_response):
+    """Parser anterior, mantido aqui só como referência de desempenho."""
+    flights_list = []
+    carriers = {}
+    if hasattr(amadeus_response, 'dictionaries') and amadeus_response.dictionaries is not None:
+        carriers = amadeus_response.dictionaries.get('carriers', {})
+
+    for offer in amadeus_response.data:
+        try:
+            itinerary = offer['itineraries'][0]
+            segments = itinerary['segments']
+            first_segment = segments[0]
+            last_segment = segments[-1]
+            stops = len(segments) - 1
+            carrier_code = first_segment['carrierCode']
+            flight_info = {
+                "origin": first_segment['departure']['iataCode'],
+                "destination": last_segment['arrival']['iataCode'],
+                "departure_time": first_segment['departure']['at'],
+                "arrival_time": last_segment['arrival']['at'],
+                "stops": stops,
+                "duration": itinerary['duration'],
+                "carrier": carriers.get(carrier_code, carrier_code),
+                "price": offer.get('price', {}).get('total')
+            }
+            flights_list.append(flight_info)
+        except (IndexError, KeyError) as e:
+            print(f"Erro ao processar uma oferta de voo: {e}")
+            continue
+    return flights_list
+
+
+def build_response(count, round_trip=False):
+    """Ofertas só de ida ou de ida e volta (a volta com uma conexão)."""
+    offers = []
+    for index in range(count):
+        offer = build_offer('GRU', 'GIG', '2026-11-20', index)
+        offers.append(offer)
+        if not round_trip:
+            continue
+        offer['itineraries'].append({
+            "duration": "PT3H10M",
+            "segments": [
+                {"departure": {"iataCode": "GIG", "at": "2026-11-27T18:00:00"},
+                 "arrival": {"iataCode": "BSB", "at": "2026-11-27T19:45:00"},
+                 "carrierCode": "LA", "number": str(3000 + index)},
+                {"departure": {"iataCode": "BSB", "at": "2026-11-27T20:30:00"},
+                 "arrival": {"iataCode": "GRU", "at": "2026-11-27T21:10:00"},
+                 "carrierCode": "LA", "number": str(4000 + index)},
+            ]
+        })
+    dictionaries = {'carriers': {'G3': 'GOL LINHAS AEREAS', 'LA': 'LATAM AIRLINES BRASIL'}}
+    return SimpleNamespace(data=offers, dictionaries=dictionaries)
+
+
+def measure(parse, renderer, response, repeat):
+    """Tempo médio (ms) de parse e de render por resposta."""
+    parse_time = render_time = 0.0
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        options = parse(response)
+        parsed_at = time.perf_counter()
+        body = renderer.render({
+            "route": "GRU -> GIG",
+            "date": "2026-11-20",
+            "flight_options": options,
+        }, 'application/json', {})
+        rendered_at = time.perf_counter()
+
+        parse_time += parsed_at - start
+        render_time += rendered_at - parsed_at
+        size = len(body)
+
+    return {
+        'parse_ms': round(parse_time / repeat * 1000, 3),
+        'render_ms': round(render_time / repeat * 1000, 3),
+        'total_ms': round((parse_time + render_time) / repeat * 1000, 3),
+        'body_bytes': size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--offers', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', default='benchmark_parse_and_render.json')
+    args = parser.parse_args()
+
+    one_way = build_response(args.offers)
+    round_trip = build_response(args.offers, round_trip=True)
+    results = {
+        'offers': args.offers,
+        'repeat': args.repeat,
+        'orjson': orjson is not None,
+        'one_way': {
+            'legacy': measure(legacy_parse_amadeus_response, JSONRenderer(), one_way, args.repeat),
+            'current': measure(parse_amadeus_response, FastJSONRenderer(), one_way, args.repeat),
+        },
+        'round_trip': {
+            'current': measure(parse_amadeus_response, FastJSONRenderer(), round_trip, args.repeat),
+        },
+    }
+    results['one_way']['speedup'] = round(
+        results['one_way']['legacy']['total_ms'] / results['one_way']['current']['total_ms'], 2)
+
+    print(json.dumps(results, indent=2))
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
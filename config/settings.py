@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'flights.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,6 +95,161 @@ if DATABASE_URL:
     DATABASES['default'] = dj_database_url.config(conn_max_age=600)
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# O alias 'flight_offers' guarda as respostas da Amadeus. Para compartilhar o
+# cache entre workers do gunicorn use um backend de arquivo ou banco, ex:
+#   FLIGHT_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+#   FLIGHT_CACHE_LOCATION=/tmp/flight-offers
+# (com DatabaseCache, rode `python manage.py createcachetable`).
+
+FLIGHT_CACHE_TTL = int(os.getenv('FLIGHT_CACHE_TTL', '300'))
+FLIGHT_CACHE_STALE_TTL = int(os.getenv('FLIGHT_CACHE_STALE_TTL', '0'))
+FLIGHT_CACHE_MAX_ENTRIES = int(os.getenv('FLIGHT_CACHE_MAX_ENTRIES', '5000'))
+# Tempo extra (segundos) que a última resposta de cada rota fica guardada
+# para ser servida como `stale` enquanto o circuito da Amadeus está aberto.
+FLIGHT_CACHE_FALLBACK_TTL = int(os.getenv('FLIGHT_CACHE_FALLBACK_TTL', '86400'))
+# Espera máxima (segundos) pela busca da mesma rota em outro worker; 0 desliga
+# a coalescência entre workers (dentro do processo ela continua valendo).
+FLIGHT_COALESCE_TIMEOUT = float(os.getenv('FLIGHT_COALESCE_TIMEOUT', '10'))
+
+CACHES = {
+    # Fragmentos do dashboard; use um backend compartilhado para que a
+    # invalidação valha para todos os workers
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    'flight_offers': {
+        'BACKEND': os.getenv(
+            'FLIGHT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('FLIGHT_CACHE_LOCATION', 'flight-offers'),
+        'TIMEOUT': FLIGHT_CACHE_TTL + FLIGHT_CACHE_STALE_TTL + FLIGHT_CACHE_FALLBACK_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': FLIGHT_CACHE_MAX_ENTRIES,
+        },
+    },
+}
+
+# Django REST Framework
+# O FastJSONRenderer serializa as respostas com orjson quando ele está
+# instalado (e com o encoder padrão do DRF quando não está).
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'flights.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Verificação de alertas
+# Rotas consultadas em paralelo, cota da Amadeus (chamadas/s por processo,
+# só para as chamadas que não vêm do cache de ofertas) e tempo máximo de
+# cada rota antes de ser pulada.
+
+ALERT_CHECK_CONCURRENCY = int(os.getenv('ALERT_CHECK_CONCURRENCY', '8'))
+ALERT_CHECK_ROUTE_TIMEOUT = float(os.getenv('ALERT_CHECK_ROUTE_TIMEOUT', '15'))
+AMADEUS_RATE_LIMIT = float(os.getenv('AMADEUS_RATE_LIMIT', '10'))
+
+# Circuit breaker da Amadeus: abre quando, na janela (segundos) e com pelo
+# menos MIN_CALLS chamadas, a taxa de erros ou de chamadas mais lentas que
+# SLOW_CALL_SECONDS passa do limite; testa de novo após OPEN_SECONDS.
+AMADEUS_BREAKER_FAILURE_RATE = float(os.getenv('AMADEUS_BREAKER_FAILURE_RATE', '0.5'))
+AMADEUS_BREAKER_SLOW_CALL_RATE = float(os.getenv('AMADEUS_BREAKER_SLOW_CALL_RATE', '0.5'))
+AMADEUS_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('AMADEUS_BREAKER_SLOW_CALL_SECONDS', '5'))
+AMADEUS_BREAKER_MIN_CALLS = int(os.getenv('AMADEUS_BREAKER_MIN_CALLS', '10'))
+AMADEUS_BREAKER_WINDOW = float(os.getenv('AMADEUS_BREAKER_WINDOW', '60'))
+AMADEUS_BREAKER_OPEN_SECONDS = float(os.getenv('AMADEUS_BREAKER_OPEN_SECONDS', '30'))
+
+# Agenda adaptativa (`run_alert_scheduler`): rotas verificadas por ciclo,
+# intervalo entre ciclos e limites do intervalo de cada rota (segundos).
+
+ALERT_SCHEDULER_BUDGET = int(os.getenv('ALERT_SCHEDULER_BUDGET', '50'))
+ALERT_SCHEDULER_CYCLE_SECONDS = float(os.getenv('ALERT_SCHEDULER_CYCLE_SECONDS', '60'))
+ALERT_SCHEDULER_MIN_INTERVAL = float(os.getenv('ALERT_SCHEDULER_MIN_INTERVAL', '300'))
+ALERT_SCHEDULER_MAX_INTERVAL = float(os.getenv('ALERT_SCHEDULER_MAX_INTERVAL', '21600'))
+
+# Intervalo (segundos) para cada worker trazer ao índice de disparo
+# oportunista os alertas criados em outros workers.
+ALERT_MATCHING_REFRESH_INTERVAL = float(os.getenv('ALERT_MATCHING_REFRESH_INTERVAL', '30'))
+
+# Máximo de alertas por chamada de /create-alerts/.
+BULK_ALERT_MAX_SIZE = int(os.getenv('BULK_ALERT_MAX_SIZE', '100'))
+
+# Interpretação das mensagens (/understand-message/): mensagens que as regras
+# locais não resolvem vão para o modelo da OpenAI, com a resposta em cache
+# (alias 'default') por INTENT_CACHE_TTL segundos.
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+INTENT_LLM_TIMEOUT = float(os.getenv('INTENT_LLM_TIMEOUT', '10'))
+INTENT_CACHE_TTL = int(os.getenv('INTENT_CACHE_TTL', '86400'))
+
+# Entrega das notificações por webhook (`deliver_notifications`). Com a URL
+# vazia, o check-alerts devolve as notificações na resposta. Lotes recusados
+# são tentados de novo com backoff exponencial (base e teto em segundos) até
+# NOTIFICATION_MAX_ATTEMPTS tentativas.
+NOTIFICATION_WEBHOOK_URL = os.getenv('NOTIFICATION_WEBHOOK_URL', '')
+NOTIFICATION_WEBHOOK_TOKEN = os.getenv('NOTIFICATION_WEBHOOK_TOKEN', '')
+NOTIFICATION_WEBHOOK_TIMEOUT = float(os.getenv('NOTIFICATION_WEBHOOK_TIMEOUT', '10'))
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '100'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '8'))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv('NOTIFICATION_RETRY_BASE_SECONDS', '30'))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv('NOTIFICATION_RETRY_MAX_SECONDS', '3600'))
+NOTIFICATION_POLL_SECONDS = float(os.getenv('NOTIFICATION_POLL_SECONDS', '5'))
+
+# Buscas compostas (calendário de preços e busca em lote): consultas em
+# paralelo por requisição, tempo máximo de cada uma, tamanho máximo do
+# período do calendário e de consultas por lote.
+
+SEARCH_FAN_OUT_CONCURRENCY = int(os.getenv('SEARCH_FAN_OUT_CONCURRENCY', '8'))
+SEARCH_FAN_OUT_TIMEOUT = float(os.getenv('SEARCH_FAN_OUT_TIMEOUT', '15'))
+CALENDAR_MAX_DAYS = int(os.getenv('CALENDAR_MAX_DAYS', '31'))
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv('BATCH_SEARCH_MAX_QUERIES', '20'))
+
+# Dashboard
+# Alertas por página e tempo máximo (segundos) dos fragmentos em cache.
+
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '50'))
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+
+# Histórico de preços
+# Idade máxima (segundos) de uma observação para evitar uma nova consulta na
+# verificação de alertas, e retenção usada por `prune_price_observations`.
+
+PRICE_OBSERVATION_MAX_AGE = int(os.getenv('PRICE_OBSERVATION_MAX_AGE', '900'))
+PRICE_OBSERVATION_RETENTION_DAYS = int(os.getenv('PRICE_OBSERVATION_RETENTION_DAYS', '90'))
+PRICE_OBSERVATION_DOWNSAMPLE_DAYS = int(os.getenv('PRICE_OBSERVATION_DOWNSAMPLE_DAYS', '7'))
+
+# Logs e métricas
+# Logs em JSON (uma linha por evento) ou texto; requisições mais lentas que
+# SLOW_REQUEST_SECONDS geram um aviso com os tempos. Com METRICS_DIR, cada
+# worker grava suas métricas nesse diretório a cada METRICS_FLUSH_INTERVAL
+# segundos e o /metrics soma as de todos (limpe o diretório ao subir).
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '1'))
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'flights.log_format.JSONFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'flights': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
-from flights.views import AlertsDashboardView
+from flights.views import AlertsDashboardView, MetricsView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('dashboard/', AlertsDashboardView.as_view(), name='dashboard'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/v1/', include('flights.urls')),
 ]
@@ -0,0 +1,171 @@
+"""
+Índice em memória de aeroportos e cidades -> códigos IATA.
+
+Os dados vêm de `data/airports.csv` (aeroporto, código da cidade, cidade,
+nome do aeroporto, país e apelidos). Os nomes são guardados sem acentos e
+em minúsculas, em uma lista ordenada com os códigos em uma lista paralela:
+a busca exata e a por prefixo são um bisect, na casa dos microssegundos. A
+busca aproximada (erros de digitação) só roda quando as outras não acham
+nada.
+
+Uma cidade com mais de um aeroporto resolve para todos eles (São Paulo ->
+GRU, CGH, VCP) e, na busca de voos, para o código da cidade (SAO), aceito
+pela Amadeus.
+"""
+import csv
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from difflib import get_close_matches
+from functools import cache
+
+AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'airports.csv')
+
+IATA_CODE_PATTERN = re.compile(r'[A-Za-z]{3}')
+
+
+@dataclass(frozen=True)
+class Airport:
+    iata: str
+    city_code: str
+    city: str
+    name: str
+    country: str
+    # Outros nomes pelos quais o aeroporto é procurado (ex: "Rio", "London")
+    aliases: tuple = ()
+
+    def as_dict(self):
+        data = asdict(self)
+        del data['aliases']
+        return data
+
+
+def fold(text):
+    """Minúsculas sem acentos, com um caractere para cada caractere de `text`."""
+    return ''.join(unicodedata.normalize('NFKD', char.lower())[0] for char in text)
+
+
+def normalize_name(text):
+    """Chave de busca de um nome: palavras sem acentos, separadas por um espaço."""
+    return ' '.join(re.findall(r'\w+', fold(text)))
+
+
+class AirportIndex:
+    """Nomes e códigos -> aeroportos, com busca exata, por prefixo e aproximada."""
+
+    def __init__(self, airports):
+        self.airports = {airport.iata: airport for airport in airports}
+
+        by_code = defaultdict(list)
+        by_name = defaultdict(list)
+        for airport in airports:
+            by_code[airport.iata].append(airport.iata)
+            if airport.city_code != airport.iata:
+                by_code[airport.city_code].append(airport.iata)
+            for name in (airport.city, airport.name, *airport.aliases):
+                codes = by_name[normalize_name(name)]
+                if airport.iata not in codes:
+                    codes.append(airport.iata)
+        self.by_code = {code: tuple(codes) for code, codes in by_code.items()}
+
+        self.names = sorted(key for key in by_name if key)
+        self.codes = [tuple(by_name[name]) for name in self.names]
+        self.max_name_words = max((name.count(' ') + 1 for name in self.names), default=0)
+
+    def lookup(self, text):
+        """Aeroportos (códigos IATA) de um código ou nome exato; () se desconhecido."""
+        text = (text or '').strip()
+        if IATA_CODE_PATTERN.fullmatch(text) and text.upper() in self.by_code:
+            return self.by_code[text.upper()]
+        name = normalize_name(text)
+        position = bisect_left(self.names, name)
+        if position < len(self.names) and self.names[position] == name:
+            return self.codes[position]
+        return ()
+
+    def location_code(self, codes):
+        """Código para a busca: o do aeroporto, ou o da cidade se forem vários."""
+        if len(codes) == 1:
+            return codes[0]
+        city_codes = {self.airports[code].city_code for code in codes}
+        return city_codes.pop() if len(city_codes) == 1 else None
+
+    def resolve(self, text):
+        """
+        Código IATA para a busca a partir de um código ou nome, ou None se o
+        nome for desconhecido ou ambíguo. Três letras fora do índice são
+        aceitas como código quando vêm em maiúsculas (ex: "SAN") ou não são
+        o começo de um nome conhecido; "Cur" ou "cur" viram uma sugestão de
+        Curitiba em vez de um código.
+        """
+        text = (text or '').strip()
+        codes = self.lookup(text)
+        if codes:
+            return self.location_code(codes)
+        if IATA_CODE_PATTERN.fullmatch(text) and (
+                text.isupper() or next(self.prefix(text), None) is None):
+            return text.upper()
+        return None
+
+    def prefix(self, text):
+        """Aeroportos dos nomes que começam com `text`, em ordem alfabética."""
+        name = normalize_name(text)
+        if not name:
+            return
+        position = bisect_left(self.names, name)
+        while position < len(self.names) and self.names[position].startswith(name):
+            yield from self.codes[position]
+            position += 1
+
+    def search(self, text, limit=10):
+        """
+        Aeroportos para um texto digitado: código exato, nomes com o prefixo
+        e, se nada for encontrado, nomes parecidos.
+        """
+        codes = list(self.lookup(text)) if IATA_CODE_PATTERN.fullmatch(text.strip()) else []
+        codes.extend(self.prefix(text))
+        if not codes:
+            for name in get_close_matches(normalize_name(text), self.names, n=limit, cutoff=0.75):
+                codes.extend(self.codes[bisect_left(self.names, name)])
+        return [self.airports[code] for code in dict.fromkeys(codes)][:limit]
+
+    def find_in_text(self, folded):
+        """
+        Nomes de cidades e aeroportos citados em um texto já sem acentos,
+        do mais longo para o mais curto: [(início, fim, códigos)].
+        """
+        words = list(re.finditer(r'\w+', folded))
+        found = []
+        position = 0
+        while position < len(words):
+            for size in range(min(self.max_name_words, len(words) - position), 0, -1):
+                span = words[position:position + size]
+                name = ' '.join(word.group() for word in span)
+                index = bisect_left(self.names, name)
+                if index < len(self.names) and self.names[index] == name:
+                    found.append((span[0].start(), span[-1].end(), self.codes[index]))
+                    position += size
+                    break
+            else:
+                position += 1
+        return found
+
+    def __len__(self):
+        return len(self.airports)
+
+
+def load_airports(path=AIRPORTS_FILE):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [Airport(iata=row['iata'], city_code=row['city_code'], city=row['city'],
+                        name=row['name'], country=row['country'],
+                        aliases=tuple(alias for alias in row['aliases'].split('|') if alias))
+                for row in csv.DictReader(f)]
+
+
+@cache
+def airport_index():
+    """Índice carregado uma vez por processo (no aquecimento dos workers)."""
+    return AirportIndex(load_airports())
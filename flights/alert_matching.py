@@ -0,0 +1,204 @@
+"""
+Disparo oportunista dos alertas a partir das buscas dos usuários.
+
+Cada worker mantém em memória um índice dos alertas ativos por rota, com os
+preços alvo ordenados. Um preço visto em uma busca encontra todos os alertas
+satisfeitos (preço alvo >= preço) com uma busca binária, sem consultar o
+banco quando nenhum alerta dispara. O índice é atualizado pelos sinais do
+PriceAlert e por `queue_notifications`; alertas criados em outros workers
+entram na próxima sincronização (a cada ALERT_MATCHING_REFRESH_INTERVAL
+segundos, lendo só os ids novos).
+
+Os alertas disparados são desativados e suas notificações ficam na fila
+(AlertNotification) até a próxima chamada de check-alerts ou, com o webhook
+configurado, até o comando `deliver_notifications` (ver
+`notification_delivery`).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .claiming import claim_rows
+from .dashboard import invalidate_dashboard
+from .models import AlertNotification, PriceAlert
+from .price_history import summarize_offers
+
+
+def get_refresh_interval():
+    return getattr(settings, 'ALERT_MATCHING_REFRESH_INTERVAL', 30)
+
+
+class AlertMatchingIndex:
+    """Índice {(origem, destino): [(preço alvo, id), ...]} ordenado por preço."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+            self._by_id = {}
+            self._last_id = 0
+            self._synced_at = None
+
+    def _insert(self, alert_id, route, target_price):
+        self._remove(alert_id)
+        insort(self._routes.setdefault(route, []), (target_price, alert_id))
+        self._by_id[alert_id] = (route, target_price)
+
+    def _remove(self, alert_id):
+        route, target_price = self._by_id.pop(alert_id, (None, None))
+        if route is None:
+            return
+        entries = self._routes[route]
+        position = bisect_left(entries, (target_price, alert_id))
+        if position < len(entries) and entries[position] == (target_price, alert_id):
+            del entries[position]
+        if not entries:
+            del self._routes[route]
+
+    def sync(self, force=False):
+        """Carrega do banco os alertas ativos criados desde a última sincronização."""
+        now = time.monotonic()
+        with self._lock:
+            if (not force and self._synced_at is not None
+                    and now - self._synced_at < get_refresh_interval()):
+                return
+            last_id = self._last_id
+            self._synced_at = now
+
+        rows = PriceAlert.objects.filter(is_active=True, pk__gt=last_id).order_by('pk').values_list(
+            'pk', 'origin_code', 'destination_code', 'target_price')
+
+        with self._lock:
+            for alert_id, origin, destination, target_price in rows.iterator():
+                self._insert(alert_id, (origin, destination), target_price)
+                self._last_id = max(self._last_id, alert_id)
+
+    def update(self, alert):
+        """Reflete no índice o estado de um alerta salvo neste worker."""
+        with self._lock:
+            if self._synced_at is None:
+                return  # Ainda não carregado; a primeira sincronização lê do banco
+            if alert.is_active:
+                self._insert(alert.pk, (alert.origin_code, alert.destination_code),
+                             alert.target_price)
+            else:
+                self._remove(alert.pk)
+
+    def discard(self, alert_ids):
+        with self._lock:
+            for alert_id in alert_ids:
+                self._remove(alert_id)
+
+    def match(self, origin, destination, price):
+        """Ids dos alertas da rota com preço alvo maior ou igual ao preço."""
+        self.sync()
+        with self._lock:
+            entries = self._routes.get((origin, destination))
+            if not entries:
+                return []
+            position = bisect_left(entries, (price,))
+            return [alert_id for _, alert_id in entries[position:]]
+
+    def __len__(self):
+        return len(self._by_id)
+
+
+matching_index = AlertMatchingIndex()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=matching_index.reset)
+
+
+def trigger_matching_alerts(origin, destination, price):
+    """
+    Desativa os alertas da rota satisfeitos pelo preço e enfileira as
+    notificações deles. Retorna as notificações criadas.
+    """
+    if price is None:
+        return []
+
+    alert_ids = matching_index.match(origin, destination, price)
+    if not alert_ids:
+        return []
+
+    # O índice pode estar desatualizado: confirma rota, preço e status no banco
+    notifications = queue_triggered_alerts(PriceAlert.objects.filter(
+        pk__in=alert_ids, origin_code=origin, destination_code=destination), price)
+
+    matching_index.discard(alert_ids)
+    return notifications
+
+
+def queue_triggered_alerts(alerts, price):
+    """
+    Desativa os alertas ativos de `alerts` satisfeitos pelo preço e enfileira
+    as notificações deles. Retorna as notificações criadas.
+    """
+    candidates = list(alerts.filter(is_active=True, target_price__gte=price))
+    return queue_notifications([(alert, price) for alert in candidates])
+
+
+def queue_notifications(triggered, delivered_at=None):
+    """
+    Desativa os alertas disparados (pares (alerta, preço encontrado)) e grava
+    as notificações deles na mesma transação: um alerta desativado sempre tem
+    a sua notificação. Com `delivered_at`, as notificações já são gravadas
+    como entregues (o chamador as devolve na resposta). Retorna as
+    notificações criadas.
+    """
+    if not triggered:
+        return []
+
+    with transaction.atomic():
+        # Reserva: só um worker desativa (e notifica) cada alerta
+        claimed = set(claim_rows(PriceAlert.objects.filter(is_active=True),
+                                 [alert.pk for alert, _ in triggered], is_active=False))
+        notifications = [
+            AlertNotification(
+                alert=alert,
+                user_whatsapp_id=alert.user_whatsapp_id,
+                origin_code=alert.origin_code,
+                destination_code=alert.destination_code,
+                target_price=alert.target_price,
+                found_price=price,
+                delivered_at=delivered_at,
+            )
+            for alert, price in triggered if alert.pk in claimed
+        ]
+        AlertNotification.objects.bulk_create(notifications)
+
+    if notifications:
+        matching_index.discard(notification.alert_id for notification in notifications)
+        invalidate_dashboard()
+    return notifications
+
+
+def match_offers(origin, destination, offers):
+    """Dispara os alertas da rota a partir das ofertas de uma busca."""
+    return trigger_matching_alerts(origin, destination, summarize_offers(offers)[0])
+
+
+def claim_pending_notifications():
+    """
+    Retorna as notificações enfileiradas ainda não entregues, marcando-as
+    como entregues. Cada notificação é reservada por uma única chamada,
+    mesmo com várias verificações simultâneas (ver `claim_rows`).
+    """
+    pending = list(AlertNotification.objects.filter(
+        delivered_at__isnull=True, failed_at__isnull=True).order_by('created_at', 'pk'))
+    if not pending:
+        return []
+
+    claimed = set(claim_rows(AlertNotification.objects.filter(delivered_at__isnull=True),
+                             [notification.pk for notification in pending],
+                             delivered_at=timezone.now()))
+    return [notification.as_notification() for notification in pending
+            if notification.pk in claimed]
@@ -0,0 +1,222 @@
+"""
+Serviço de verificação dos alertas de preço.
+
+Os alertas ativos são agrupados por rota (origem, destino), de forma que
+cada rota é consultada na Amadeus uma única vez por verificação, não
+importa quantos usuários estejam monitorando o mesmo trecho. As rotas são
+consultadas em paralelo, respeitando o limite de taxa da Amadeus.
+
+Para dividir a verificação entre vários workers ou nós, cada um pode
+verificar só uma fração das rotas (`shard`, por hash da rota). Mesmo sem
+divisão, verificações simultâneas não notificam o mesmo alerta duas vezes:
+cada alerta disparado é reservado (desativado) antes de ser notificado.
+
+A notificação de cada alerta desativado é gravada (AlertNotification) na
+mesma transação. Com NOTIFICATION_WEBHOOK_URL configurada, a verificação só
+grava as notificações e o comando `deliver_notifications` as entrega (ver
+`notification_delivery`), tentando de novo até o webhook confirmar. Sem ela,
+as notificações são gravadas já como entregues e voltam na resposta: se a
+resposta se perder (ou o cliente do streaming desconectar), elas ficam só
+no histórico, sem nova entrega.
+"""
+import logging
+import zlib
+from collections import defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .alert_matching import claim_pending_notifications, matching_index, queue_notifications
+from .amadeus_service import is_stale_response
+from .dashboard import invalidate_dashboard
+from .fan_out import iter_concurrent
+from .models import PriceAlert
+from .notification_delivery import webhook_delivery_enabled
+from .price_history import flush_observations, latest_prices, summarize_offers
+
+logger = logging.getLogger(__name__)
+
+def active_alerts_by_route():
+    """
+    Alertas ativos ordenados por rota, lidos pelo índice parcial
+    `pricealert_active_route_idx`.
+    """
+    return PriceAlert.objects.filter(is_active=True).only(
+        'id', 'user_whatsapp_id', 'origin_code', 'destination_code', 'target_price'
+    ).order_by('origin_code', 'destination_code', 'target_price')
+
+
+def route_shard(route, shards):
+    """Fração (0 a shards - 1) da rota, estável entre processos e nós."""
+    return zlib.crc32(f"{route[0]}-{route[1]}".encode()) % shards
+
+
+def group_alerts_by_route(alerts):
+    """Agrupa os alertas em um dicionário {(origem, destino): [alertas]}."""
+    routes = defaultdict(list)
+    for alert in alerts:
+        routes[(alert.origin_code, alert.destination_code)].append(alert)
+    return routes
+
+
+def cheapest_price(amadeus_response):
+    """
+    Retorna o menor preço total da resposta, ou None se não houver ofertas.
+    Uma resposta de fallback (circuito aberto) também retorna None: preços
+    antigos não disparam alertas.
+    """
+    if not amadeus_response or not amadeus_response.data or is_stale_response(amadeus_response):
+        return None
+    return summarize_offers(amadeus_response.data)[0]
+
+
+def create_alerts(alerts_data):
+    """
+    Insere em uma transação os alertas (dados validados pelo
+    PriceAlertSerializer), sem repetir alertas ativos: itens repetidos no
+    lote ou já cadastrados são ignorados. Retorna quantos alertas foram
+    criados. Entre a consulta e o INSERT, um alerta igual criado por outra
+    requisição é descartado pela constraint `pricealert_active_unique`.
+    """
+    unique = {(data['user_whatsapp_id'], data['origin_code'], data['destination_code'],
+               data['target_price']): data for data in alerts_data}
+    existing = set(PriceAlert.objects.filter(
+        is_active=True,
+        user_whatsapp_id__in={key[0] for key in unique},
+        origin_code__in={key[1] for key in unique},
+    ).values_list('user_whatsapp_id', 'origin_code', 'destination_code', 'target_price'))
+
+    alerts = [PriceAlert(**data) for key, data in unique.items() if key not in existing]
+    if alerts:
+        with transaction.atomic():
+            PriceAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+        # bulk_create não dispara os sinais que atualizam o índice de
+        # disparo: os novos alertas são lidos agora, para a próxima busca
+        # deste worker já dispará-los
+        matching_index.sync(force=True)
+        invalidate_dashboard()
+    return len(alerts)
+
+
+def iter_route_prices(routes, search_date, search):
+    """
+    Busca o menor preço de cada rota em paralelo e gera (rota, preço)
+    conforme as buscas terminam.
+
+    No máximo ALERT_CHECK_CONCURRENCY rotas são consultadas ao mesmo tempo;
+    as que vão à Amadeus respeitam o limite de taxa dela (ver
+    `amadeus_service`). Rotas
+    que falham ou passam de ALERT_CHECK_ROUTE_TIMEOUT segundos são puladas,
+    sem segurar o restante do lote.
+    """
+    concurrency = getattr(settings, 'ALERT_CHECK_CONCURRENCY', 8)
+    route_timeout = getattr(settings, 'ALERT_CHECK_ROUTE_TIMEOUT', 15)
+
+    def lookup(route):
+        return cheapest_price(search(route[0], route[1], search_date))
+
+    for route, price, error in iter_concurrent(
+            routes, lookup, concurrency, route_timeout, thread_name_prefix='check-alerts'):
+        if isinstance(error, TimeoutError):
+            logger.warning("Tempo esgotado ao verificar a rota",
+                           extra={'origin': route[0], 'destination': route[1]})
+        elif error is not None:
+            logger.warning("Erro ao verificar a rota", extra={
+                'origin': route[0], 'destination': route[1], 'error': str(error)})
+        else:
+            yield route, price
+
+
+def _iter_triggered_alerts(search_date, search, shard=None):
+    """
+    Consulta as rotas dos alertas ativos (só as da fração `shard`, uma tupla
+    (índice, total), se informada) e gera, por rota, a lista de alertas
+    disparados e o preço encontrado.
+    """
+    active_alerts = active_alerts_by_route()
+
+    alerts_by_route = group_alerts_by_route(active_alerts)
+    if shard is not None:
+        index, shards = shard
+        alerts_by_route = {route: alerts for route, alerts in alerts_by_route.items()
+                           if route_shard(route, shards) == index}
+
+    # Rotas com uma observação recente (de uma busca de usuário ou de uma
+    # verificação anterior) são avaliadas sem consultar a Amadeus de novo
+    observed = latest_prices(search_date)
+    fresh_prices = [(route, observed[route]) for route in alerts_by_route if route in observed]
+    stale_routes = [route for route in alerts_by_route if route not in observed]
+
+    for route, price in chain(
+            fresh_prices, iter_route_prices(stale_routes, search_date, search)):
+        alerts = alerts_by_route.pop(route)
+        if price is None:
+            continue  # Nenhum voo encontrado para a rota
+
+        triggered = [alert for alert in alerts if price <= alert.target_price]
+        if triggered:
+            yield triggered, price
+
+
+def _queue(triggered):
+    """
+    Grava as notificações dos alertas disparados e retorna as que devem ir
+    na resposta: nenhuma se o webhook as entrega.
+    """
+    if webhook_delivery_enabled():
+        queue_notifications(triggered)
+        return []
+    return [notification.as_notification()
+            for notification in queue_notifications(triggered, delivered_at=timezone.now())]
+
+
+def _claim_pending():
+    # Com o webhook, as notificações da fila são do `deliver_notifications`
+    return [] if webhook_delivery_enabled() else claim_pending_notifications()
+
+
+def check_active_alerts(search_date, search, shard=None):
+    """
+    Verifica todos os alertas ativos e retorna as notificações a enviar.
+
+    `search` é a função de busca (origem, destino, data) -> resposta da Amadeus.
+    Ela é chamada uma vez por rota distinta (em paralelo, ver
+    `iter_route_prices`); o menor preço encontrado é comparado com todos os
+    alertas daquela rota, e os alertas disparados são desativados de uma só
+    vez ao final. As notificações enfileiradas pelas buscas dos usuários
+    (ver `alert_matching`) vêm primeiro.
+
+    Só são notificados os alertas que esta chamada desativou: com várias
+    verificações simultâneas, cada alerta é notificado uma única vez.
+    """
+    notifications = _claim_pending()
+    triggered = []
+
+    for alerts, price in _iter_triggered_alerts(search_date, search, shard):
+        triggered.extend((alert, price) for alert in alerts)
+
+    # Desativa os alertas disparados para não notificar de novo
+    notifications.extend(_queue(triggered))
+    flush_observations()
+
+    return notifications
+
+
+def stream_active_alerts(search_date, search, shard=None):
+    """
+    Versão em streaming de `check_active_alerts`: gera cada notificação assim
+    que a rota dela é avaliada, sem acumular a lista inteira em memória.
+
+    Os alertas de uma rota são desativados logo antes das notificações dela
+    serem geradas. Se o cliente desconectar no meio, as rotas já enviadas
+    ficam desativadas e as demais continuam ativas para a próxima
+    verificação.
+    """
+    try:
+        yield from _claim_pending()
+        for alerts, price in _iter_triggered_alerts(search_date, search, shard):
+            yield from _queue([(alert, price) for alert in alerts])
+    finally:
+        flush_observations()
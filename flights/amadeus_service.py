@@ -1,79 +1,489 @@
+"""
+Busca de ofertas na Amadeus (SDK síncrono e cliente assíncrono) ou no mock.
+
+O SDK da Amadeus, o requests e o httpx só são importados quando o primeiro
+cliente é criado: comandos e workers que não chegam a consultar a Amadeus
+(ou que usam o mock) sobem sem esse custo. Sob o gunicorn eles são
+carregados no master antes do fork (ver `flights.warmup`).
+"""
 import os
-import json
-from dotenv import load_dotenv
-from amadeus import Client, ResponseError
-from unittest.mock import MagicMock
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from urllib.error import URLError
+from urllib.parse import urlparse
+from asgiref.sync import sync_to_async
+from . import metrics, offer_cache, price_history
+from .circuit_breaker import CircuitOpenError, get_amadeus_breaker
+from .mock_store import (
+    DEFAULT_INDEX_PATH, DEFAULT_JSON_PATH, MockFlightStore, make_route_key)
+from .throttling import get_amadeus_rate_limiter
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 AMADEUS_API_KEY = os.getenv('AMADEUS_API_KEY')
 AMADEUS_API_SECRET = os.getenv('AMADEUS_API_SECRET')
 AMADEUS_HOSTNAME = os.getenv('AMADEUS_HOSTNAME', 'test')
 
+# URL base alternativa (ex: http://127.0.0.1:8765 para um servidor falso)
+AMADEUS_BASE_URL = os.getenv('AMADEUS_BASE_URL')
+
 USE_MOCK_AMADEUS = os.getenv('USE_MOCK_AMADEUS') == 'True'
 
-print(f"--- CONECTANDO AO AMADEUS EM AMBIENTE: {AMADEUS_HOSTNAME.upper()} ---")
+# Grava as respostas reais no índice do mock para reproduzi-las offline
+RECORD_AMADEUS = os.getenv('RECORD_AMADEUS') == 'True'
 
-def _get_mock_flights(origin, destination, date):
-    """Função interna para carregar e retornar dados do nosso arquivo mockado (JSON)."""
-    print("--- USANDO DADOS MOCKADOS (OFFLINE) ---")
-    try:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        mock_file_path = os.path.join(base_dir, 'mock_flight_data.json')
+# Timeout (segundos) das chamadas HTTP e tamanho do pool de conexões por host
+AMADEUS_TIMEOUT = float(os.getenv('AMADEUS_TIMEOUT', '10'))
+AMADEUS_POOL_SIZE = int(os.getenv('AMADEUS_POOL_SIZE', '10'))
+
+
+class _PooledHTTPResponse:
+    """Adapta um requests.Response à interface de resposta que o SDK lê."""
+
+    def __init__(self, response):
+        self.code = response.status_code
+        self._response = response
+
+    def info(self):
+        return self._response.headers
+
+    def read(self):
+        return self._response.content
+
+
+class PooledHTTP:
+    """
+    Transporte HTTP do SDK com conexões keep-alive reaproveitadas.
+
+    O SDK chama `http(urllib.request.Request)` e por padrão usa urlopen,
+    que abre uma nova conexão TLS a cada requisição.
+    """
+
+    def __init__(self, pool_size=AMADEUS_POOL_SIZE, timeout=AMADEUS_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._request_exception = requests.RequestException
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def __call__(self, http_request):
+        try:
+            response = self.session.request(
+                http_request.get_method(),
+                http_request.full_url,
+                data=http_request.data,
+                headers=dict(http_request.header_items()),
+                timeout=self.timeout
+            )
+        except self._request_exception as e:
+            # O SDK converte URLError em NetworkError
+            raise URLError(e)
+        return _PooledHTTPResponse(response)
+
+    def close(self):
+        self.session.close()
+
+
+@functools.cache
+def _thread_safe_access_token_class():
+    """Classe do token definida sob demanda, junto com a importação do SDK."""
+    from amadeus.client.access_token import AccessToken
+
+    class _ThreadSafeAccessToken(AccessToken):
+        """Evita que várias threads renovem o token ao mesmo tempo."""
+
+        def __init__(self, client):
+            super().__init__(client)
+            self._lock = threading.Lock()
+
+        def _bearer_token(self):
+            with self._lock:
+                return super()._bearer_token()
+
+    return _ThreadSafeAccessToken
+
+
+class AmadeusClientManager:
+    """
+    Mantém um único amadeus.Client por processo.
+
+    O cliente é criado sob demanda na primeira busca e reaproveitado pelas
+    seguintes, junto com o token OAuth (renovado só quando expira) e o pool
+    de conexões HTTP. Após um fork (workers do gunicorn) o processo filho
+    descarta o cliente herdado e cria o seu próprio.
+    """
+
+    def __init__(self, **options):
+        self._options = options
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    def configure(self, **options):
+        """Troca as opções do cliente (ex: host de um servidor falso nos testes)."""
+        with self._lock:
+            self._options = options
+            self._close_client()
+
+    def get_client(self):
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._build_client()
+                self._pid = os.getpid()
+            return self._client
+
+    def reset(self):
+        """Descarta o cliente atual; usado no processo filho após o fork."""
+        # A trava herdada pode ter sido copiada travada por outra thread do pai
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    def _client_options(self):
+        options = {
+            'client_id': AMADEUS_API_KEY,
+            'client_secret': AMADEUS_API_SECRET,
+            'hostname': AMADEUS_HOSTNAME,
+        }
+        if AMADEUS_BASE_URL:
+            url = urlparse(AMADEUS_BASE_URL)
+            options.update({
+                'host': url.hostname,
+                'ssl': url.scheme == 'https',
+                'port': url.port or (443 if url.scheme == 'https' else 80),
+            })
+        return {**options, **self._options}
+
+    def connection_settings(self):
+        """Credenciais e URL base usadas pelo cliente assíncrono."""
+        options = self._client_options()
+        ssl = options.get('ssl', True)
+        if not options.get('host'):
+            from amadeus import Client
+
+            options['host'] = Client.HOSTS[options['hostname']]
+        host = options['host']
+        port = options.get('port', 443 if ssl else 80)
+        scheme = 'https' if ssl else 'http'
+        return {
+            'client_id': options['client_id'],
+            'client_secret': options['client_secret'],
+            'base_url': f"{scheme}://{host}:{port}",
+        }
+
+    def _build_client(self):
+        from amadeus import Client
+
+        options = self._client_options()
+        options.setdefault('http', PooledHTTP())
+
+        client = Client(**options)
+        client.access_token = _thread_safe_access_token_class()(client)
+        logger.info("Cliente da Amadeus criado", extra={'environment': options.get('hostname')})
+        return client
+
+    def _close_client(self):
+        if self._client is not None and isinstance(self._client.http, PooledHTTP):
+            self._client.http.close()
+        self._client = None
+        self._pid = None
+
+
+# Parâmetros fixos enviados em toda busca (também fazem parte da chave do cache)
+DEFAULT_SEARCH_PARAMS = {
+    'adults': 1,
+    'max': 5
+}
+
+
+class UpstreamError(Exception):
+    """Erro retornado pela Amadeus no caminho assíncrono."""
+
+    def __init__(self, status_code, result):
+        super().__init__(f"[{status_code}]")
+        self.status_code = status_code
+        self.result = result
+
+
+def upstream_errors():
+    """
+    Exceções que indicam falha da Amadeus, para usar em `except`: erros do
+    SDK, do cliente assíncrono e do circuito aberto. Uma exceção do SDK ou
+    do httpx só existe se o módulo já foi importado, então eles não são
+    importados aqui só para comparar.
+    """
+    errors = [UpstreamError, CircuitOpenError]
+    if 'amadeus' in sys.modules:
+        errors.append(sys.modules['amadeus'].ResponseError)
+    if 'httpx' in sys.modules:
+        errors.append(sys.modules['httpx'].HTTPError)
+    return tuple(errors)
+
+
+class FlightOffersResponse:
+    """
+    Resposta enxuta com os mesmos atributos do SDK usados pelas views.
 
-        # Abre o arquivo de dados fictícios
-        with open(mock_file_path, 'r') as f:
-            all_mock_data = json.load(f)
+    `stale` indica o último resultado conhecido da rota, servido no lugar de
+    um erro enquanto o circuito da Amadeus está aberto; `fetched_at` é o
+    momento (timestamp) em que ele foi buscado.
+    """
+    __slots__ = ('data', 'dictionaries', 'stale', 'fetched_at')
+
+    def __init__(self, data, dictionaries=None, stale=False, fetched_at=None):
+        self.data = data
+        self.dictionaries = dictionaries or {}
+        self.stale = stale
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def from_cache_entry(cls, entry):
+        return cls(entry['data'], entry['dictionaries'],
+                   stale=entry.get('stale', False), fetched_at=entry.get('fetched_at'))
+
+
+def is_stale_response(response):
+    """Indica uma resposta servida do fallback, que não deve disparar alertas."""
+    return getattr(response, 'stale', False) is True
+
+
+def stale_details(response):
+    """Campos que marcam uma resposta de fallback no JSON da API."""
+    if not is_stale_response(response):
+        return {}
+    fetched_at = datetime.fromtimestamp(response.fetched_at, tz=timezone.utc)
+    return {'stale': True, 'fetched_at': fetched_at.isoformat()}
 
-        # Cria uma chave de rota para procurar no JSON (ex: "MAD-BCN-2025-11-20")
-        route_key = f"{origin}-{destination}-{date}"
 
-        route_data = all_mock_data.get(route_key)
+amadeus_client = AmadeusClientManager()
 
-        if not route_data:
-            print(f"Rota {route_key} não encontrada no arquivo mock.")
-            return None
+mock_store = MockFlightStore(
+    json_path=os.getenv('MOCK_FLIGHT_DATA', DEFAULT_JSON_PATH),
+    index_path=os.getenv('MOCK_FLIGHT_INDEX', DEFAULT_INDEX_PATH)
+)
 
-        # objeto mock que se parece com a resposta real do SDK
-        mock_sdk_response = MagicMock()
-        mock_sdk_response.data = route_data.get('data', [])
-        mock_sdk_response.dictionaries = route_data.get('dictionaries', {})
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=amadeus_client.reset)
+    os.register_at_fork(after_in_child=mock_store.reset)
 
-        return mock_sdk_response
 
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Erro ao ler o arquivo de mock: {e}")
+def _get_mock_flights(origin, destination, date):
+    """Função interna para retornar os dados do nosso índice de voos mockados."""
+    route_data = mock_store.get(origin, destination, date)
+
+    if not route_data:
+        logger.info("Rota não encontrada no mock",
+                    extra={'route': make_route_key(origin, destination, date)})
         return None
 
+    return FlightOffersResponse(
+        route_data.get('data', []), route_data.get('dictionaries', {}))
 
-def search_flights_from_amadeus(origin, destination, date):
+
+def _fetch_flight_offers(origin, destination, date, params):
     """
-    Busca voos na Amadeus usando um token de acesso.
+    Consulta a Amadeus (ou o mock) e retorna uma tupla (data, dictionaries).
     """
     if USE_MOCK_AMADEUS:
-        return _get_mock_flights(origin, destination, date)
+        response = _get_mock_flights(origin, destination, date)
     else:
+        from amadeus import ResponseError
+
         try:
-            amadeus = Client(
-                client_id=AMADEUS_API_KEY,
-                client_secret=AMADEUS_API_SECRET,
-                hostname=AMADEUS_HOSTNAME
-            )
-            
-            print(f"Buscando voos: {origin}->{destination} em {date}")
-            params = {
-                'originLocationCode': origin,
-                'destinationLocationCode': destination,
-                'departureDate': date,
-                'adults': 1,
-                'max': 5
-            }
-
-            response = amadeus.shopping.flight_offers_search.get(**params)
-            print("response: ", response)
-            return response
+            amadeus = amadeus_client.get_client()
+
+            logger.debug("Buscando voos", extra={
+                'origin': origin, 'destination': destination, 'travel_date': date})
+
+            def search():
+                with metrics.timed('amadeus_request_duration_seconds', 'amadeus_requests_total',
+                                   operation='flight_offers'):
+                    return amadeus.shopping.flight_offers_search.get(
+                        originLocationCode=origin,
+                        destinationLocationCode=destination,
+                        departureDate=date,
+                        **params
+                    )
+
+            # Só as chamadas que vão de fato à Amadeus gastam a cota (as
+            # atendidas pelo cache não passam por aqui). A espera fica fora
+            # do circuit breaker para não contar como chamada lenta.
+            get_amadeus_rate_limiter().acquire()
+            # Com o circuito aberto falha na hora, sem esperar a Amadeus
+            response = get_amadeus_breaker().call(search)
 
         except ResponseError as error:
-            print(f"Erro ao chamar a API da Amadeus com o SDK: {error}")
-            print(error.response.result)
+            logger.warning("Erro ao chamar a API da Amadeus com o SDK", extra={
+                'error': str(error), 'result': getattr(error.response, 'result', None)})
             raise error
+
+    if response is None:
+        return [], {}
+
+    # O SDK expõe os dicionários apenas dentro de `result`
+    dictionaries = getattr(response, 'dictionaries', None)
+    if dictionaries is None:
+        dictionaries = (getattr(response, 'result', None) or {}).get('dictionaries', {})
+    data = response.data or []
+
+    if RECORD_AMADEUS and not USE_MOCK_AMADEUS:
+        mock_store.record(origin, destination, date, data, dictionaries)
+
+    price_history.record_observation(origin, destination, date, data)
+    return data, dictionaries
+
+
+def search_flights_from_amadeus(origin, destination, date, **search_params):
+    """
+    Busca voos na Amadeus, passando pelo cache compartilhado de ofertas.
+    """
+    params = {**DEFAULT_SEARCH_PARAMS, **search_params}
+    key = offer_cache.make_key(origin, destination, date, params)
+
+    entry = offer_cache.get_or_fetch(
+        key, lambda: _fetch_flight_offers(origin, destination, date, params))
+    return FlightOffersResponse.from_cache_entry(entry)
+
+
+def _json_or_text(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {'body': response.text}
+
+
+class AsyncAmadeusClient:
+    """
+    Cliente assíncrono (httpx) para a busca de ofertas.
+
+    Não segura uma thread enquanto espera a Amadeus. O token OAuth é
+    compartilhado entre as requisições e renovado sob um asyncio.Lock. Um
+    httpx.AsyncClient fica preso ao event loop em que foi criado, então há
+    um por loop (sob ASGI o loop é único por worker).
+    """
+    # Segundos antes da expiração em que o token já é renovado
+    TOKEN_BUFFER = 10
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._clients = weakref.WeakKeyDictionary()
+        self._token = None
+        self._token_expires_at = 0
+        self._token_locks = weakref.WeakKeyDictionary()
+
+    def _http_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            import httpx
+
+            client = httpx.AsyncClient(
+                base_url=self._manager.connection_settings()['base_url'],
+                timeout=AMADEUS_TIMEOUT,
+                limits=httpx.Limits(max_keepalive_connections=AMADEUS_POOL_SIZE)
+            )
+            self._clients[loop] = client
+            self._token_locks[loop] = asyncio.Lock()
+        return client
+
+    async def _bearer_token(self, client):
+        loop = asyncio.get_running_loop()
+        async with self._token_locks[loop]:
+            if self._token is None or time.monotonic() + self.TOKEN_BUFFER >= self._token_expires_at:
+                settings = self._manager.connection_settings()
+                response = await client.post('/v1/security/oauth2/token', data={
+                    'grant_type': 'client_credentials',
+                    'client_id': settings['client_id'],
+                    'client_secret': settings['client_secret'],
+                })
+                result = _json_or_text(response)
+                if response.status_code != 200:
+                    raise UpstreamError(response.status_code, result)
+                self._token = result['access_token']
+                self._token_expires_at = time.monotonic() + result.get('expires_in', 0)
+            return self._token
+
+    async def search_flight_offers(self, **params):
+        """Retorna o JSON da busca de ofertas ({'data', 'dictionaries'})."""
+        client = self._http_client()
+        token = await self._bearer_token(client)
+        response = await client.get(
+            '/v2/shopping/flight-offers', params=params,
+            headers={'Authorization': f'Bearer {token}'})
+        result = _json_or_text(response)
+        if response.status_code != 200:
+            raise UpstreamError(response.status_code, result)
+        return result
+
+    def reset(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._token_locks = weakref.WeakKeyDictionary()
+        self._token = None
+        self._token_expires_at = 0
+
+
+async_amadeus_client = AsyncAmadeusClient(amadeus_client)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=async_amadeus_client.reset)
+
+
+async def _afetch_flight_offers(origin, destination, date, params):
+    """Versão assíncrona de `_fetch_flight_offers`."""
+    if USE_MOCK_AMADEUS:
+        response = await sync_to_async(
+            _get_mock_flights, thread_sensitive=False)(origin, destination, date)
+        data, dictionaries = (response.data, response.dictionaries) if response else ([], {})
+        price_history.record_observation(origin, destination, date, data)
+        return data, dictionaries
+
+    async def search():
+        with metrics.timed('amadeus_request_duration_seconds', 'amadeus_requests_total',
+                           operation='flight_offers'):
+            return await async_amadeus_client.search_flight_offers(
+                originLocationCode=origin,
+                destinationLocationCode=destination,
+                departureDate=date,
+                **params
+            )
+
+    await get_amadeus_rate_limiter().aacquire()
+    result = await get_amadeus_breaker().acall(search)
+    data = result.get('data') or []
+    dictionaries = result.get('dictionaries', {})
+
+    if RECORD_AMADEUS:
+        await sync_to_async(mock_store.record, thread_sensitive=False)(
+            origin, destination, date, data, dictionaries)
+
+    price_history.record_observation(origin, destination, date, data)
+    return data, dictionaries
+
+
+async def async_search_flights_from_amadeus(origin, destination, date, **search_params):
+    """
+    Versão assíncrona de `search_flights_from_amadeus`, para views sob ASGI.
+    """
+    params = {**DEFAULT_SEARCH_PARAMS, **search_params}
+    key = offer_cache.make_key(origin, destination, date, params)
+
+    entry = await offer_cache.aget_or_fetch(
+        key,
+        lambda: _afetch_flight_offers(origin, destination, date, params),
+        lambda: _fetch_flight_offers(origin, destination, date, params)
+    )
+    return FlightOffersResponse.from_cache_entry(entry)
@@ -0,0 +1,191 @@
+"""
+Circuit breaker das chamadas à Amadeus.
+
+Enquanto a Amadeus responde bem o circuito fica fechado. Se, dentro da
+janela de AMADEUS_BREAKER_WINDOW segundos, a taxa de erros ou de chamadas
+lentas passar do limite, o circuito abre: as chamadas falham na hora com
+CircuitOpenError, sem esperar o timeout nem gastar cota. Depois de
+AMADEUS_BREAKER_OPEN_SECONDS segundos uma única chamada de teste
+(meio-aberto) é liberada; se ela der certo o circuito fecha, senão abre de
+novo. O estado é por processo.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """O circuito está aberto e a chamada não foi feita."""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, slow_call_rate=0.5, slow_call_duration=5,
+                 min_calls=10, window=60, open_duration=30, is_failure=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_duration = slow_call_duration
+        self.min_calls = min_calls
+        self.window = window
+        self.open_duration = open_duration
+        self.is_failure = is_failure or (lambda error: True)
+        self.reset()
+
+    def reset(self):
+        # Trava nova: no filho de um fork a antiga pode ter ficado presa
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._calls = deque()  # (momento, falhou, lenta)
+        self._opened_at = None
+        self._probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.open_duration:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.times_opened += 1
+        logger.warning("Circuito aberto",
+                       extra={'circuit': self.name, 'open_seconds': self.open_duration})
+
+    def _before_call(self):
+        """Retorna True se a chamada é o teste do circuito meio-aberto."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+                raise CircuitOpenError(f"Circuito {self.name} aberto: chamada não realizada.")
+            if state == self.HALF_OPEN:
+                self._probing = True
+                return True
+            return False
+
+    def _release_probe(self, probe):
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def _after_call(self, probe, duration, failed):
+        now = time.monotonic()
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            if probe:
+                self._probing = False
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._state = self.CLOSED
+                    logger.info("Circuito fechado", extra={'circuit': self.name})
+                return
+
+            if self._state != self.CLOSED:
+                return  # Outra chamada já abriu o circuito
+
+            calls = self._calls
+            calls.append((now, failed, slow))
+            while calls and now - calls[0][0] > self.window:
+                calls.popleft()
+            if len(calls) < self.min_calls:
+                return
+
+            failures = sum(1 for _, call_failed, _ in calls if call_failed)
+            slow_calls = sum(1 for _, _, call_slow in calls if call_slow)
+            if (failures / len(calls) >= self.failure_rate
+                    or slow_calls / len(calls) >= self.slow_call_rate):
+                self._open(now)
+
+    def call(self, fn):
+        """Executa `fn()` se o circuito permitir, registrando o resultado."""
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            self._after_call(probe, time.monotonic() - started, self.is_failure(e))
+            raise
+        except BaseException:
+            # Cancelada antes do resultado: só libera o teste do meio-aberto
+            self._release_probe(probe)
+            raise
+        self._after_call(probe, time.monotonic() - started, False)
+        return result
+
+    async def acall(self, afn):
+        """Versão para corrotinas de `call`; `afn()` retorna um awaitable."""
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            result = await afn()
+        except Exception as e:
+            self._after_call(probe, time.monotonic() - started, self.is_failure(e))
+            raise
+        except BaseException:
+            # Cancelada antes do resultado: só libera o teste do meio-aberto
+            self._release_probe(probe)
+            raise
+        self._after_call(probe, time.monotonic() - started, False)
+        return result
+
+
+def is_upstream_failure(error):
+    """
+    Erros que indicam problema na Amadeus: falhas de rede, 429 e 5xx. Erros
+    4xx da requisição (ex: parâmetros inválidos) não contam.
+    """
+    response = getattr(error, 'response', None)
+    status_code = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+    if not status_code:
+        return True
+    return status_code == 429 or status_code >= 500
+
+
+_amadeus_breaker = None
+_amadeus_breaker_lock = threading.Lock()
+
+
+def get_amadeus_breaker():
+    """Circuit breaker compartilhado pelo processo para as chamadas à Amadeus."""
+    global _amadeus_breaker
+    if _amadeus_breaker is None:
+        with _amadeus_breaker_lock:
+            if _amadeus_breaker is None:
+                _amadeus_breaker = CircuitBreaker(
+                    'amadeus',
+                    failure_rate=getattr(settings, 'AMADEUS_BREAKER_FAILURE_RATE', 0.5),
+                    slow_call_rate=getattr(settings, 'AMADEUS_BREAKER_SLOW_CALL_RATE', 0.5),
+                    slow_call_duration=getattr(settings, 'AMADEUS_BREAKER_SLOW_CALL_SECONDS', 5),
+                    min_calls=getattr(settings, 'AMADEUS_BREAKER_MIN_CALLS', 10),
+                    window=getattr(settings, 'AMADEUS_BREAKER_WINDOW', 60),
+                    open_duration=getattr(settings, 'AMADEUS_BREAKER_OPEN_SECONDS', 30),
+                    is_failure=is_upstream_failure,
+                )
+    return _amadeus_breaker
+
+
+def _reset_after_fork():
+    if _amadeus_breaker is not None:
+        _amadeus_breaker.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
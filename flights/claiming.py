@@ -0,0 +1,60 @@
+"""
+Reserva de linhas entre workers.
+
+Vários processos (ou nós) podem verificar alertas ao mesmo tempo; cada
+alerta só pode ser desativado (e notificado) por um deles, e cada rota da
+agenda só pode ser consultada por um deles por vez. A reserva é um UPDATE
+condicional: só as linhas que ainda satisfazem o filtro (ex: is_active=True)
+são alteradas, e quem reservou fica sabendo quais foram.
+
+No PostgreSQL as linhas são travadas com select_for_update(skip_locked=True):
+quem chega depois pula as linhas em uso em vez de esperar. O SQLite não
+trava linhas, mas serializa as escritas; lá a transação pega a trava de
+escrita do banco antes de ler o lote, e a leitura e o UPDATE do lote não
+se misturam com os de outro processo.
+"""
+from django.db import connections, transaction
+
+# Limite de ids por consulta, abaixo do máximo de variáveis do SQLite
+CLAIM_BATCH_SIZE = 500
+
+
+def claim_rows(queryset, ids, **changes):
+    """
+    Aplica `changes` às linhas `ids` que ainda satisfazem o filtro de
+    `queryset` e retorna os ids das linhas alteradas por esta chamada.
+    """
+    ids = list(ids)
+    claimed = []
+    for start in range(0, len(ids), CLAIM_BATCH_SIZE):
+        batch = queryset.filter(pk__in=ids[start:start + CLAIM_BATCH_SIZE])
+        claimed += _claim_batch(batch, changes)
+    return claimed
+
+
+def _claim_batch(queryset, changes):
+    connection = connections[queryset.db]
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.select_for_update(skip_locked=True).values_list('pk', flat=True))
+            if ids:
+                queryset.model._base_manager.using(queryset.db).filter(pk__in=ids).update(**changes)
+        return ids
+
+    if connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        pk_column = connection.ops.quote_name(queryset.model._meta.pk.column)
+        with transaction.atomic(using=queryset.db, savepoint=False):
+            # Um UPDATE que não altera nada só para pegar a trava de escrita:
+            # até o fim da transação nenhum outro processo grava no banco
+            with connection.cursor() as cursor:
+                cursor.execute(f"UPDATE {table} SET {pk_column} = {pk_column} WHERE 0")
+            ids = list(queryset.values_list('pk', flat=True))
+            if ids:
+                queryset.model._base_manager.using(queryset.db).filter(pk__in=ids).update(**changes)
+        return ids
+
+    # Sem SKIP LOCKED: UPDATE condicional linha a linha
+    return [pk for pk in queryset.values_list('pk', flat=True)
+            if queryset.filter(pk=pk).update(**changes)]
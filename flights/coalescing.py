@@ -0,0 +1,78 @@
+"""
+Coalescência de chamadas idênticas simultâneas (single-flight).
+
+A primeira chamada de uma chave executa a função; as que chegam enquanto
+ela está em andamento esperam e recebem o mesmo resultado (ou a mesma
+exceção), sem repetir o trabalho.
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Mapa de chamadas em andamento por chave, entre threads e corrotinas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Futures do asyncio pertencem a um event loop: um mapa por loop
+        self._async_calls = weakref.WeakKeyDictionary()
+
+    def do(self, key, fn):
+        """
+        Executa `fn()` uma única vez para as chamadas simultâneas da chave.
+        Retorna (resultado, compartilhado), onde `compartilhado` indica que o
+        resultado veio da chamada de outra thread.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, afn):
+        """Versão para corrotinas de `do`; `afn()` retorna um awaitable."""
+        calls = self._async_calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            # shield: o cancelamento de quem espera não cancela a chamada líder
+            return await asyncio.shield(future), True
+
+        future = calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await afn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Marca a exceção como lida quando ninguém mais está esperando
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del calls[key]
+
+    def reset(self):
+        with self._lock:
+            self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()
@@ -0,0 +1,104 @@
+"""
+Consultas e cache do dashboard de alertas.
+
+A lista de alertas é paginada por cursor (created_at, id), então cada
+página lê só as próximas linhas do índice `pricealert_active_recent_idx`,
+não importa quantas páginas vieram antes. O resumo por rota é agregado no
+banco. Os fragmentos renderizados ficam no cache com uma versão que muda
+sempre que um alerta é criado ou desativado.
+"""
+import base64
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min, Q
+from django.utils.functional import cached_property
+
+from .models import PriceAlert
+
+VERSION_KEY = 'dashboard:version'
+
+
+def get_page_size():
+    return getattr(settings, 'DASHBOARD_PAGE_SIZE', 50)
+
+
+def get_dashboard_version():
+    """Versão atual dos fragmentos em cache do dashboard."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_KEY, version, timeout=None)
+    return version
+
+
+def invalidate_dashboard():
+    """Descarta os fragmentos em cache trocando a versão do dashboard."""
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def encode_cursor(alert):
+    raw = f"{alert.created_at.isoformat()}|{alert.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Retorna (created_at, id) do cursor, ou None se ele for inválido."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """
+    Página de alertas a partir de um cursor. A consulta só roda quando o
+    template acessa os itens, então um fragmento em cache não toca no banco.
+    """
+
+    def __init__(self, queryset, cursor=None, page_size=None):
+        self.queryset = queryset
+        self.position = decode_cursor(cursor) if cursor else None
+        self.page_size = page_size or get_page_size()
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.position:
+            created_at, pk = self.position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        # Uma linha a mais indica se existe próxima página
+        return queryset[:self.page_size + 1]
+
+    @cached_property
+    def _rows(self):
+        return list(self.get_queryset())
+
+    @property
+    def items(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def next_cursor(self):
+        if len(self._rows) > self.page_size:
+            return encode_cursor(self._rows[self.page_size - 1])
+        return None
+
+
+def route_summary(limit=None):
+    """
+    Resumo das rotas com mais alertas ativos: quantidade, preço alvo mínimo
+    e médio e a data do alerta mais recente, agregados no banco.
+    """
+    limit = limit or getattr(settings, 'DASHBOARD_ROUTE_SUMMARY_LIMIT', 20)
+    return PriceAlert.objects.filter(is_active=True).values(
+        'origin_code', 'destination_code'
+    ).annotate(
+        total=Count('id'),
+        min_target_price=Min('target_price'),
+        avg_target_price=Avg('target_price'),
+        newest_created_at=Max('created_at'),
+    ).order_by('-total', 'origin_code', 'destination_code')[:limit]
@@ -0,0 +1,188 @@
+"""
+Servidor HTTP local que imita os endpoints da Amadeus usados pelo projeto.
+
+Serve o token OAuth e a busca de ofertas com latência, taxa de erros e
+quantidade de ofertas configuráveis, e conta quantos tokens, buscas,
+erros e conexões TCP recebeu. Usado nos testes para medir o
+reaproveitamento do cliente e nos benchmarks, sem depender da API real.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TOKEN_PATH = '/v1/security/oauth2/token'
+FLIGHT_OFFERS_PATH = '/v2/shopping/flight-offers'
+# Contadores do servidor, para quando ele roda em outro processo
+STATS_PATH = '/__stats'
+
+
+def build_offer(origin, destination, date, index):
+    """Monta uma oferta no formato da Amadeus com preço crescente por índice."""
+    return {
+        "type": "flight-offer",
+        "id": str(index + 1),
+        "itineraries": [
+            {
+                "duration": "PT1H30M",
+                "segments": [
+                    {
+                        "departure": {"iataCode": origin, "at": f"{date}T08:00:00"},
+                        "arrival": {"iataCode": destination, "at": f"{date}T09:30:00"},
+                        "carrierCode": "G3",
+                        "number": str(1000 + index)
+                    }
+                ]
+            }
+        ],
+        "price": {"total": f"{300 + index * 10:.2f}"}
+    }
+
+
+class FakeAmadeusHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantém a conexão aberta entre requisições (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em escritas separadas; sem isso o Nagle atrasa a resposta
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.record('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status_code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/vnd.amadeus+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+
+        if urlparse(self.path).path != TOKEN_PATH:
+            self._send_json(404, {"errors": [{"status": 404}]})
+            return
+
+        self.server.record('token_requests')
+        time.sleep(self.server.token_latency)
+        self._send_json(200, {
+            "access_token": "fake-token",
+            "expires_in": self.server.token_expires_in
+        })
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == STATS_PATH:
+            self._send_json(200, self.server.counters)
+            return
+        if url.path != FLIGHT_OFFERS_PATH:
+            self._send_json(404, {"errors": [{"status": 404}]})
+            return
+
+        self.server.record('search_requests')
+        time.sleep(self.server.latency)
+
+        if self.server.should_fail():
+            self.server.record('errors')
+            self._send_json(500, {"errors": [{"status": 500, "title": "INTERNAL ERROR"}]})
+            return
+
+        query = parse_qs(url.query)
+        origin = query.get('originLocationCode', ['GRU'])[0]
+        destination = query.get('destinationLocationCode', ['GIG'])[0]
+        date = query.get('departureDate', ['2025-11-20'])[0]
+
+        self._send_json(200, {
+            "data": [build_offer(origin, destination, date, i)
+                     for i in range(self.server.offers)],
+            "dictionaries": {"carriers": {"G3": "GOL LINHAS AEREAS"}}
+        })
+
+
+class FakeAmadeusServer(ThreadingHTTPServer):
+    """
+    Uso:
+        with FakeAmadeusServer(latency=0.05) as server:
+            amadeus_client.configure(**server.client_options())
+    """
+    daemon_threads = True
+    # Backlog maior para não recusar conexões nos testes de carga
+    request_queue_size = 256
+
+    def __init__(self, latency=0.0, token_latency=0.0, offers=5,
+                 token_expires_in=1799, port=0, error_rate=0.0, seed=None):
+        super().__init__(('127.0.0.1', port), FakeAmadeusHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.offers = offers
+        self.token_expires_in = token_expires_in
+        # Fração das buscas respondidas com erro 500
+        self.error_rate = error_rate
+        self.counters = {'connections': 0, 'token_requests': 0, 'search_requests': 0,
+                         'errors': 0}
+        self._counters_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record(self, counter):
+        with self._counters_lock:
+            self.counters[counter] += 1
+
+    def should_fail(self):
+        with self._counters_lock:
+            return self._random.random() < self.error_rate
+
+    def client_options(self):
+        """Opções do amadeus.Client para apontar para este servidor."""
+        return {
+            'client_id': 'fake-id',
+            'client_secret': 'fake-secret',
+            'host': '127.0.0.1',
+            'port': self.port,
+            'ssl': False,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Servidor falso da Amadeus.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--token-latency', type=float, default=0.0)
+    parser.add_argument('--offers', type=int, default=5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeAmadeusServer(latency=args.latency, token_latency=args.token_latency,
+                               offers=args.offers, port=args.port,
+                               error_rate=args.error_rate, seed=args.seed)
+    print(f"Amadeus falsa em http://127.0.0.1:{server.port}")
+    server.serve_forever()
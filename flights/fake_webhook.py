@@ -0,0 +1,99 @@
+"""
+Receptor local de webhooks, no lugar do n8n, para a entrega das notificações.
+
+Guarda cada lote recebido (corpo e cabeçalhos) e as chaves de idempotência
+já vistas, e pode responder com uma sequência de status (ex: 500, 500, 200)
+para simular falhas. Usado nos testes e para experimentar o comando
+`deliver_notifications` sem um n8n rodando.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeWebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        status_code, headers = self.server.record(body, dict(self.headers))
+
+        payload = json.dumps({'status': status_code}).encode()
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeWebhookServer(ThreadingHTTPServer):
+    """
+    Uso:
+        with FakeWebhookServer(statuses=[500, 200]) as server:
+            settings.NOTIFICATION_WEBHOOK_URL = server.url
+    """
+    daemon_threads = True
+
+    def __init__(self, statuses=(), retry_after=None, port=0):
+        super().__init__(('127.0.0.1', port), FakeWebhookHandler)
+        # Status das próximas respostas, na ordem; depois delas, 200
+        self.statuses = list(statuses)
+        # Valor do cabeçalho Retry-After nas respostas de erro
+        self.retry_after = retry_after
+        self.requests = []
+        self.delivered_keys = set()
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+    def record(self, body, headers):
+        with self._lock:
+            self.requests.append({'body': body, 'headers': headers})
+            status_code = self.statuses.pop(0) if self.statuses else 200
+            if status_code >= 300:
+                return status_code, ({'Retry-After': str(self.retry_after)}
+                                     if self.retry_after is not None else {})
+            # Receptor idempotente: uma notificação repetida não é enviada de novo
+            for item in body.get('notifications', []):
+                if item['idempotency_key'] in self.delivered_keys:
+                    self.duplicates += 1
+                self.delivered_keys.add(item['idempotency_key'])
+            return status_code, {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Receptor local de webhooks.')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    server = FakeWebhookServer(port=args.port)
+    print(f"Webhook falso em {server.url}")
+    server.serve_forever()
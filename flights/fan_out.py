@@ -0,0 +1,70 @@
+"""
+Execução concorrente das consultas à Amadeus.
+
+Usado pela verificação de alertas (uma consulta por rota), pelo calendário
+de preços (uma por dia) e pela busca em lote (uma por consulta distinta).
+O limite de taxa da Amadeus não é aplicado aqui, e sim na chamada à Amadeus
+(ver `amadeus_service`): consultas atendidas pelo cache não gastam a cota.
+"""
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .price_history import observation_buffer
+
+# Intervalo máximo entre verificações de timeout das chamadas em andamento
+TIMEOUT_POLL_INTERVAL = 0.1
+
+
+def iter_concurrent(items, call, concurrency, timeout, thread_name_prefix='fan-out'):
+    """
+    Executa `call(item)` para cada item em paralelo e gera
+    (item, resultado, erro) conforme as chamadas terminam.
+
+    No máximo `concurrency` chamadas rodam ao mesmo tempo. Uma chamada que levanta exceção
+    gera a exceção como erro; uma que passa de `timeout` segundos gera um
+    TimeoutError e é abandonada, sem segurar as demais.
+
+    As chamadas rodam com o contexto (contextvars) de quem chamou: as
+    observações de preço delas vão para o buffer da requisição, gravado
+    por ela (ver `price_history`).
+    """
+    # Cria o buffer antes de copiar o contexto, para as cópias o compartilharem
+    observation_buffer()
+    started_at = {}
+
+    def run(item):
+        # O timeout conta a partir do início da chamada, não da espera na fila
+        started_at[item] = time.monotonic()
+        return call(item)
+
+    executor = ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix=thread_name_prefix)
+    try:
+        # Uma cópia do contexto por chamada: um contexto não pode estar ativo
+        # em duas threads ao mesmo tempo
+        pending = {executor.submit(contextvars.copy_context().run, run, item): item
+                   for item in items}
+
+        while pending:
+            done, _ = wait(pending, timeout=TIMEOUT_POLL_INTERVAL,
+                           return_when=FIRST_COMPLETED)
+
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield item, None, e
+                else:
+                    yield item, result, None
+
+            now = time.monotonic()
+            for future, item in list(pending.items()):
+                start = started_at.get(item)
+                if start is not None and now - start > timeout:
+                    del pending[future]
+                    yield item, None, TimeoutError(f"Tempo esgotado após {timeout}s")
+    finally:
+        # Não espera pelas chamadas que estouraram o timeout
+        executor.shutdown(wait=False, cancel_futures=True)
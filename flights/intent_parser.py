@@ -0,0 +1,315 @@
+"""
+Interpretação das mensagens dos usuários: intenção e entidades (origem,
+destino, data da viagem e preço alvo).
+
+As frases mais comuns ("passagem de Fortaleza para GRU amanhã", "me avise
+quando FOR-GRU ficar abaixo de R$ 500", "dia 20/11") são resolvidas por
+regras locais, sem chamada externa. Só as mensagens que as regras não
+resolvem por completo vão para o modelo da OpenAI, e a resposta fica em
+cache pelo texto normalizado da mensagem e pela data do dia (o sentido de
+"amanhã" muda de um dia para o outro).
+"""
+import hashlib
+import json
+import logging
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .airports import airport_index, fold
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FLIGHT = 'search_flight'
+CREATE_ALERT = 'create_alert'
+CHECK_ALERTS = 'check_alerts'
+GREETING = 'greeting'
+UNKNOWN = 'unknown'
+
+ENTITY_FIELDS = ('origin', 'destination', 'departure_date', 'target_price')
+
+# Entidades que as regras precisam encontrar para responder sem o modelo
+REQUIRED_ENTITIES = {
+    SEARCH_FLIGHT: ('origin', 'destination', 'departure_date'),
+    CREATE_ALERT: ('origin', 'destination', 'target_price'),
+    CHECK_ALERTS: (),
+    GREETING: (),
+}
+
+# Mensagens maiores que isso não são interpretadas (nem enviadas ao modelo)
+MAX_MESSAGE_LENGTH = 1000
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+    'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
+}
+
+ORIGIN_MARKERS = {'de', 'do', 'da', 'desde', 'saindo', 'partindo', 'origem'}
+DESTINATION_MARKERS = {'para', 'pra', 'pro', 'a', 'ate', 'destino'}
+ARTICLES = {'o', 'os', 'as'}
+
+NUMBER = r'(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)'
+MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+IATA_PATTERN = re.compile(r'\b[a-z]{3}\b')
+RELATIVE_DATE_PATTERN = re.compile(r'\b(depois de amanha|amanha|hoje)\b')
+NUMERIC_DATE_PATTERN = re.compile(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?\b')
+ISO_DATE_PATTERN = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b')
+WRITTEN_DATE_PATTERN = re.compile(
+    r'\b(\d{1,2}) de (' + MONTH_NAMES + r')\b(?: de (\d{4}))?')
+DAY_ONLY_PATTERN = re.compile(r'\bdia (\d{1,2})\b(?!\s*/|\s+de\s)')
+# Datas que as regras não resolvem sem ambiguidade ("próxima sexta")
+VAGUE_DATE_PATTERN = re.compile(
+    r'\b(segunda|terca|quarta|quinta|sexta|sabado|domingo|semana|fim de semana'
+    r'|que vem|proximo mes|feriado|carnaval|reveillon)\b')
+PRICE_PATTERNS = (
+    re.compile(r'r\$\s*' + NUMBER),
+    re.compile(NUMBER + r'\s*reais\b'),
+    re.compile(r'\b(?:abaixo|menos) de\s*' + NUMBER + r'(?![/\d])'),
+)
+
+GREETING_PATTERN = re.compile(
+    r'(oi+|ola|opa|bom dia|boa tarde|boa noite|e ai)'
+    r'([\s,!.]+(tudo bem|tudo bom|td bem))?[\s!.?]*')
+CHECK_ALERTS_PATTERN = re.compile(
+    r'\b(meus alertas|(verific|chec|consult|ver)\w*\s+(os\s+|meus\s+)?alertas)\b')
+CREATE_ALERT_PATTERN = re.compile(
+    r'\b(alerta|avis[ea]|avisar|monitor\w*|quando (baixar|cair|ficar|chegar))')
+
+SYSTEM_PROMPT = (
+    "Você extrai a intenção e as entidades das mensagens enviadas a um assistente de "
+    "passagens aéreas. Responda apenas com um JSON no formato "
+    '{"intent": "search_flight" | "create_alert" | "check_alerts" | "greeting" | "unknown", '
+    '"entities": {"origin": ..., "destination": ..., "departure_date": "AAAA-MM-DD", '
+    '"target_price": número}}. '
+    "Use o código IATA da cidade ou do aeroporto quando souber e null para o que a "
+    "mensagem não informar."
+)
+
+
+class IntentUnavailable(Exception):
+    """O modelo não respondeu ou respondeu fora do formato esperado."""
+
+
+def get_cache_ttl():
+    return getattr(settings, 'INTENT_CACHE_TTL', 86400)
+
+
+def normalize_message(text):
+    """Texto usado na chave do cache: sem acentos, caixa e espaços repetidos."""
+    return ' '.join(fold(text).split()).strip(' .!?')
+
+
+def empty_result(intent):
+    return {'intent': intent, 'entities': dict.fromkeys(ENTITY_FIELDS)}
+
+
+def _role(folded, start):
+    """Origem ou destino, pela palavra que antecede o local na mensagem."""
+    words = re.findall(r'\w+', folded[:start])
+    if words and words[-1] in ARTICLES:
+        words.pop()
+    if not words:
+        return None
+    if words[-1] in DESTINATION_MARKERS:
+        return 'destination'
+    if words[-1] in ORIGIN_MARKERS:
+        return 'origin'
+    return None
+
+
+def find_locations(text, folded):
+    """
+    Locais citados na mensagem, na ordem: [(posição, código IATA)]. Um nome
+    de cidade com aeroportos em cidades diferentes vira None (ambíguo).
+    """
+    index = airport_index()
+    locations = []
+    taken = []
+    for start, end, codes in index.find_in_text(folded):
+        locations.append((start, index.location_code(codes)))
+        taken.append((start, end))
+    # Códigos IATA em maiúsculas ("FOR-GRU"), se conhecidos e fora de um nome
+    for match in IATA_PATTERN.finditer(folded):
+        code = text[match.start():match.end()]
+        inside_name = any(start <= match.start() < end for start, end in taken)
+        if code.isupper() and code in index.by_code and not inside_name:
+            locations.append((match.start(), code))
+    return sorted(locations)
+
+
+def extract_route(text, folded):
+    """(origem, destino) citados na mensagem; None se a rota for ambígua."""
+    locations = find_locations(text, folded)
+    if len(locations) > 2 or any(code is None for _, code in locations):
+        return None
+
+    route = {}
+    unassigned = []
+    for start, code in locations:
+        role = _role(folded, start)
+        if role is None:
+            unassigned.append(code)
+        elif role in route:
+            return None
+        else:
+            route[role] = code
+    for role in ('origin', 'destination'):
+        if role not in route and unassigned:
+            route[role] = unassigned.pop(0)
+    return route.get('origin'), route.get('destination')
+
+
+def _future_date(year, month, day, today):
+    """A data informada; sem ano, a próxima ocorrência a partir de hoje."""
+    try:
+        if year is not None:
+            year = int(year)
+            return date(year + 2000 if year < 100 else year, month, day)
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def extract_dates(folded, today):
+    """Datas citadas na mensagem (None na lista para datas inválidas)."""
+    offsets = {'hoje': 0, 'amanha': 1, 'depois de amanha': 2}
+    dates = [today + timedelta(days=offsets[match.group(1)])
+             for match in RELATIVE_DATE_PATTERN.finditer(folded)]
+    dates += [_future_date(year or None, int(month), int(day), today)
+              for day, month, year in NUMERIC_DATE_PATTERN.findall(folded)]
+    dates += [_future_date(year, int(month), int(day), today)
+              for year, month, day in ISO_DATE_PATTERN.findall(folded)]
+    dates += [_future_date(year or None, MONTHS[month], int(day), today)
+              for day, month, year in WRITTEN_DATE_PATTERN.findall(folded)]
+    for match in DAY_ONLY_PATTERN.finditer(folded):
+        day = int(match.group(1))
+        # Sem mês: este mês, ou o próximo se o dia já passou
+        month, year = (today.month, today.year) if day >= today.day else (
+            (today.month % 12) + 1, today.year + today.month // 12)
+        dates.append(_future_date(year, month, day, today))
+    return dates
+
+
+def parse_price(value):
+    """Preço escrito em reais ("1.250,50", "450,5", "450.50", "500")."""
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    elif not re.search(r'\.\d{1,2}$', value):
+        value = value.replace('.', '')
+    return Decimal(value)
+
+
+def extract_prices(folded):
+    return {parse_price(match.group(1))
+            for pattern in PRICE_PATTERNS for match in pattern.finditer(folded)}
+
+
+def parse_with_rules(text, today):
+    """
+    Interpreta a mensagem com as regras locais. Retorna None quando a
+    mensagem é ambígua ou faltam entidades: nesses casos decide o modelo.
+    """
+    folded = fold(text)
+    if GREETING_PATTERN.fullmatch(folded.strip()):
+        return empty_result(GREETING)
+    if CHECK_ALERTS_PATTERN.search(folded):
+        return empty_result(CHECK_ALERTS)
+
+    route = extract_route(text, folded)
+    dates = set(extract_dates(folded, today))
+    prices = extract_prices(folded)
+    if route is None or None in dates or len(dates) > 1 or len(prices) > 1:
+        return None
+    if VAGUE_DATE_PATTERN.search(folded):
+        return None
+
+    intent = CREATE_ALERT if CREATE_ALERT_PATTERN.search(folded) else SEARCH_FLIGHT
+    departure_date = dates.pop() if dates else None
+    if departure_date is not None and departure_date < today:
+        return None
+    target_price = prices.pop() if prices else None
+
+    result = empty_result(intent)
+    result['entities'].update({
+        'origin': route[0],
+        'destination': route[1],
+        'departure_date': departure_date.isoformat() if departure_date else None,
+        'target_price': float(target_price) if target_price is not None else None,
+    })
+    if not all(result['entities'][field] for field in REQUIRED_ENTITIES[intent]):
+        return None
+    return result
+
+
+@cache
+def get_llm_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=getattr(settings, 'OPENAI_API_KEY', ''),
+                  timeout=getattr(settings, 'INTENT_LLM_TIMEOUT', 10), max_retries=1)
+
+
+def normalize_llm_result(data):
+    """Resposta do modelo no mesmo formato da resposta das regras."""
+    if not isinstance(data, dict):
+        raise ValueError("A resposta do modelo não é um objeto JSON.")
+    intent = data.get('intent')
+    result = empty_result(intent if intent in REQUIRED_ENTITIES else UNKNOWN)
+    entities = data.get('entities')
+    if isinstance(entities, dict):
+        result['entities'].update({field: entities.get(field) for field in ENTITY_FIELDS})
+    return result
+
+
+def parse_with_llm(text, today):
+    from openai import OpenAIError
+
+    try:
+        with metrics.timed('intent_llm_duration_seconds', counter='intent_llm_requests_total'):
+            completion = get_llm_client().chat.completions.create(
+                model=getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'),
+                temperature=0,
+                response_format={'type': 'json_object'},
+                messages=[
+                    {'role': 'system', 'content': f"{SYSTEM_PROMPT} Hoje é {today.isoformat()}."},
+                    {'role': 'user', 'content': text},
+                ],
+            )
+        return normalize_llm_result(json.loads(completion.choices[0].message.content))
+    except (OpenAIError, ValueError, TypeError, IndexError, AttributeError) as e:
+        logger.warning("Falha ao interpretar a mensagem com o modelo",
+                       extra={'error': type(e).__name__})
+        raise IntentUnavailable(str(e)) from e
+
+
+def parse_message(text):
+    """
+    Interpreta a mensagem: regras locais, cache das respostas do modelo e,
+    por último, o modelo. Retorna (resultado, origem da resposta).
+    """
+    today = date.today()
+    result = parse_with_rules(text, today)
+    source = 'rules'
+
+    if result is None:
+        normalized = normalize_message(text)
+        key = 'intent:' + hashlib.sha256(f"{today.isoformat()}:{normalized}".encode()).hexdigest()
+        intent_cache = caches['default']
+        result = intent_cache.get(key)
+        source = 'cache'
+        if result is None:
+            result = parse_with_llm(text, today)
+            intent_cache.set(key, result, get_cache_ttl())
+            source = 'llm'
+
+    metrics.inc('intent_requests_total', {'source': source, 'intent': result['intent']})
+    return result, source
@@ -0,0 +1,29 @@
+"""
+Formatação dos logs em JSON, uma linha por evento.
+
+Os campos passados em `extra` (ex: `logger.warning("...", extra={'route':
+...})`) viram chaves do JSON, para filtrar e agregar os logs sem parsear
+a mensagem.
+"""
+import json
+import logging
+from datetime import datetime, timezone
+
+# Atributos padrão do LogRecord, que não são campos extras do evento
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        event.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str, ensure_ascii=False)
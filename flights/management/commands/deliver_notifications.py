@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from flights.notification_delivery import deliver_pending, webhook_client, webhook_delivery_enabled
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrega as notificações dos alertas em lotes ao webhook configurado "
+        "em NOTIFICATION_WEBHOOK_URL, tentando de novo as que falharem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-seconds', type=float,
+            default=getattr(settings, 'NOTIFICATION_POLL_SECONDS', 5),
+            help="Intervalo entre as leituras da fila.")
+        parser.add_argument('--once', action='store_true', help="Esvazia a fila uma única vez.")
+
+    def handle(self, *args, **options):
+        if not webhook_delivery_enabled():
+            raise CommandError("Configure NOTIFICATION_WEBHOOK_URL para entregar as notificações.")
+
+        with webhook_client() as client:
+            while True:
+                started = time.monotonic()
+                close_old_connections()
+
+                stats = deliver_pending(client)
+                if any(stats.values()) or options['once']:
+                    self.stdout.write(
+                        f"{stats['delivered']} notificações entregues, {stats['retrying']} "
+                        f"para tentar de novo, {stats['failed']} com falha definitiva.")
+
+                if options['once']:
+                    break
+                time.sleep(max(options['poll_seconds'] - (time.monotonic() - started), 0))
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from flights.models import PriceObservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Mantém a tabela de observações de preço limitada: apaga as observações "
+        "mais antigas que --keep-days e reduz as mais antigas que "
+        "--downsample-after-days a uma por rota, data de viagem e dia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days', type=int,
+            default=getattr(settings, 'PRICE_OBSERVATION_RETENTION_DAYS', 90))
+        parser.add_argument(
+            '--downsample-after-days', type=int,
+            default=getattr(settings, 'PRICE_OBSERVATION_DOWNSAMPLE_DAYS', 7))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        deleted, _ = PriceObservation.objects.filter(
+            observed_at__lt=now - timedelta(days=options['keep_days'])).delete()
+        self.stdout.write(f"{deleted} observações antigas removidas.")
+
+        merged = self.downsample(
+            now - timedelta(days=options['downsample_after_days']), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{merged} observações agrupadas em uma por rota/data/dia."))
+
+    def downsample(self, cutoff, batch_size):
+        """
+        Para cada rota/data de viagem/dia com mais de uma observação antes de
+        `cutoff`, mantém só a primeira, com o menor preço do dia.
+        """
+        old = PriceObservation.objects.filter(observed_at__lt=cutoff)
+        groups = old.annotate(day=TruncDate('observed_at')).values(
+            'origin_code', 'destination_code', 'travel_date', 'day'
+        ).annotate(
+            keep_id=Min('id'),
+            total=Count('id'),
+            day_min_price=Min('min_price'),
+            day_max_offers=Max('offer_count'),
+        ).filter(total__gt=1).order_by()
+
+        merged = 0
+        while True:
+            # Grupos já reduzidos saem da consulta, então cada lote é o próximo
+            batch = list(groups[:batch_size])
+            if not batch:
+                return merged
+
+            for group in batch:
+                with transaction.atomic():
+                    PriceObservation.objects.filter(pk=group['keep_id']).update(
+                        min_price=group['day_min_price'],
+                        offer_count=group['day_max_offers'])
+                    removed, _ = old.filter(
+                        origin_code=group['origin_code'],
+                        destination_code=group['destination_code'],
+                        travel_date=group['travel_date'],
+                        observed_at__date=group['day'],
+                    ).exclude(pk=group['keep_id']).delete()
+                merged += removed
@@ -0,0 +1,43 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from flights.amadeus_service import search_flights_from_amadeus
+from flights.scheduler import run_cycle
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica os alertas continuamente, rota a rota, conforme a agenda "
+        "adaptativa de cada rota. As notificações ficam na fila do check-alerts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=int,
+            default=getattr(settings, 'ALERT_SCHEDULER_BUDGET', 50),
+            help="Máximo de rotas verificadas por ciclo.")
+        parser.add_argument(
+            '--cycle-seconds', type=float,
+            default=getattr(settings, 'ALERT_SCHEDULER_CYCLE_SECONDS', 60),
+            help="Intervalo entre os ciclos.")
+        parser.add_argument('--once', action='store_true', help="Executa um único ciclo.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+
+            # Mesma data da verificação do check-alerts
+            search_date = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+            stats = run_cycle(search_date, search_flights_from_amadeus, options['budget'])
+            self.stdout.write(
+                f"{stats['checked']} de {stats['due']} rotas vencidas verificadas "
+                f"({stats['upstream']} na Amadeus), {stats['triggered']} alertas disparados.")
+
+            if options['once']:
+                break
+            time.sleep(max(options['cycle_seconds'] - (time.monotonic() - started), 0))
@@ -0,0 +1,238 @@
+"""
+Métricas da aplicação no formato texto do Prometheus.
+
+Cada processo acumula contadores e histogramas em memória, sem E/S no
+caminho quente. Com METRICS_DIR configurado, cada worker grava a cada
+METRICS_FLUSH_INTERVAL segundos um retrato dos seus valores em um arquivo
+próprio nesse diretório, e o /metrics soma os arquivos de todos os
+workers: vale para qualquer número de workers do gunicorn, sem um
+servidor de métricas à parte (limpe o diretório ao subir o servidor). Sem
+METRICS_DIR, o /metrics mostra só o processo que atendeu a requisição.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Limites (segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+GAUGE = 'gauge'
+
+# Descrição das métricas conhecidas, usada nas linhas HELP do /metrics
+DESCRIPTIONS = {
+    'http_request_duration_seconds': "Duração das requisições HTTP por rota, método e status.",
+    'db_query_duration_seconds': "Duração das consultas ao banco por rota HTTP.",
+    'amadeus_request_duration_seconds': "Duração das chamadas à Amadeus.",
+    'amadeus_requests_total': "Chamadas à Amadeus por resultado (ok ou tipo do erro).",
+    'offers_parse_duration_seconds': "Duração do parse das ofertas da Amadeus.",
+    'flight_cache_lookup_duration_seconds': "Duração das leituras do cache de ofertas.",
+    'flight_cache_lookups_total': "Consultas ao cache de ofertas por resultado.",
+    'flight_cache_hit_ratio': "Fração das consultas ao cache de ofertas atendidas por ele.",
+    'intent_requests_total': "Mensagens interpretadas por origem da resposta (regras, cache ou modelo).",
+    'intent_llm_duration_seconds': "Duração das chamadas ao modelo de interpretação.",
+    'intent_llm_requests_total': "Chamadas ao modelo de interpretação por resultado.",
+    'notification_webhook_duration_seconds': "Duração dos envios de lotes de notificações ao webhook.",
+    'notification_webhook_requests_total': "Envios de lotes ao webhook por resultado (ok ou tipo do erro).",
+    'notifications_delivered_total': "Notificações entregues ao webhook.",
+    'notifications_failed_total': "Notificações descartadas depois do máximo de tentativas.",
+}
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', '')
+
+
+def get_flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+class MetricsRegistry:
+    """Contadores e histogramas do processo, com retrato em arquivo por worker."""
+
+    def __init__(self, worker_id=None):
+        # Sem worker_id, o arquivo é o do pid atual (muda depois do fork)
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Trava nova: no filho de um fork a antiga pode ter ficado presa
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}  # chave -> [contagens por bucket, soma, total]
+        self._flushed_at = time.monotonic()
+
+    def inc(self, name, labels=None, amount=1):
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = _series_key(name, labels)
+        # Bucket com o menor limite maior ou igual ao valor (o último é o +Inf)
+        position = bisect_left(DEFAULT_BUCKETS, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(DEFAULT_BUCKETS) + 1), 0.0, 0]
+            histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, list(buckets), total, count]
+                               for (name, labels), (buckets, total, count)
+                               in self._histograms.items()],
+            }
+
+    def _snapshot_path(self, metrics_dir):
+        return os.path.join(metrics_dir, f"{self.worker_id or os.getpid()}.json")
+
+    def flush(self, force=False):
+        """Grava o retrato do processo em METRICS_DIR, no máximo a cada intervalo."""
+        metrics_dir = get_metrics_dir()
+        now = time.monotonic()
+        if not metrics_dir or (not force and now - self._flushed_at < get_flush_interval()):
+            return
+        self._flushed_at = now
+
+        path = self._snapshot_path(metrics_dir)
+        temporary = f"{path}.tmp"
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            with open(temporary, 'w') as f:
+                json.dump(self.snapshot(), f)
+            # Troca atômica: quem lê nunca vê um arquivo pela metade
+            os.replace(temporary, path)
+        except OSError:
+            pass  # Métricas não podem derrubar a requisição
+
+
+registry = MetricsRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+
+
+def inc(name, labels=None, amount=1):
+    registry.inc(name, labels, amount)
+
+
+def observe(name, value, labels=None):
+    registry.observe(name, value, labels)
+
+
+@contextmanager
+def timed(name, counter=None, **labels):
+    """
+    Mede o bloco (ou a função, como decorador) no histograma `name`. Com
+    `counter`, conta também o resultado: outcome="ok" ou o nome da exceção.
+    """
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        registry.observe(name, time.perf_counter() - started, labels)
+        if counter:
+            registry.inc(counter, {**labels, 'outcome': outcome})
+
+
+def _load_snapshots():
+    """Retratos de todos os workers (ou só o deste processo, sem METRICS_DIR)."""
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir:
+        return [registry.snapshot()]
+
+    registry.flush(force=True)
+    snapshots = []
+    for filename in os.listdir(metrics_dir):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # Worker gravando ou arquivo removido entre o listdir e o open
+    return snapshots
+
+
+def collect():
+    """Soma os retratos: ({(nome, rótulos): valor}, {(nome, rótulos): [buckets, soma, total]})."""
+    counters = {}
+    histograms = {}
+    for snapshot in _load_snapshots():
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def format_family(name, kind, samples):
+    """Linhas HELP/TYPE e amostras [(rótulos, valor)] de uma métrica simples."""
+    lines = [f"# HELP {name} {DESCRIPTIONS.get(name, name)}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_format_labels(sorted(labels.items()))} {value}"
+                 for labels, value in samples)
+    return lines
+
+
+def render():
+    """Métricas de todos os workers no formato texto do Prometheus."""
+    counters, histograms = collect()
+    lines = []
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+        lines.append(f"# TYPE {name} {COUNTER}")
+        for (series_name, labels), value in sorted(counters.items()):
+            if series_name == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, name)}")
+        lines.append(f"# TYPE {name} {HISTOGRAM}")
+        for (series_name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip((*DEFAULT_BUCKETS, '+Inf'), buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels((*labels, ('le', bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    return lines
@@ -0,0 +1,84 @@
+"""
+Medição do tempo de cada requisição.
+
+Registra a duração por rota, método e status, e a duração das consultas ao
+banco feitas pela requisição, nas métricas do /metrics. Requisições mais
+lentas que SLOW_REQUEST_SECONDS geram um log de aviso com os tempos.
+"""
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimer:
+    """execute_wrapper que mede as consultas ao banco da requisição."""
+
+    def __init__(self):
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations.append(time.perf_counter() - started)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    # O padrão da URL, não o caminho, para não abrir uma série por parâmetro
+    return match.route if match else 'unmatched'
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        queries = QueryTimer()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, queries.durations)
+        return response
+
+    async def __acall__(self, request):
+        # Sob ASGI as consultas rodam em outras threads: só a duração total
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started, [])
+        return response
+
+    def _record(self, request, response, duration, query_durations):
+        route = _route(request)
+        metrics.observe('http_request_duration_seconds', duration, {
+            'route': route, 'method': request.method, 'status': response.status_code})
+        for query_duration in query_durations:
+            metrics.observe('db_query_duration_seconds', query_duration, {'route': route})
+        metrics.registry.flush()
+
+        if duration >= getattr(settings, 'SLOW_REQUEST_SECONDS', 1.0):
+            logger.warning("Requisição lenta", extra={
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+                'db_queries': len(query_durations),
+                'db_time_ms': round(sum(query_durations) * 1000, 1),
+            })
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_alter_pricealert_user_whatsapp_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['origin_code', 'destination_code', 'target_price'], name='pricealert_active_route_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='pricealert_active_created_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_pricealert_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pricealert',
+            name='pricealert_active_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='pricealert_active_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_pricealert_recent_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_code', models.CharField(max_length=3)),
+                ('destination_code', models.CharField(max_length=3)),
+                ('travel_date', models.DateField()),
+                ('observed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('offer_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['travel_date', 'origin_code', 'destination_code', '-observed_at'], name='priceobs_route_recent_idx'), models.Index(fields=['observed_at'], name='priceobs_observed_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0005_priceobservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_whatsapp_id', models.CharField(max_length=30)),
+                ('origin_code', models.CharField(max_length=3)),
+                ('destination_code', models.CharField(max_length=3)),
+                ('target_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('found_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='flights.pricealert')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['created_at'], name='alertnotif_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_alertnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_code', models.CharField(max_length=3)),
+                ('destination_code', models.CharField(max_length=3)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('next_check_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('volatility', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_check_at'], name='routeschedule_next_check_idx')],
+                'constraints': [models.UniqueConstraint(fields=('origin_code', 'destination_code'), name='routeschedule_route_unique')],
+            },
+        ),
+    ]
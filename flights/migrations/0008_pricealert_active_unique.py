@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:11
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def deactivate_duplicate_active_alerts(apps, schema_editor):
+    # Mantém ativo o alerta mais antigo de cada grupo repetido; os demais só
+    # são desativados (a constraint vale só para os ativos), sem apagar os
+    # alertas nem as notificações deles
+    PriceAlert = apps.get_model('flights', 'PriceAlert')
+    duplicates = PriceAlert.objects.filter(is_active=True).values(
+        'user_whatsapp_id', 'origin_code', 'destination_code', 'target_price'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep_id = group.pop('keep_id')
+        group.pop('total')
+        PriceAlert.objects.filter(is_active=True, **group).exclude(pk=keep_id).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_routeschedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_duplicate_active_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pricealert',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user_whatsapp_id', 'origin_code', 'destination_code', 'target_price'), name='pricealert_active_unique'),
+        ),
+    ]
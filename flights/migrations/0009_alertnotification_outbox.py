@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:30
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def generate_idempotency_keys(apps, schema_editor):
+    # Um default chamável na AddField daria a mesma chave a todas as linhas
+    AlertNotification = apps.get_model('flights', 'AlertNotification')
+    for notification in AlertNotification.objects.filter(idempotency_key__isnull=True):
+        notification.idempotency_key = uuid.uuid4()
+        notification.save(update_fields=['idempotency_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0008_pricealert_active_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertnotification',
+            name='idempotency_key',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(generate_idempotency_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='alertnotification',
+            name='idempotency_key',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        migrations.AddField(
+            model_name='alertnotification',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alertnotification',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='alertnotification',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='alertnotification',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='alertnotification',
+            index=models.Index(condition=models.Q(('delivered_at__isnull', True), ('failed_at__isnull', True)), fields=['next_attempt_at'], name='alertnotif_due_idx'),
+        ),
+    ]
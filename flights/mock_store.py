@@ -0,0 +1,133 @@
+"""
+Armazenamento dos voos mockados usados no modo offline.
+
+O `mock_flight_data.json` é convertido uma única vez em um índice SQLite em
+disco (uma linha por rota "ORIGEM-DESTINO-DATA"), então cada busca lê só a
+rota pedida em vez de carregar o arquivo inteiro. O índice é reconstruído
+quando o mtime do JSON muda e pode receber respostas reais da Amadeus no
+modo de gravação, para reproduzir tráfego de produção offline.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_JSON_PATH = os.path.join(BASE_DIR, 'mock_flight_data.json')
+DEFAULT_INDEX_PATH = os.path.join(BASE_DIR, 'mock_flight_data.sqlite3')
+
+SOURCE_FILE = 'file'
+SOURCE_RECORDED = 'recorded'
+
+# Linhas inseridas por transação ao construir o índice
+INSERT_BATCH_SIZE = 10000
+
+
+def make_route_key(origin, destination, date):
+    """Chave da rota no formato do JSON (ex: "MAD-BCN-2025-11-20")."""
+    return f"{origin}-{destination}-{date}"
+
+
+class MockFlightStore:
+    def __init__(self, json_path=DEFAULT_JSON_PATH, index_path=DEFAULT_INDEX_PATH):
+        self.json_path = json_path
+        self.index_path = index_path
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+        self._indexed_mtime = None
+
+    def _connection(self):
+        # sqlite3 não compartilha conexões entre threads; cada uma abre a sua
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS routes ('
+                ' route_key TEXT PRIMARY KEY,'
+                ' payload TEXT NOT NULL,'
+                ' source TEXT NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._local.conn = conn
+        return conn
+
+    def _json_mtime(self):
+        try:
+            return os.stat(self.json_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _ensure_index(self):
+        """Reconstrói o índice se o JSON mudou desde a última indexação."""
+        mtime = self._json_mtime()
+        if mtime is None or mtime == self._indexed_mtime:
+            return
+
+        with self._build_lock:
+            if mtime == self._indexed_mtime:
+                return
+
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+            if row is None or int(row[0]) != mtime:
+                self._rebuild(conn, mtime)
+            self._indexed_mtime = mtime
+
+    def _rebuild(self, conn, mtime):
+        logger.info("Indexando o mock de voos",
+                    extra={'json_path': self.json_path, 'index_path': self.index_path})
+        with open(self.json_path, 'r') as f:
+            all_mock_data = json.load(f)
+
+        rows = ((key, json.dumps(value), SOURCE_FILE)
+                for key, value in all_mock_data.items())
+
+        with conn:
+            conn.execute('DELETE FROM routes WHERE source = ?', (SOURCE_FILE,))
+            while True:
+                batch = [row for _, row in zip(range(INSERT_BATCH_SIZE), rows)]
+                if not batch:
+                    break
+                # Respostas gravadas da API real têm prioridade sobre o arquivo
+                conn.executemany(
+                    'INSERT OR IGNORE INTO routes VALUES (?, ?, ?)', batch)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('json_mtime', ?)", (str(mtime),))
+
+    def get(self, origin, destination, date):
+        """Retorna o dicionário {'data', 'dictionaries'} da rota, ou None."""
+        self._ensure_index()
+        row = self._connection().execute(
+            'SELECT payload FROM routes WHERE route_key = ?',
+            (make_route_key(origin, destination, date),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record(self, origin, destination, date, data, dictionaries):
+        """Grava uma resposta real da Amadeus para ser reproduzida offline."""
+        payload = json.dumps({'data': data, 'dictionaries': dictionaries})
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO routes VALUES (?, ?, ?)',
+                (make_route_key(origin, destination, date), payload, SOURCE_RECORDED)
+            )
+
+    def reset(self):
+        """Descarta as conexões herdadas; usado no processo filho após o fork."""
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+        self._indexed_mtime = None
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 
 class PriceAlert(models.Model):
     user_whatsapp_id = models.CharField(max_length=30)
@@ -12,6 +15,160 @@ class PriceAlert(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            # Um mesmo alerta ativo só existe uma vez: reenvios (ex: retries
+            # do n8n) não aumentam o custo da verificação
+            models.UniqueConstraint(
+                fields=['user_whatsapp_id', 'origin_code', 'destination_code', 'target_price'],
+                condition=models.Q(is_active=True),
+                name='pricealert_active_unique',
+            ),
+        ]
+        indexes = [
+            # Verificação de alertas: alertas ativos agrupados por rota
+            models.Index(
+                fields=['origin_code', 'destination_code', 'target_price'],
+                condition=models.Q(is_active=True),
+                name='pricealert_active_route_idx',
+            ),
+            # Dashboard: alertas ativos do mais recente para o mais antigo,
+            # com o id como desempate da paginação por cursor
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='pricealert_active_recent_idx',
+            ),
+        ]
+
     def __str__(self):
         status = "Ativo" if self.is_active else "Inativo"
-        return f"Alerta de {self.origin_code} para {self.destination_code} por R${self.target_price} - ({status})"
\ No newline at end of file
+        return f"Alerta de {self.origin_code} para {self.destination_code} por R${self.target_price} - ({status})"
+
+
+class PriceObservation(models.Model):
+    """
+    Menor preço visto na Amadeus para uma rota e data de viagem, gravado a
+    cada consulta real (busca do usuário ou verificação de alertas).
+    """
+    origin_code = models.CharField(max_length=3)
+    destination_code = models.CharField(max_length=3)
+
+    travel_date = models.DateField()
+
+    observed_at = models.DateTimeField(default=timezone.now)
+
+    # Nulo quando a Amadeus não retornou nenhuma oferta
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    offer_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Observação mais recente de uma rota/data
+            models.Index(
+                fields=['travel_date', 'origin_code', 'destination_code', '-observed_at'],
+                name='priceobs_route_recent_idx',
+            ),
+            # Retenção e downsampling por idade
+            models.Index(fields=['observed_at'], name='priceobs_observed_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin_code} -> {self.destination_code} em {self.travel_date}: R${self.min_price} ({self.observed_at:%d/%m/%Y %H:%M})"
+
+
+
+class AlertNotification(models.Model):
+    """
+    Notificação de um alerta disparado (outbox), gravada na mesma transação
+    que desativa o alerta. É entregue pelo check-alerts ou, com webhook
+    configurado, pelo comando `deliver_notifications`.
+    """
+    alert = models.ForeignKey(PriceAlert, on_delete=models.CASCADE, related_name='notifications')
+
+    user_whatsapp_id = models.CharField(max_length=30)
+    origin_code = models.CharField(max_length=3)
+    destination_code = models.CharField(max_length=3)
+    target_price = models.DecimalField(max_digits=10, decimal_places=2)
+    found_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    # Entrega por webhook: a mesma chave em todas as tentativas, para o
+    # receptor descartar repetições
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Preenchido ao desistir, depois de NOTIFICATION_MAX_ATTEMPTS tentativas
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(delivered_at__isnull=True),
+                name='alertnotif_pending_idx',
+            ),
+            # Entrega por webhook: pendentes na ordem da próxima tentativa
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(delivered_at__isnull=True, failed_at__isnull=True),
+                name='alertnotif_due_idx',
+            ),
+        ]
+
+    def as_notification(self):
+        """Mesmo formato das notificações retornadas por check-alerts."""
+        return {
+            'user_whatsapp_id': self.user_whatsapp_id,
+            'origin': self.origin_code,
+            'destination': self.destination_code,
+            'target_price': str(self.target_price),
+            'found_price': str(self.found_price)
+        }
+
+    def as_webhook_item(self):
+        """Notificação no lote enviado ao webhook, com a chave de idempotência."""
+        return {
+            'idempotency_key': str(self.idempotency_key),
+            **self.as_notification(),
+            'created_at': self.created_at.isoformat(),
+        }
+
+    def __str__(self):
+        status = "Entregue" if self.delivered_at else ("Falhou" if self.failed_at else "Pendente")
+        return f"Notificação de {self.origin_code} para {self.destination_code} por R${self.found_price} - ({status})"
+
+
+class RouteSchedule(models.Model):
+    """
+    Agenda de verificação de uma rota com alertas ativos, mantida pelo
+    comando `run_alert_scheduler`.
+    """
+    origin_code = models.CharField(max_length=3)
+    destination_code = models.CharField(max_length=3)
+
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    next_check_at = models.DateTimeField(default=timezone.now)
+
+    # Último menor preço visto e variação relativa média entre verificações
+    last_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    volatility = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['origin_code', 'destination_code'], name='routeschedule_route_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['next_check_at'], name='routeschedule_next_check_idx'),
+        ]
+
+    @property
+    def route(self):
+        return (self.origin_code, self.destination_code)
+
+    def __str__(self):
+        return f"Agenda de {self.origin_code} para {self.destination_code} - próxima em {self.next_check_at}"
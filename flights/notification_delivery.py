@@ -0,0 +1,185 @@
+"""
+Entrega das notificações dos alertas por webhook.
+
+Cada notificação é gravada (AlertNotification) na mesma transação que
+desativa o alerta. Com NOTIFICATION_WEBHOOK_URL configurada, o check-alerts
+deixa de devolver as notificações e o comando `deliver_notifications` as
+envia em lotes, um POST JSON por lote, até o webhook confirmar: nenhuma se
+perde se o n8n estiver fora. Sem o webhook, as notificações são gravadas já
+como entregues e só chegam ao n8n pela resposta do check-alerts; uma
+resposta perdida não é reenviada.
+
+Um lote que falha (erro de rede ou status fora de 2xx) é tentado de novo
+com backoff exponencial (respeitando o Retry-After da resposta); depois de
+NOTIFICATION_MAX_ATTEMPTS tentativas a notificação é marcada como falha
+(`failed_at`). Cada notificação leva uma chave de idempotência, a mesma em
+todas as tentativas, para o receptor descartar repetições (ex: um lote
+entregue cuja resposta se perdeu). Vários entregadores podem rodar ao
+mesmo tempo: cada lote é reservado antes do envio (ver `claim_rows`).
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .claiming import claim_rows
+from .models import AlertNotification
+
+logger = logging.getLogger(__name__)
+
+
+def get_webhook_url():
+    return getattr(settings, 'NOTIFICATION_WEBHOOK_URL', '')
+
+
+def webhook_delivery_enabled():
+    """Com o webhook configurado, o check-alerts não devolve as notificações."""
+    return bool(get_webhook_url())
+
+
+def get_batch_size():
+    return getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+
+
+def get_max_attempts():
+    return getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 8)
+
+
+def get_timeout():
+    return getattr(settings, 'NOTIFICATION_WEBHOOK_TIMEOUT', 10)
+
+
+def retry_delay(attempts):
+    """Espera (segundos) antes da próxima tentativa, dobrando a cada falha."""
+    base = getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 30)
+    ceiling = getattr(settings, 'NOTIFICATION_RETRY_MAX_SECONDS', 3600)
+    return min(base * 2 ** (attempts - 1), ceiling)
+
+
+class WebhookError(Exception):
+    """O webhook respondeu com um status fora de 2xx."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Webhook respondeu {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _pending():
+    return AlertNotification.objects.filter(delivered_at__isnull=True, failed_at__isnull=True)
+
+
+def claim_due_notifications(now):
+    """
+    Reserva as próximas notificações vencidas, até NOTIFICATION_BATCH_SIZE.
+    A próxima tentativa das reservadas é adiada enquanto o lote é enviado:
+    se o entregador morrer no meio, elas voltam a vencer depois desse tempo.
+    """
+    due = list(_pending().filter(next_attempt_at__lte=now)
+               .order_by('next_attempt_at', 'pk')[:get_batch_size()])
+    if not due:
+        return []
+    lease_until = now + timedelta(seconds=get_timeout() * 2)
+    claimed = set(claim_rows(_pending().filter(next_attempt_at__lte=now),
+                             [notification.pk for notification in due],
+                             next_attempt_at=lease_until))
+    return [notification for notification in due if notification.pk in claimed]
+
+
+def batch_idempotency_key(notifications):
+    """Chave do lote: a mesma enquanto o lote tiver as mesmas notificações."""
+    keys = sorted(str(notification.idempotency_key) for notification in notifications)
+    return hashlib.sha256(','.join(keys).encode()).hexdigest()
+
+
+def post_batch(client, notifications):
+    headers = {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': batch_idempotency_key(notifications),
+    }
+    token = getattr(settings, 'NOTIFICATION_WEBHOOK_TOKEN', '')
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+
+    body = json.dumps({'notifications': [n.as_webhook_item() for n in notifications]})
+    with metrics.timed('notification_webhook_duration_seconds',
+                       counter='notification_webhook_requests_total'):
+        response = client.post(get_webhook_url(), content=body, headers=headers,
+                               timeout=get_timeout())
+        if not 200 <= response.status_code < 300:
+            retry_after = response.headers.get('Retry-After', '')
+            raise WebhookError(response.status_code,
+                               int(retry_after) if retry_after.isdigit() else None)
+
+
+def _record_failure(notifications, error, now):
+    """Agenda a próxima tentativa de cada notificação, ou desiste dela."""
+    retry_after = getattr(error, 'retry_after', None) or 0
+    failed = 0
+    for notification in notifications:
+        notification.attempts += 1
+        notification.last_error = str(error)[:500]
+        if notification.attempts >= get_max_attempts():
+            notification.failed_at = now
+            failed += 1
+        else:
+            notification.next_attempt_at = now + timedelta(
+                seconds=max(retry_delay(notification.attempts), retry_after))
+    AlertNotification.objects.bulk_update(
+        notifications, ['attempts', 'last_error', 'failed_at', 'next_attempt_at'])
+
+    logger.warning("Falha ao entregar o lote de notificações", extra={
+        'batch_size': len(notifications), 'error': str(error), 'gave_up': failed})
+    if failed:
+        metrics.inc('notifications_failed_total', amount=failed)
+    return {'delivered': 0, 'retrying': len(notifications) - failed, 'failed': failed}
+
+
+def deliver_batch(client, now=None):
+    """
+    Envia um lote de notificações vencidas. Retorna as contagens do lote:
+    entregues, a tentar de novo e desistidas.
+    """
+    from httpx import HTTPError
+
+    now = now or timezone.now()
+    notifications = claim_due_notifications(now)
+    if not notifications:
+        return {'delivered': 0, 'retrying': 0, 'failed': 0}
+
+    try:
+        post_batch(client, notifications)
+    except (WebhookError, HTTPError) as e:
+        return _record_failure(notifications, e, now)
+
+    AlertNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+        delivered_at=now, attempts=F('attempts') + 1, last_error='')
+    metrics.inc('notifications_delivered_total', amount=len(notifications))
+    return {'delivered': len(notifications), 'retrying': 0, 'failed': 0}
+
+
+def deliver_pending(client, now=None):
+    """
+    Envia lotes enquanto houver notificações vencidas; para no primeiro lote
+    incompleto ou com falha (o webhook provavelmente está fora). Retorna as
+    contagens somadas.
+    """
+    totals = {'delivered': 0, 'retrying': 0, 'failed': 0}
+    while True:
+        stats = deliver_batch(client, now)
+        for key, value in stats.items():
+            totals[key] += value
+        if not stats['delivered'] or stats['delivered'] < get_batch_size():
+            return totals
+
+
+def webhook_client():
+    """Cliente HTTP reaproveitado entre os lotes (conexão keep-alive)."""
+    import httpx
+
+    return httpx.Client(timeout=get_timeout())
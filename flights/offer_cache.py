@@ -0,0 +1,303 @@
+"""
+Cache compartilhado das ofertas de voo retornadas pela Amadeus.
+
+O armazenamento usa o framework de cache do Django (alias 'flight_offers'),
+então o mesmo resultado pode ser reaproveitado entre workers do gunicorn
+quando o backend configurado é compartilhado (arquivo ou banco de dados).
+Nos testes e em desenvolvimento o backend padrão é o LocMemCache, que já
+descarta as entradas menos usadas (LRU) ao atingir MAX_ENTRIES.
+
+Cada entrada guarda o momento em que foi buscada. Dentro do TTL ela é
+servida como fresca; depois disso, e até FLIGHT_CACHE_STALE_TTL segundos
+a mais, ela ainda é servida (stale-while-revalidate) enquanto uma única
+thread atualiza a rota em segundo plano.
+
+As entradas ficam no backend por mais FLIGHT_CACHE_FALLBACK_TTL segundos
+depois de vencidas. Elas não são servidas normalmente, só quando a busca
+falha com o circuito da Amadeus aberto: aí a última resposta conhecida da
+rota volta marcada como `stale` em vez de um erro.
+
+Buscas simultâneas da mesma chave que não estão no cache são coalescidas:
+dentro do processo, só a primeira thread (ou corrotina) chama a Amadeus e
+as demais recebem o resultado dela; entre workers, uma trava curta no
+cache faz os demais esperarem a entrada gravada pelo primeiro.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .circuit_breaker import CircuitOpenError
+from .coalescing import SingleFlight
+from .price_history import flush_observations
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'flight_offers'
+
+# Tempo máximo que um worker segura a trava de atualização em segundo plano
+REFRESH_LOCK_TIMEOUT = 30
+
+# Intervalo entre as leituras do cache de quem espera a busca de outro worker
+COALESCE_POLL_INTERVAL = 0.05
+
+LOOKUP_STATS_KEYS = ('hits', 'stale_hits', 'misses')
+# Falhas de cache atendidas pela busca de outra thread / de outro worker
+COALESCE_STATS_KEYS = ('coalesced', 'coalesced_remote')
+# Falhas de cache atendidas com a última resposta conhecida (circuito aberto)
+STATS_KEYS = LOOKUP_STATS_KEYS + COALESCE_STATS_KEYS + ('fallbacks',)
+
+single_flight = SingleFlight()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=single_flight.reset)
+
+
+def _get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_ttl():
+    return getattr(settings, 'FLIGHT_CACHE_TTL', 300)
+
+
+def get_stale_ttl():
+    return getattr(settings, 'FLIGHT_CACHE_STALE_TTL', 0)
+
+
+def get_fallback_ttl():
+    return getattr(settings, 'FLIGHT_CACHE_FALLBACK_TTL', 86400)
+
+
+def get_entry_timeout():
+    """Tempo que uma entrada fica no backend: TTL + stale + fallback."""
+    return get_ttl() + get_stale_ttl() + get_fallback_ttl()
+
+
+def get_coalesce_timeout():
+    """Tempo máximo que um worker espera a busca da mesma chave em outro worker."""
+    return getattr(settings, 'FLIGHT_COALESCE_TIMEOUT', 10)
+
+
+def make_key(origin, destination, date, params):
+    """Monta a chave da rota (ex: "offers:GRU:GIG:2025-11-20:<hash dos parâmetros>")."""
+    params_hash = hashlib.md5(
+        json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+    return f"offers:{origin}:{destination}:{date}:{params_hash}"
+
+
+def _record(stat):
+    """
+    Conta o resultado de uma consulta no contador do worker (sem ida ao
+    backend do cache). Os contadores de todos os workers são somados na
+    leitura, pelos retratos de METRICS_DIR (ver `flights.metrics`).
+    """
+    metrics.inc('flight_cache_lookups_total', {'result': stat})
+
+
+def get_stats():
+    """Retorna os contadores de acertos e falhas do cache, somados entre os workers."""
+    counters, _ = metrics.collect()
+    stats = dict.fromkeys(STATS_KEYS, 0)
+    for (name, labels), value in counters.items():
+        result = dict(labels).get('result')
+        if name == 'flight_cache_lookups_total' and result in stats:
+            stats[result] += value
+
+    lookups = sum(stats[stat] for stat in LOOKUP_STATS_KEYS)
+    served = stats['hits'] + stats['stale_hits']
+    stats['hit_ratio'] = round(served / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def clear():
+    """Remove todas as entradas do cache de ofertas."""
+    _get_cache().clear()
+
+
+def _make_entry(data, dictionaries):
+    return {
+        'data': data,
+        'dictionaries': dictionaries,
+        'fetched_at': time.time(),
+    }
+
+
+def store(key, data, dictionaries):
+    """Grava uma entrada mantendo-a no backend pelo TTL + stale + fallback."""
+    entry = _make_entry(data, dictionaries)
+    _get_cache().set(key, entry, timeout=get_entry_timeout())
+    return entry
+
+
+async def astore(key, data, dictionaries):
+    entry = _make_entry(data, dictionaries)
+    await _get_cache().aset(key, entry, timeout=get_entry_timeout())
+    return entry
+
+
+def _refresh_in_background(key, fetch):
+    cache = _get_cache()
+    lock_key = f"{key}:refreshing"
+
+    # Só um worker atualiza a rota; os demais continuam servindo a entrada antiga
+    if not cache.add(lock_key, 1, timeout=REFRESH_LOCK_TIMEOUT):
+        return
+
+    def refresh():
+        try:
+            store(key, *fetch())
+            # A thread não pertence a nenhuma requisição: grava aqui mesmo o
+            # preço observado na atualização
+            flush_observations()
+        except Exception as e:
+            logger.warning("Erro ao atualizar o cache da rota",
+                           extra={'cache_key': key, 'error': str(e)})
+        finally:
+            cache.delete(lock_key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _fetch_across_workers(key, fetch):
+    """
+    Busca e grava a chave, ou espera a entrada de outro worker que já está
+    buscando a mesma chave. Se o outro worker falhar ou demorar mais que
+    FLIGHT_COALESCE_TIMEOUT segundos, busca por conta própria.
+    """
+    cache = _get_cache()
+    lock_key = f"{key}:fetching"
+    timeout = get_coalesce_timeout()
+    if timeout <= 0:
+        return store(key, *fetch())
+
+    locked = cache.add(lock_key, 1, timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while not locked and time.monotonic() < deadline:
+        time.sleep(COALESCE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and time.time() - entry['fetched_at'] < get_ttl():
+            _record('coalesced_remote')
+            return entry
+        # O outro worker terminou sem gravar (ex: erro): assume a busca
+        locked = cache.add(lock_key, 1, timeout=timeout)
+
+    try:
+        return store(key, *fetch())
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+async def _afetch_across_workers(key, afetch):
+    cache = _get_cache()
+    lock_key = f"{key}:fetching"
+    timeout = get_coalesce_timeout()
+    if timeout <= 0:
+        return await astore(key, *(await afetch()))
+
+    locked = await cache.aadd(lock_key, 1, timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while not locked and time.monotonic() < deadline:
+        await asyncio.sleep(COALESCE_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None and time.time() - entry['fetched_at'] < get_ttl():
+            _record('coalesced_remote')
+            return entry
+        locked = await cache.aadd(lock_key, 1, timeout=timeout)
+
+    try:
+        return await astore(key, *(await afetch()))
+    finally:
+        if locked:
+            await cache.adelete(lock_key)
+
+
+def get_or_fetch(key, fetch):
+    """
+    Retorna a entrada da chave, buscando-a com `fetch` quando necessário.
+
+    `fetch` não recebe argumentos e devolve uma tupla (data, dictionaries).
+    Com TTL zero o cache fica desligado e toda chamada vai ao `fetch`,
+    coalescida só com as chamadas simultâneas do mesmo processo.
+    """
+    ttl = get_ttl()
+    if ttl <= 0:
+        # Sem cache não há onde compartilhar entre workers, só entre threads
+        (data, dictionaries), shared = single_flight.do(key, fetch)
+        if shared:
+            _record('coalesced')
+        return {'data': data, 'dictionaries': dictionaries}
+
+    with metrics.timed('flight_cache_lookup_duration_seconds'):
+        entry = _get_cache().get(key)
+    if entry is not None:
+        age = time.time() - entry['fetched_at']
+        if age < ttl:
+            _record('hits')
+            return entry
+        if age < ttl + get_stale_ttl():
+            _record('stale_hits')
+            _refresh_in_background(key, fetch)
+            return entry
+
+    _record('misses')
+    try:
+        fresh, shared = single_flight.do(key, lambda: _fetch_across_workers(key, fetch))
+    except CircuitOpenError:
+        if entry is None:
+            raise
+        _record('fallbacks')
+        return {**entry, 'stale': True}
+    if shared:
+        _record('coalesced')
+    return fresh
+
+
+async def aget_or_fetch(key, afetch, fetch):
+    """
+    Versão assíncrona de `get_or_fetch` para as views sob ASGI.
+
+    `afetch` é a corrotina usada nas falhas de cache. A atualização de uma
+    entrada vencida roda em uma thread com o `fetch` síncrono, para não
+    depender do event loop da requisição continuar vivo.
+    """
+    ttl = get_ttl()
+    if ttl <= 0:
+        (data, dictionaries), shared = await single_flight.ado(key, afetch)
+        if shared:
+            _record('coalesced')
+        return {'data': data, 'dictionaries': dictionaries}
+
+    with metrics.timed('flight_cache_lookup_duration_seconds'):
+        entry = await _get_cache().aget(key)
+    if entry is not None:
+        age = time.time() - entry['fetched_at']
+        if age < ttl:
+            _record('hits')
+            return entry
+        if age < ttl + get_stale_ttl():
+            _record('stale_hits')
+            await sync_to_async(_refresh_in_background, thread_sensitive=False)(key, fetch)
+            return entry
+
+    _record('misses')
+    try:
+        fresh, shared = await single_flight.ado(
+            key, lambda: _afetch_across_workers(key, afetch))
+    except CircuitOpenError:
+        if entry is None:
+            raise
+        _record('fallbacks')
+        return {**entry, 'stale': True}
+    if shared:
+        _record('coalesced')
+    return fresh
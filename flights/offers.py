@@ -0,0 +1,102 @@
+"""
+Representação compacta das ofertas de voo devolvidas pela API.
+
+Cada oferta vira um `FlightOption` montado em uma única passada pelos
+itinerários e trechos da resposta da Amadeus. Os campos da ida ficam no
+nível de cima, como a API sempre retornou; os itinerários seguintes (ex: a
+volta) ficam em `return_itineraries`.
+
+As dataclasses não usam __slots__ de propósito: o orjson serializa
+dataclasses com __dict__ direto do dicionário da instância, e as com
+__slots__ por um caminho bem mais lento.
+"""
+import logging
+from dataclasses import dataclass
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Itinerary:
+    origin: str
+    destination: str
+    departure_time: str
+    arrival_time: str
+    stops: int
+    duration: str
+    carrier: str
+
+
+@dataclass
+class FlightOption:
+    origin: str
+    destination: str
+    departure_time: str
+    arrival_time: str
+    stops: int
+    duration: str
+    carrier: str
+    price: str
+    return_itineraries: list
+
+
+def _parse_itinerary(itinerary, carriers):
+    segments = itinerary['segments']
+    first_segment = segments[0]
+    last_segment = segments[-1]
+    departure = first_segment['departure']
+    arrival = last_segment['arrival']
+    carrier_code = first_segment['carrierCode']
+
+    return Itinerary(
+        departure['iataCode'],
+        arrival['iataCode'],
+        departure['at'],
+        arrival['at'],
+        len(segments) - 1,
+        itinerary['duration'],
+        carriers.get(carrier_code, carrier_code),
+    )
+
+
+@metrics.timed('offers_parse_duration_seconds')
+def parse_amadeus_response(amadeus_response):
+    """
+    Transforma a resposta da Amadeus na lista de `FlightOption` que a API
+    retorna. Ofertas malformadas são registradas no log e puladas.
+    """
+    dictionaries = getattr(amadeus_response, 'dictionaries', None) or {}
+    carriers = dictionaries.get('carriers') or {}
+
+    flight_options = []
+    append = flight_options.append
+    for offer in amadeus_response.data:
+        try:
+            itineraries = offer['itineraries']
+            outbound = itineraries[0]
+            segments = outbound['segments']
+            first_segment = segments[0]
+            last_segment = segments[-1]
+            departure = first_segment['departure']
+            arrival = last_segment['arrival']
+            carrier_code = first_segment['carrierCode']
+            price = offer.get('price')
+
+            append(FlightOption(
+                departure['iataCode'],
+                arrival['iataCode'],
+                departure['at'],
+                arrival['at'],
+                len(segments) - 1,
+                outbound['duration'],
+                carriers.get(carrier_code, carrier_code),
+                price.get('total') if price else None,
+                [_parse_itinerary(itinerary, carriers) for itinerary in itineraries[1:]]
+                if len(itineraries) > 1 else [],
+            ))
+        except (IndexError, KeyError, TypeError) as e:
+            logger.warning("Erro ao processar uma oferta de voo: %r", e)
+            continue
+    return flight_options
@@ -0,0 +1,107 @@
+"""
+Histórico dos preços observados na Amadeus.
+
+Cada consulta real à Amadeus (ou ao mock) registra uma observação compacta
+em um buffer em memória. O buffer é gravado com um único bulk_create ao
+final da requisição (`flush_observations`), para não pagar um INSERT por
+rota. As verificações de alertas usam as observações recentes para não
+consultar de novo rotas que acabaram de ser buscadas.
+
+O buffer é do contexto de quem consulta (contextvars): cada requisição (ou
+thread) tem o seu, e as consultas em paralelo de uma requisição (ver
+`iter_concurrent`) usam o dela. As observações de uma requisição nunca são
+gravadas pela requisição de outra.
+"""
+import threading
+from contextvars import ContextVar
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PriceObservation
+
+# Linhas por INSERT no bulk_create
+INSERT_BATCH_SIZE = 500
+
+_buffer = ContextVar('price_observations')
+_buffer_lock = threading.Lock()
+
+
+def summarize_offers(offers):
+    """Retorna (menor preço, quantidade de ofertas) de uma lista de ofertas."""
+    prices = []
+    for offer in offers or []:
+        try:
+            prices.append(Decimal(offer['price']['total']))
+        except (KeyError, TypeError, InvalidOperation):
+            continue
+    return (min(prices) if prices else None), len(offers or [])
+
+
+def observation_buffer():
+    """Buffer do contexto atual, criado na primeira chamada."""
+    try:
+        return _buffer.get()
+    except LookupError:
+        buffer = []
+        _buffer.set(buffer)
+        return buffer
+
+
+def record_observation(origin, destination, travel_date, offers):
+    """Adiciona ao buffer a observação de uma consulta à Amadeus."""
+    min_price, offer_count = summarize_offers(offers)
+    observation = PriceObservation(
+        origin_code=origin,
+        destination_code=destination,
+        travel_date=travel_date,
+        observed_at=timezone.now(),
+        min_price=min_price,
+        offer_count=offer_count,
+    )
+    buffer = observation_buffer()
+    with _buffer_lock:
+        buffer.append(observation)
+
+
+def flush_observations():
+    """
+    Grava de uma vez as observações acumuladas no contexto atual. Retorna
+    quantas foram gravadas.
+    """
+    buffer = observation_buffer()
+    with _buffer_lock:
+        pending = buffer[:]
+        buffer.clear()
+
+    if pending:
+        PriceObservation.objects.bulk_create(pending, batch_size=INSERT_BATCH_SIZE)
+    return len(pending)
+
+
+def get_max_age():
+    return getattr(settings, 'PRICE_OBSERVATION_MAX_AGE', 900)
+
+
+def latest_prices(travel_date, max_age=None):
+    """
+    Menor preço da observação mais recente de cada rota para a data, entre
+    as observações com até `max_age` segundos: {(origem, destino): preço}.
+    O preço é None quando a última consulta não encontrou voos.
+    """
+    max_age = get_max_age() if max_age is None else max_age
+    if max_age <= 0:
+        return {}
+
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    observations = PriceObservation.objects.filter(
+        travel_date=travel_date, observed_at__gte=cutoff
+    ).order_by('origin_code', 'destination_code', '-observed_at').values_list(
+        'origin_code', 'destination_code', 'min_price')
+
+    prices = {}
+    for origin, destination, min_price in observations:
+        prices.setdefault((origin, destination), min_price)
+    return prices
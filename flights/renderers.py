@@ -0,0 +1,72 @@
+import dataclasses
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Dependência opcional: sem ela o JSONRenderer do DRF é usado
+    orjson = None
+
+
+class OffersJSONEncoder(JSONEncoder):
+    """Encoder do DRF que também serializa dataclasses (ex: FlightOption)."""
+
+    def default(self, obj):
+        if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+            return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+        return super().default(obj)
+
+
+_encoder = OffersJSONEncoder()
+
+
+def _orjson_default(obj):
+    # Decimal, UUID, etc.: mesma representação do encoder do DRF
+    return _encoder.default(obj)
+
+
+def dumps(data):
+    """Serializa `data` em JSON compacto (bytes), com orjson quando disponível."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_orjson_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, cls=OffersJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer que serializa com orjson, inclusive as dataclasses das
+    ofertas (sem __slots__, ver `flights.offers`), sem montar dicionários
+    intermediários. Respostas indentadas
+    (ex: Accept: application/json; indent=4) e instalações sem orjson usam o
+    caminho padrão do DRF.
+    """
+    encoder_class = OffersJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Habilita a negociação de `Accept: application/x-ndjson` (ou `?format=ndjson`).
+
+    As views que aceitam esse formato respondem com um StreamingHttpResponse
+    próprio, uma linha JSON por item; este renderer só cobre respostas
+    comuns (ex: erros), serializadas em uma única linha.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, ensure_ascii=False) + '\n').encode(self.charset)
@@ -0,0 +1,185 @@
+"""
+Agendamento adaptativo da verificação dos alertas por rota.
+
+Em vez de consultar todas as rotas a cada chamada de check-alerts, cada
+rota com alertas ativos tem a sua próxima verificação (RouteSchedule). O
+intervalo depende da distância entre o último preço e o maior preço alvo
+da rota (o primeiro a disparar) em relação à volatilidade do preço: rotas
+voláteis ou perto do alvo são verificadas logo; rotas estáveis e longe do
+alvo, raramente. Em cada ciclo só as rotas vencidas são consultadas, as
+mais prováveis de disparar primeiro, até o orçamento de chamadas.
+
+Vários schedulers podem rodar ao mesmo tempo (em processos ou nós
+diferentes): cada um reserva as rotas que vai consultar, adiando a
+próxima verificação delas, e os demais seguem para as rotas seguintes.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .alert_matching import queue_triggered_alerts
+from .alert_service import iter_route_prices
+from .claiming import claim_rows
+from .models import PriceAlert, RouteSchedule
+from .price_history import flush_observations, latest_prices
+
+# Peso da variação mais recente na média móvel da volatilidade
+VOLATILITY_SMOOTHING = 0.3
+# Volatilidade mínima considerada, para rotas sem histórico de variação
+MIN_VOLATILITY = 0.01
+
+
+def get_min_interval():
+    return getattr(settings, 'ALERT_SCHEDULER_MIN_INTERVAL', 300)
+
+
+def get_max_interval():
+    return getattr(settings, 'ALERT_SCHEDULER_MAX_INTERVAL', 21600)
+
+
+def active_route_thresholds():
+    """Maior preço alvo ativo de cada rota: {(origem, destino): preço}."""
+    rows = PriceAlert.objects.filter(is_active=True).values(
+        'origin_code', 'destination_code').annotate(max_target=Max('target_price'))
+    return {(row['origin_code'], row['destination_code']): row['max_target'] for row in rows}
+
+
+def sync_route_schedules(routes, now):
+    """Cria a agenda das rotas que ainda não têm uma (vencida desde já)."""
+    scheduled = set(RouteSchedule.objects.values_list('origin_code', 'destination_code'))
+    RouteSchedule.objects.bulk_create([
+        RouteSchedule(origin_code=origin, destination_code=destination, next_check_at=now)
+        for origin, destination in routes if (origin, destination) not in scheduled
+    ], ignore_conflicts=True)
+
+
+def price_gap(last_price, threshold):
+    """Queda relativa que falta para o preço atingir o alvo (0 se já atingiu)."""
+    if not last_price:
+        return 0.0
+    return max(float((last_price - threshold) / last_price), 0.0)
+
+
+def check_score(schedule, threshold):
+    """
+    Quantas "variações típicas" o preço está do alvo. Quanto menor, mais
+    provável o alerta disparar na próxima verificação.
+    """
+    if schedule.last_price is None:
+        return 0.0  # Nunca verificada
+    return price_gap(schedule.last_price, threshold) / max(schedule.volatility, MIN_VOLATILITY)
+
+
+def next_interval(score):
+    """Intervalo (segundos) até a próxima verificação, proporcional ao score."""
+    return min(get_min_interval() * (1 + score), get_max_interval())
+
+
+def update_schedule(schedule, price, threshold, now):
+    """Registra a verificação da rota e agenda a próxima."""
+    if price is None:
+        # Sem voos (ou só resultado antigo): verifica de novo bem mais tarde
+        schedule.next_check_at = now + timedelta(seconds=get_max_interval())
+        schedule.last_checked_at = now
+        return
+
+    if schedule.last_price:
+        change = abs(float((price - schedule.last_price) / schedule.last_price))
+        schedule.volatility = (VOLATILITY_SMOOTHING * change
+                               + (1 - VOLATILITY_SMOOTHING) * schedule.volatility)
+    schedule.last_price = Decimal(price)
+    schedule.last_checked_at = now
+
+    if threshold is None:
+        # Todos os alertas da rota dispararam
+        schedule.next_check_at = now + timedelta(seconds=get_max_interval())
+    else:
+        schedule.next_check_at = now + timedelta(
+            seconds=next_interval(check_score(schedule, threshold)))
+
+
+def claim_due_schedules(due, budget, now):
+    """
+    Reserva, na ordem de `due`, até `budget` rotas ainda vencidas. A
+    próxima verificação das rotas reservadas é adiada pelo intervalo mínimo,
+    então as rotas de um scheduler que morrer no meio do ciclo voltam a
+    vencer depois desse tempo.
+    """
+    lease_until = now + timedelta(seconds=get_min_interval())
+    remaining = iter(due)
+    selected = []
+    while len(selected) < budget:
+        batch = list(islice(remaining, budget - len(selected)))
+        if not batch:
+            break
+        # Rotas já reservadas por outro scheduler não estão mais vencidas
+        claimed = set(claim_rows(RouteSchedule.objects.filter(next_check_at__lte=now),
+                                 [schedule.pk for schedule in batch],
+                                 next_check_at=lease_until))
+        selected.extend(schedule for schedule in batch if schedule.pk in claimed)
+    return selected
+
+
+def run_cycle(search_date, search, budget, now=None):
+    """
+    Verifica as rotas vencidas, das mais prováveis de disparar para as
+    menos, com no máximo `budget` consultas. Os alertas disparados são
+    desativados e suas notificações enfileiradas para o check-alerts.
+    Retorna as contagens do ciclo.
+    """
+    now = now or timezone.now()
+    thresholds = active_route_thresholds()
+    sync_route_schedules(thresholds, now)
+
+    due = [schedule for schedule in RouteSchedule.objects.filter(next_check_at__lte=now)
+           if schedule.route in thresholds]
+
+    def priority(schedule):
+        # Rotas atrasadas sobem na fila, para nenhuma ficar sem verificação
+        overdue = (now - schedule.next_check_at).total_seconds()
+        return check_score(schedule, thresholds[schedule.route]) / (1 + overdue / get_min_interval())
+
+    due.sort(key=priority)
+    selected = {schedule.route: schedule
+                for schedule in claim_due_schedules(due, budget, now)}
+
+    # Rotas com uma observação recente são avaliadas sem nova consulta
+    observed = latest_prices(search_date)
+    fresh_prices = [(route, observed[route]) for route in selected if route in observed]
+    stale_routes = [route for route in selected if route not in observed]
+
+    checked = []
+    triggered = 0
+    for route, price in chain(fresh_prices, iter_route_prices(stale_routes, search_date, search)):
+        schedule = selected[route]
+        threshold = thresholds[route]
+        if price is not None and price <= threshold:
+            alerts = PriceAlert.objects.filter(origin_code=route[0], destination_code=route[1])
+            triggered += len(queue_triggered_alerts(alerts, price))
+            # O próximo alvo da rota é o maior entre os alertas que sobraram
+            threshold = alerts.filter(is_active=True).aggregate(
+                max_target=Max('target_price'))['max_target']
+        update_schedule(schedule, price, threshold, now)
+        checked.append(schedule)
+
+    # Rotas que falharam ou estouraram o timeout: tenta de novo no intervalo mínimo
+    checked_routes = {schedule.route for schedule in checked}
+    for route, schedule in selected.items():
+        if route not in checked_routes:
+            schedule.next_check_at = now + timedelta(seconds=get_min_interval())
+            checked.append(schedule)
+
+    RouteSchedule.objects.bulk_update(
+        checked, ['last_checked_at', 'next_check_at', 'last_price', 'volatility'])
+    flush_observations()
+
+    return {
+        'due': len(due),
+        'checked': len(checked_routes),
+        'upstream': len(stale_routes),
+        'triggered': triggered,
+    }
@@ -0,0 +1,117 @@
+"""
+Buscas compostas a partir da busca simples de voos.
+
+O calendário de preços consulta vários dias da mesma rota em paralelo, e a
+busca em lote consulta em paralelo as consultas distintas de uma lista.
+Cada consulta passa pela busca normal (`search_flights_from_amadeus`),
+então as já feitas recentemente saem do cache de ofertas sem chamar a
+Amadeus de novo.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+
+from .alert_matching import trigger_matching_alerts
+from .amadeus_service import FlightOffersResponse, is_stale_response, stale_details
+from .fan_out import iter_concurrent
+from .offers import parse_amadeus_response
+from .price_history import flush_observations, summarize_offers
+
+
+def get_fan_out_settings():
+    """(concorrência, timeout por consulta) das buscas compostas."""
+    return (getattr(settings, 'SEARCH_FAN_OUT_CONCURRENCY', 8),
+            getattr(settings, 'SEARCH_FAN_OUT_TIMEOUT', 15))
+
+
+def date_range(start, end):
+    """Datas de `start` até `end`, inclusive."""
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _cheapest_offer(offers):
+    """Oferta de menor preço total, ou None."""
+    best, best_price = None, None
+    for offer in offers:
+        price, _ = summarize_offers([offer])
+        if price is not None and (best_price is None or price < best_price):
+            best, best_price = offer, price
+    return best
+
+
+def search_calendar(origin, destination, dates, search):
+    """
+    Consulta a rota em cada data em paralelo e monta o calendário com o
+    menor preço de cada dia e a melhor oferta do período.
+
+    `search` é a função de busca (origem, destino, data) -> resposta da
+    Amadeus. Um dia que falha ou estoura o timeout aparece no calendário
+    com o erro, sem derrubar os demais.
+    """
+    concurrency, timeout = get_fan_out_settings()
+    days = {}
+    best = None  # (preço, data, resposta)
+
+    def lookup(day):
+        return search(origin, destination, day.isoformat())
+
+    for day, response, error in iter_concurrent(
+            dates, lookup, concurrency, timeout, thread_name_prefix='calendar'):
+        if error is not None:
+            days[day] = {'date': day.isoformat(), 'cheapest_price': None,
+                         'offer_count': 0, 'error': str(error)}
+            continue
+
+        offers = response.data if response else []
+        min_price, offer_count = summarize_offers(offers)
+        days[day] = {'date': day.isoformat(),
+                     'cheapest_price': str(min_price) if min_price is not None else None,
+                     'offer_count': offer_count,
+                     **stale_details(response)}
+        if min_price is not None and (best is None or (min_price, day) < best[:2]):
+            best = (min_price, day, response)
+
+    best_offer = None
+    if best is not None:
+        min_price, day, response = best
+        offer = _cheapest_offer(response.data)
+        options = parse_amadeus_response(
+            FlightOffersResponse([offer], getattr(response, 'dictionaries', None)))
+        best_offer = {'date': day.isoformat(), 'price': str(min_price),
+                      'flight_option': options[0] if options else None,
+                      **stale_details(response)}
+
+    flush_observations()
+    # Preços de fallback (circuito aberto) não disparam alertas
+    if best is not None and not is_stale_response(best[2]):
+        # O menor preço do período também dispara os alertas da rota
+        trigger_matching_alerts(origin, destination, best[0])
+
+    return {
+        'calendar': [days[day] for day in dates],
+        'best_offer': best_offer,
+    }
+
+
+def search_batch(queries, search):
+    """
+    Executa em paralelo as consultas (origem, destino, data) distintas e
+    retorna {consulta: (resposta, erro)}. Consultas repetidas são feitas
+    uma única vez.
+    """
+    concurrency, timeout = get_fan_out_settings()
+    unique_queries = list(dict.fromkeys(queries))
+    results = {}
+
+    for query, response, error in iter_concurrent(
+            unique_queries, lambda query: search(*query), concurrency, timeout,
+            thread_name_prefix='batch-search'):
+        results[query] = (response, error)
+
+    flush_observations()
+    for (origin, destination, _), (response, error) in results.items():
+        if response and not is_stale_response(response):
+            trigger_matching_alerts(
+                origin, destination, summarize_offers(response.data)[0])
+
+    return results
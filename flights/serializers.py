@@ -1,8 +1,31 @@
 from rest_framework import serializers
+from .airports import airport_index
 from .models import PriceAlert
 
 
+class LocationCodeField(serializers.CharField):
+    """Código IATA, ou nome da cidade ou do aeroporto convertido no código."""
+
+    default_error_messages = {
+        'unknown': "Local desconhecido ou ambíguo: '{value}'.",
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_length', 100)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        code = airport_index().resolve(value)
+        if code is None:
+            self.fail('unknown', value=value)
+        return code
+
+
 class PriceAlertSerializer(serializers.ModelSerializer):
+    origin_code = LocationCodeField()
+    destination_code = LocationCodeField()
+
     class Meta:
         model = PriceAlert
         fields = ['user_whatsapp_id', 'origin_code',
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .alert_matching import matching_index
+from .dashboard import invalidate_dashboard
+from .models import PriceAlert
+
+
+@receiver([post_save, post_delete], sender=PriceAlert)
+def invalidate_dashboard_on_alert_change(sender, **kwargs):
+    # UPDATEs em lote (ex: queue_notifications) não disparam sinais e
+    # invalidam o dashboard diretamente.
+    invalidate_dashboard()
+
+
+@receiver(post_save, sender=PriceAlert)
+def update_matching_index_on_save(sender, instance, **kwargs):
+    matching_index.update(instance)
+
+
+@receiver(post_delete, sender=PriceAlert)
+def discard_from_matching_index(sender, instance, **kwargs):
+    matching_index.discard([instance.pk])
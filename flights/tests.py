@@ -1,9 +1,47 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
-from .models import PriceAlert
+from amadeus import ResponseError
+from .models import AlertNotification, PriceAlert, PriceObservation, RouteSchedule
+from . import scheduler
+from . import amadeus_service, offer_cache, price_history
+from .fake_amadeus import FakeAmadeusServer
+from .fake_webhook import FakeWebhookServer
+from .mock_store import MockFlightStore
+from .offers import FlightOption, parse_amadeus_response
+from .renderers import FastJSONRenderer
+from . import renderers
+from .alert_matching import AlertMatchingIndex, matching_index, queue_notifications
+from .alert_service import (
+    active_alerts_by_route, check_active_alerts, stream_active_alerts)
+from .views import AlertsDashboardView
+from .dashboard import KeysetPage, encode_cursor
+from .throttling import TokenBucket
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from . import intent_parser, metrics, notification_delivery
+from .airports import airport_index
+from .log_format import JSONFormatter
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+import asyncio
+import io
 import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 # Dados mockados da resposta do Amadeus (para não acabar com a cota free)
 MOCK_AMADEUS_RESPONSE = {
@@ -159,3 +197,1522 @@ class FlightSearchViewTestCase(APITestCase):
         self.assertEqual(response.data['intent'], "search_flight")
         self.assertEqual(response.data['entities']['origin'], "São Paulo")
 
+
+def make_sdk_response(prices):
+    """Monta uma resposta falsa do SDK com uma oferta por preço informado."""
+    offer = MOCK_AMADEUS_RESPONSE['data'][0]
+    mock_sdk_response = MagicMock()
+    mock_sdk_response.data = [
+        {**offer, 'price': {'total': price}} for price in prices
+    ]
+    mock_sdk_response.dictionaries = MOCK_AMADEUS_RESPONSE['dictionaries']
+    return mock_sdk_response
+
+
+class CheckAlertsViewTestCase(APITestCase):
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_check_alerts_queries_each_route_once(self, mock_amadeus_search):
+        """
+        Garante que alertas da mesma rota compartilham uma única busca na Amadeus.
+        """
+        for user_id, target in [("1", 500), ("2", 300), ("3", 450.35)]:
+            PriceAlert.objects.create(
+                user_whatsapp_id=user_id, origin_code="GRU",
+                destination_code="GIG", target_price=target)
+        PriceAlert.objects.create(
+            user_whatsapp_id="4", origin_code="FOR",
+            destination_code="GRU", target_price=100)
+
+        mock_amadeus_search.return_value = make_sdk_response(["610.00", "450.35"])
+
+        response = self.client.get(reverse('check-alerts'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # uma chamada por rota distinta, não por alerta
+        self.assertEqual(mock_amadeus_search.call_count, 2)
+
+        notified = sorted(n['user_whatsapp_id']
+                          for n in response.data['notifications_to_send'])
+        self.assertEqual(notified, ["1", "3"])
+        self.assertEqual(
+            sorted(PriceAlert.objects.filter(is_active=True)
+                   .values_list('user_whatsapp_id', flat=True)),
+            ["2", "4"])
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_check_alerts_deactivates_in_bulk(self, mock_amadeus_search):
+        """
+        Garante que o número de queries não cresce com o número de alertas disparados.
+        """
+        PriceAlert.objects.bulk_create([
+            PriceAlert(user_whatsapp_id=str(i), origin_code="MAD",
+                       destination_code="BCN", target_price=500)
+            for i in range(50)
+        ])
+        mock_amadeus_search.return_value = make_sdk_response(["180.25"])
+
+        # SELECT da fila de notificações + SELECT dos alertas ativos
+        # + SELECT das observações recentes + transação com a reserva (trava
+        # de escrita, SELECT e UPDATE em lote) e o INSERT das notificações
+        # (sem observações novas, já que a busca é mockada)
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('check-alerts'))
+
+        self.assertEqual(len(response.data['notifications_to_send']), 50)
+        self.assertFalse(PriceAlert.objects.filter(is_active=True).exists())
+
+
+class SynchronousThread:
+    """Substitui threading.Thread para executar o alvo imediatamente no teste."""
+
+    def __init__(self, target, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(FLIGHT_CACHE_TTL=60, FLIGHT_CACHE_STALE_TTL=0)
+class OfferCacheTestCase(TestCase):
+    def setUp(self):
+        offer_cache.clear()
+        metrics.registry.reset()
+
+    @patch('flights.amadeus_service._fetch_flight_offers')
+    def test_repeated_search_is_served_from_cache(self, mock_fetch):
+        """
+        Garante que buscas idênticas só chegam à Amadeus uma vez.
+        """
+        mock_fetch.return_value = (MOCK_AMADEUS_RESPONSE['data'],
+                                   MOCK_AMADEUS_RESPONSE['dictionaries'])
+
+        first = amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-10-25')
+        second = amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-10-25')
+        # parâmetros diferentes geram outra chave
+        amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-10-25', adults=2)
+
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.dictionaries['carriers']['G3'], "GOL Linhas Aereas")
+
+        stats = self.client.get(reverse('cache-stats')).json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    @override_settings(FLIGHT_CACHE_TTL=10, FLIGHT_CACHE_STALE_TTL=60)
+    @patch('flights.offer_cache.threading.Thread', SynchronousThread)
+    @patch('flights.offer_cache.time')
+    @patch('flights.amadeus_service._fetch_flight_offers')
+    def test_stale_entry_is_served_while_revalidating(self, mock_fetch, mock_time):
+        """
+        Garante que uma entrada vencida é servida e atualizada em segundo plano.
+        """
+        mock_fetch.return_value = ([{'price': {'total': '100.00'}}], {})
+        mock_time.time.return_value = 1000
+        amadeus_service.search_flights_from_amadeus('FOR', 'GRU', '2025-08-07')
+
+        # passa do TTL mas continua dentro da janela de stale
+        mock_fetch.return_value = ([{'price': {'total': '90.00'}}], {})
+        mock_time.time.return_value = 1030
+        stale = amadeus_service.search_flights_from_amadeus('FOR', 'GRU', '2025-08-07')
+        self.assertEqual(stale.data[0]['price']['total'], '100.00')
+
+        fresh = amadeus_service.search_flights_from_amadeus('FOR', 'GRU', '2025-08-07')
+        self.assertEqual(fresh.data[0]['price']['total'], '90.00')
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(offer_cache.get_stats()['stale_hits'], 1)
+
+
+@override_settings(FLIGHT_CACHE_TTL=0)
+@patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+class AmadeusClientManagerTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeAmadeusServer().start()
+        amadeus_service.amadeus_client.configure(**self.server.client_options())
+
+    def tearDown(self):
+        amadeus_service.amadeus_client.configure()
+        self.server.stop()
+
+    def test_client_reuses_token_and_connection(self):
+        """
+        Garante que buscas seguidas reaproveitam o token OAuth e a conexão HTTP.
+        """
+        for _ in range(5):
+            response = amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-11-20')
+            self.assertEqual(len(response.data), 5)
+
+        self.assertEqual(self.server.counters['search_requests'], 5)
+        self.assertEqual(self.server.counters['token_requests'], 1)
+        self.assertEqual(self.server.counters['connections'], 1)
+        self.assertEqual(response.dictionaries['carriers']['G3'], "GOL LINHAS AEREAS")
+
+    def test_fake_server_injects_errors(self):
+        """
+        Garante que a Amadeus falsa responde 500 na fração configurada das buscas.
+        """
+        self.server.error_rate = 1.0
+
+        with self.assertRaises(ResponseError):
+            amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-11-20')
+
+        self.assertEqual(self.server.counters['search_requests'], 1)
+        self.assertEqual(self.server.counters['errors'], 1)
+
+    def test_client_is_rebuilt_after_fork(self):
+        """
+        Garante que o processo filho não reaproveita o cliente herdado do pai.
+        """
+        manager = amadeus_service.amadeus_client
+        client = manager.get_client()
+        self.assertIs(manager.get_client(), client)
+
+        manager.reset()
+        self.assertIsNot(manager.get_client(), client)
+
+
+class MockFlightStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.json_path = os.path.join(self.tmp_dir, 'mock.json')
+        self.index_path = os.path.join(self.tmp_dir, 'mock.sqlite3')
+        self._write_json({"MAD-BCN-2025-11-20": MOCK_AMADEUS_RESPONSE})
+        self.store = MockFlightStore(self.json_path, self.index_path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_json(self, content, mtime=None):
+        with open(self.json_path, 'w') as f:
+            json.dump(content, f)
+        if mtime is not None:
+            os.utime(self.json_path, (mtime, mtime))
+
+    def test_store_indexes_file_once_and_reloads_on_change(self):
+        """
+        Garante que o JSON só é lido de novo quando o arquivo muda.
+        """
+        with patch('flights.mock_store.json.load', wraps=json.load) as mock_load:
+            route = self.store.get('MAD', 'BCN', '2025-11-20')
+            self.assertEqual(route['data'][0]['price']['total'], "450.35")
+            self.assertIsNone(self.store.get('GRU', 'GIG', '2025-11-20'))
+
+            # outro processo reaproveita o índice já construído em disco
+            other = MockFlightStore(self.json_path, self.index_path)
+            self.assertIsNotNone(other.get('MAD', 'BCN', '2025-11-20'))
+            other.close()
+            self.assertEqual(mock_load.call_count, 1)
+
+            self._write_json({"GRU-GIG-2025-11-20": MOCK_AMADEUS_RESPONSE},
+                             mtime=os.stat(self.json_path).st_mtime + 10)
+            self.assertIsNone(self.store.get('MAD', 'BCN', '2025-11-20'))
+            self.assertIsNotNone(self.store.get('GRU', 'GIG', '2025-11-20'))
+            self.assertEqual(mock_load.call_count, 2)
+
+    def test_recorded_responses_are_replayed(self):
+        """
+        Garante que respostas gravadas da API real podem ser reproduzidas offline.
+        """
+        self.store.record('FOR', 'GRU', '2025-08-07',
+                          [{'price': {'total': '593.50'}}], {'carriers': {}})
+
+        route = self.store.get('FOR', 'GRU', '2025-08-07')
+        self.assertEqual(route['data'][0]['price']['total'], '593.50')
+
+
+class RouteFanOutTestCase(TestCase):
+    def _create_alerts(self, routes):
+        for origin, destination in routes:
+            PriceAlert.objects.create(
+                user_whatsapp_id=f"{origin}{destination}", origin_code=origin,
+                destination_code=destination, target_price=500)
+
+    @override_settings(ALERT_CHECK_CONCURRENCY=8)
+    def test_routes_are_checked_concurrently(self):
+        """
+        Garante que o tempo total fica perto da latência de uma única rota.
+        """
+        routes = [(f"A{i}", "GIG") for i in range(8)]
+        self._create_alerts(routes)
+
+        def slow_search(origin, destination, date):
+            time.sleep(0.2)
+            return make_sdk_response(["450.35"])
+
+        started = time.monotonic()
+        notifications = check_active_alerts('2025-11-20', slow_search)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(len(notifications), 8)
+        self.assertLess(elapsed, 0.2 * 8 / 2)
+
+    @override_settings(ALERT_CHECK_ROUTE_TIMEOUT=0.2)
+    def test_slow_route_does_not_stall_the_batch(self):
+        """
+        Garante que uma rota lenta ou com erro é pulada sem travar as demais.
+        """
+        self._create_alerts([("GRU", "GIG"), ("FOR", "GRU"), ("MAD", "BCN")])
+        release = threading.Event()
+
+        def search(origin, destination, date):
+            if origin == "FOR":
+                release.wait(5)
+            if origin == "MAD":
+                raise RuntimeError("upstream indisponível")
+            return make_sdk_response(["450.35"])
+
+        started = time.monotonic()
+        notifications = check_active_alerts('2025-11-20', search)
+        release.set()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([n['origin'] for n in notifications], ["GRU"])
+        self.assertTrue(PriceAlert.objects.get(origin_code="FOR").is_active)
+
+    def test_token_bucket_limits_call_rate(self):
+        """
+        Garante que o limitador libera no máximo `rate` chamadas por segundo.
+        """
+        bucket = TokenBucket(rate=20, capacity=1)
+
+        started = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+
+        # o primeiro token já está disponível; os outros 4 esperam 1/20s cada
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20 * 0.9)
+
+        async def acquire_all():
+            for _ in range(5):
+                await bucket.aacquire()
+
+        # a versão assíncrona segue o mesmo ritmo, sem bloquear o event loop
+        started = time.monotonic()
+        asyncio.run(acquire_all())
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20 * 0.9)
+
+
+@override_settings(FLIGHT_CACHE_TTL=0)
+@patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+# Sem limite de taxa: os testes medem a concorrência, não a cota da Amadeus
+@patch('flights.amadeus_service.get_amadeus_rate_limiter', lambda: TokenBucket(rate=0))
+class AsyncFlightSearchTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeAmadeusServer(latency=0.2).start()
+        amadeus_service.amadeus_client.configure(**self.server.client_options())
+        amadeus_service.async_amadeus_client.reset()
+        self.search_date = (date.today() + timedelta(days=30)).isoformat()
+
+    def tearDown(self):
+        amadeus_service.amadeus_client.configure()
+        amadeus_service.async_amadeus_client.reset()
+        self.server.stop()
+
+    async def test_concurrent_searches_share_one_event_loop(self):
+        """
+        Garante que buscas simultâneas esperam a Amadeus em paralelo, sem threads.
+        """
+        started = time.monotonic()
+        responses = await asyncio.gather(*[
+            amadeus_service.async_search_flights_from_amadeus(
+                'GRU', f"D{i:02d}", self.search_date)
+            for i in range(20)
+        ])
+        elapsed = time.monotonic() - started
+
+        self.assertTrue(all(len(r.data) == 5 for r in responses))
+        # 20 buscas de 200ms cada terminam perto da latência de uma só
+        self.assertLess(elapsed, 0.2 * 20 / 4)
+        self.assertEqual(self.server.counters['token_requests'], 1)
+
+    async def test_async_search_endpoint(self):
+        """
+        Garante que o endpoint assíncrono valida e retorna as opções de voo.
+        """
+        url = reverse('async-search-flights')
+
+        response = await self.async_client.get(
+            url, {'origem': 'GRU', 'destino': 'GIG', 'data': self.search_date})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.json()
+        self.assertEqual(len(body['flight_options']), 5)
+        self.assertEqual(body['flight_options'][0]['carrier'], "GOL LINHAS AEREAS")
+
+        response = await self.async_client.get(url, {'origem': 'GRU'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CheckAlertsStreamingTestCase(APITestCase):
+    def setUp(self):
+        for origin, destination in [("GRU", "GIG"), ("FOR", "GRU")]:
+            PriceAlert.objects.create(
+                user_whatsapp_id=f"{origin}{destination}", origin_code=origin,
+                destination_code=destination, target_price=500)
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_check_alerts_streams_ndjson(self, mock_amadeus_search):
+        """
+        Garante que cada notificação sai em uma linha NDJSON própria.
+        """
+        mock_amadeus_search.return_value = make_sdk_response(["450.35"])
+
+        response = self.client.get(reverse('check-alerts'),
+                                   HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['origin'] for line in lines),
+                         ["FOR", "GRU"])
+        self.assertFalse(PriceAlert.objects.filter(is_active=True).exists())
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_disconnect_keeps_progress_of_sent_routes(self, mock_amadeus_search):
+        """
+        Garante que rotas já enviadas ficam desativadas se o cliente desconectar.
+        """
+        mock_amadeus_search.return_value = make_sdk_response(["450.35"])
+
+        response = self.client.get(reverse('check-alerts'), {'stream': '1'})
+        stream = iter(response.streaming_content)
+        first = json.loads(next(stream))
+        # desconecta depois da primeira linha: a rota dela já foi reservada
+        response.close()
+
+        sent = PriceAlert.objects.get(origin_code=first['origin'])
+        self.assertFalse(sent.is_active)
+        self.assertEqual(PriceAlert.objects.filter(is_active=True).count(), 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', "planos de execução do SQLite")
+class PriceAlertQueryPlanTestCase(TestCase):
+    """
+    Garante que as consultas quentes continuam usando os índices parciais,
+    para que varreduras completas da tabela não voltem sem ninguém perceber.
+    """
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan, plan)
+
+    def test_check_alerts_query_uses_route_index(self):
+        self.assertUsesIndex(active_alerts_by_route(), 'pricealert_active_route_idx')
+
+    def test_route_lookup_uses_route_index(self):
+        queryset = PriceAlert.objects.filter(
+            is_active=True, origin_code="GRU", destination_code="GIG",
+            target_price__gte=450)
+        self.assertUsesIndex(queryset, 'pricealert_active_route_idx')
+
+    def test_dashboard_query_uses_recent_index(self):
+        queryset = AlertsDashboardView().get_queryset()
+        self.assertUsesIndex(queryset, 'pricealert_active_recent_idx')
+
+    def test_dashboard_next_page_uses_recent_index(self):
+        alert = PriceAlert.objects.create(
+            user_whatsapp_id="1", origin_code="GRU", destination_code="GIG",
+            target_price=500)
+        page = KeysetPage(AlertsDashboardView().get_queryset(), encode_cursor(alert))
+        self.assertUsesIndex(page.get_queryset(), 'pricealert_active_recent_idx')
+
+
+@override_settings(DASHBOARD_PAGE_SIZE=2)
+class AlertsDashboardTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            PriceAlert.objects.create(
+                user_whatsapp_id=f"user-{i}", origin_code="GRU",
+                destination_code="GIG", target_price=400 + i)
+
+    def test_dashboard_pages_by_cursor(self):
+        """
+        Garante que a paginação por cursor percorre todos os alertas sem repetir.
+        """
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('dashboard'), {'cursor': cursor} if cursor else {})
+            page = response.context['page']
+            seen.extend(alert.user_whatsapp_id for alert in page.items)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [f"user-{i}" for i in reversed(range(5))])
+        self.assertContains(self.client.get(reverse('dashboard')), "GRU → GIG")
+
+    def test_dashboard_fragments_are_cached_and_invalidated(self):
+        """
+        Garante que o dashboard em cache não consulta o banco e é atualizado
+        quando alertas são criados ou desativados.
+        """
+        self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('dashboard'))
+
+        PriceAlert.objects.create(
+            user_whatsapp_id="novo-usuario", origin_code="FOR",
+            destination_code="GRU", target_price=300)
+        self.assertContains(self.client.get(reverse('dashboard')), "novo-usuario")
+
+        queue_notifications([(alert, Decimal("250.00")) for alert in PriceAlert.objects.filter(
+            user_whatsapp_id="novo-usuario")])
+        self.assertNotContains(self.client.get(reverse('dashboard')), "novo-usuario")
+
+
+@override_settings(FLIGHT_CACHE_TTL=0)
+class PriceHistoryTestCase(APITestCase):
+    def setUp(self):
+        # descarta observações deixadas no buffer por outros testes
+        price_history.flush_observations()
+        PriceObservation.objects.all().delete()
+
+    @patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+    def test_search_records_observation(self):
+        """
+        Garante que cada consulta à Amadeus grava o menor preço observado.
+        """
+        search_date = date.today() + timedelta(days=30)
+        with FakeAmadeusServer() as server:
+            amadeus_service.amadeus_client.configure(**server.client_options())
+            try:
+                response = self.client.get(reverse('search-flights'), {
+                    'origem': 'GRU', 'destino': 'GIG', 'data': search_date.isoformat()})
+            finally:
+                amadeus_service.amadeus_client.configure()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        observation = PriceObservation.objects.get()
+        self.assertEqual(observation.travel_date, search_date)
+        self.assertEqual(str(observation.min_price), "300.00")
+        self.assertEqual(observation.offer_count, 5)
+
+    def test_flush_writes_only_observations_of_its_own_context(self):
+        """
+        Garante que observações de outra thread não são gravadas pelo flush
+        desta, e que as das chamadas em paralelo (fan-out) são.
+        """
+        from .fan_out import iter_concurrent
+
+        travel_date = date.today() + timedelta(days=1)
+        other = threading.Thread(target=price_history.record_observation,
+                                 args=("GRU", "GIG", travel_date, []))
+        other.start()
+        other.join()
+
+        def observe(destination):
+            price_history.record_observation("GRU", destination, travel_date, [])
+
+        list(iter_concurrent(["SSA", "REC"], observe, concurrency=2, timeout=5))
+
+        self.assertEqual(price_history.flush_observations(), 2)
+        self.assertEqual(
+            sorted(PriceObservation.objects.values_list('destination_code', flat=True)),
+            ["REC", "SSA"])
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_check_alerts_answers_from_fresh_observation(self, mock_amadeus_search):
+        """
+        Garante que rotas observadas há pouco não são consultadas de novo.
+        """
+        PriceAlert.objects.create(
+            user_whatsapp_id="1", origin_code="GRU", destination_code="GIG",
+            target_price=450)
+        PriceObservation.objects.create(
+            origin_code="GRU", destination_code="GIG",
+            travel_date=date.today() + timedelta(days=1),
+            min_price="399.90", offer_count=3)
+
+        response = self.client.get(reverse('check-alerts'))
+
+        mock_amadeus_search.assert_not_called()
+        self.assertEqual(response.data['notifications_to_send'][0]['found_price'], "399.90")
+
+    def test_prune_command_downsamples_and_expires(self):
+        """
+        Garante que observações antigas são apagadas e as intermediárias reduzidas.
+        """
+        now = timezone.now()
+        travel_date = date.today()
+        ten_days_ago = now - timedelta(days=10)
+        for hours, price in [(0, "500.00"), (1, "420.00"), (2, "610.00")]:
+            PriceObservation.objects.create(
+                origin_code="GRU", destination_code="GIG", travel_date=travel_date,
+                observed_at=ten_days_ago.replace(hour=hours), min_price=price,
+                offer_count=5)
+        PriceObservation.objects.create(
+            origin_code="GRU", destination_code="GIG", travel_date=travel_date,
+            observed_at=now - timedelta(days=200), min_price="100.00")
+        PriceObservation.objects.create(
+            origin_code="GRU", destination_code="GIG", travel_date=travel_date,
+            min_price="450.00")
+
+        call_command('prune_price_observations', keep_days=90,
+                     downsample_after_days=7, stdout=io.StringIO())
+
+        prices = sorted(str(p) for p in PriceObservation.objects.values_list('min_price', flat=True))
+        self.assertEqual(prices, ["420.00", "450.00"])
+
+
+class AlertMatchingTestCase(APITestCase):
+    """Disparo dos alertas a partir dos preços vistos nas buscas."""
+
+    def setUp(self):
+        matching_index.reset()
+
+    def test_index_matches_by_target_price(self):
+        index = AlertMatchingIndex()
+        for i, target in enumerate([300, 450, 500, 700]):
+            PriceAlert.objects.create(user_whatsapp_id=str(i), origin_code="GRU",
+                                      destination_code="GIG", target_price=target)
+        index.sync(force=True)
+
+        cheap = PriceAlert.objects.get(target_price=300)
+        self.assertEqual(len(index.match("GRU", "GIG", Decimal("500.00"))), 2)
+        self.assertEqual(len(index.match("GRU", "GIG", Decimal("250.00"))), 4)
+        self.assertEqual(index.match("GIG", "GRU", Decimal("250.00")), [])
+
+        # Desativações saem do índice
+        index.discard([cheap.pk])
+        self.assertEqual(len(index.match("GRU", "GIG", Decimal("250.00"))), 3)
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_search_triggers_alerts_and_queues_notifications(self, mock_amadeus_search):
+        PriceAlert.objects.create(user_whatsapp_id="1", origin_code="GRU",
+                                  destination_code="GIG", target_price=500)
+        # Criado depois da carga do índice, entra pelo sinal post_save
+        matching_index.sync(force=True)
+        PriceAlert.objects.create(user_whatsapp_id="2", origin_code="GRU",
+                                  destination_code="GIG", target_price=200)
+        mock_amadeus_search.return_value = make_sdk_response(["450.00", "620.00"])
+
+        response = self.client.get(reverse('search-flights'), {
+            'origem': 'GRU', 'destino': 'GIG',
+            'data': (date.today() + timedelta(days=30)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(PriceAlert.objects.filter(is_active=True).count(), 1)
+        notification = AlertNotification.objects.get()
+        self.assertEqual(notification.user_whatsapp_id, "1")
+        self.assertEqual(notification.found_price, Decimal("450.00"))
+
+        # A notificação enfileirada sai uma única vez pelo check-alerts
+        mock_amadeus_search.return_value = make_sdk_response(["900.00"])
+        response = self.client.get(reverse('check-alerts'))
+        self.assertEqual(response.data['notifications_to_send'], [notification.as_notification()])
+        response = self.client.get(reverse('check-alerts'))
+        self.assertEqual(response.data['notifications_to_send'], [])
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_alert_created_by_the_api_is_triggered_by_the_next_search(self, mock_amadeus_search):
+        """
+        Garante que um alerta criado pela API entra no índice na hora, sem
+        esperar a próxima sincronização (bulk_create não dispara sinais).
+        """
+        matching_index.sync(force=True)
+        response = self.client.post(reverse('create-alert'), {
+            'user_whatsapp_id': '5585999998888', 'origin_code': 'GRU',
+            'destination_code': 'GIG', 'target_price': '500.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_amadeus_search.return_value = make_sdk_response(["100.00"])
+
+        self.client.get(reverse('search-flights'), {
+            'origem': 'GRU', 'destino': 'GIG',
+            'data': (date.today() + timedelta(days=30)).isoformat()})
+
+        notification = AlertNotification.objects.get()
+        self.assertEqual(notification.user_whatsapp_id, '5585999998888')
+        self.assertEqual(notification.found_price, Decimal("100.00"))
+        self.assertFalse(PriceAlert.objects.filter(is_active=True).exists())
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_search_without_match_skips_database(self, mock_amadeus_search):
+        PriceAlert.objects.create(user_whatsapp_id="1", origin_code="GRU",
+                                  destination_code="GIG", target_price=100)
+        matching_index.sync(force=True)
+        mock_amadeus_search.return_value = make_sdk_response(["450.00"])
+
+        # Preço acima dos alvos: o índice em memória resolve sem consultar o banco
+        with self.assertNumQueries(0):
+            self.client.get(reverse('search-flights'), {
+                'origem': 'GRU', 'destino': 'GIG',
+                'data': (date.today() + timedelta(days=30)).isoformat()})
+
+
+class OffersParsingTestCase(TestCase):
+    """Parse das ofertas em FlightOption e serialização da resposta."""
+
+    def make_response(self):
+        outbound = {
+            "duration": "PT1H30M",
+            "segments": [{
+                "departure": {"iataCode": "GRU", "at": "2026-11-20T08:00:00"},
+                "arrival": {"iataCode": "GIG", "at": "2026-11-20T09:30:00"},
+                "carrierCode": "G3",
+            }],
+        }
+        inbound = {
+            "duration": "PT3H10M",
+            "segments": [
+                {"departure": {"iataCode": "GIG", "at": "2026-11-27T18:00:00"},
+                 "arrival": {"iataCode": "BSB", "at": "2026-11-27T19:45:00"},
+                 "carrierCode": "LA"},
+                {"departure": {"iataCode": "BSB", "at": "2026-11-27T20:30:00"},
+                 "arrival": {"iataCode": "GRU", "at": "2026-11-27T21:10:00"},
+                 "carrierCode": "LA"},
+            ],
+        }
+        response = MagicMock()
+        response.data = [
+            {"itineraries": [outbound, inbound], "price": {"total": "720.10"}},
+            {"itineraries": [], "price": {"total": "100.00"}},
+        ]
+        response.dictionaries = {"carriers": {"G3": "GOL", "LA": "LATAM"}}
+        return response
+
+    def test_parses_every_itinerary_and_skips_malformed_offers(self):
+        with self.assertLogs('flights.offers', level='WARNING'):
+            options = parse_amadeus_response(self.make_response())
+
+        self.assertEqual(len(options), 1)
+        option = options[0]
+        self.assertIsInstance(option, FlightOption)
+        self.assertEqual((option.origin, option.destination, option.carrier, option.price),
+                         ("GRU", "GIG", "GOL", "720.10"))
+        self.assertEqual(len(option.return_itineraries), 1)
+        inbound = option.return_itineraries[0]
+        self.assertEqual((inbound.origin, inbound.destination, inbound.stops, inbound.carrier),
+                         ("GIG", "GRU", 1, "LATAM"))
+
+    def test_fast_renderer_matches_drf_encoder(self):
+        with self.assertLogs('flights.offers', level='WARNING'):
+            options = parse_amadeus_response(self.make_response())
+        data = {"flight_options": options, "price": Decimal("720.10")}
+
+        fast = FastJSONRenderer().render(data, 'application/json', {})
+        with patch.object(renderers, 'orjson', None):
+            fallback = FastJSONRenderer().render(data, 'application/json', {})
+
+        self.assertEqual(json.loads(fast), json.loads(fallback))
+        self.assertEqual(json.loads(fast)['flight_options'][0]['return_itineraries'][0]['arrival_time'],
+                         "2026-11-27T21:10:00")
+
+
+class FlightCalendarTestCase(APITestCase):
+    """Calendário de preços por dia de uma rota."""
+
+    def setUp(self):
+        offer_cache.clear()
+        metrics.registry.reset()
+        self.start = date.today() + timedelta(days=10)
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_calendar_returns_cheapest_per_day_and_best_offer(self, mock_amadeus_search):
+        prices = {0: ["500.00", "480.00"], 1: ["350.00"], 2: []}
+
+        def search(origin, destination, day):
+            time.sleep(0.2)
+            offset = (date.fromisoformat(day) - self.start).days
+            if offset == 3:
+                raise RuntimeError("upstream indisponível")
+            return make_sdk_response(prices[offset])
+        mock_amadeus_search.side_effect = search
+
+        started = time.monotonic()
+        response = self.client.get(reverse('search-calendar'), {
+            'origem': 'GRU', 'destino': 'GIG',
+            'data_inicio': self.start.isoformat(),
+            'data_fim': (self.start + timedelta(days=3)).isoformat()})
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Os 4 dias são consultados em paralelo
+        self.assertLess(elapsed, 0.2 * 4 / 2)
+        calendar = response.data['calendar']
+        self.assertEqual([day['cheapest_price'] for day in calendar],
+                         ["480.00", "350.00", None, None])
+        self.assertIn('error', calendar[3])
+        self.assertEqual(response.data['best_offer']['date'],
+                         (self.start + timedelta(days=1)).isoformat())
+        self.assertEqual(response.data['best_offer']['price'], "350.00")
+
+    @override_settings(FLIGHT_CACHE_TTL=300)
+    @patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+    @patch('flights.amadeus_service.get_amadeus_rate_limiter')
+    @patch('flights.amadeus_service.amadeus_client')
+    def test_calendar_reuses_cached_days(self, mock_client, mock_limiter):
+        search = mock_client.get_client.return_value.shopping.flight_offers_search.get
+        search.return_value = make_sdk_response(["450.35"])
+        params = {'origem': 'GRU', 'destino': 'GIG', 'data': self.start.isoformat(), 'dias': 1}
+
+        self.client.get(reverse('search-flights'), {
+            'origem': 'GRU', 'destino': 'GIG', 'data': self.start.isoformat()})
+        response = self.client.get(reverse('search-calendar'), params)
+        self.client.get(reverse('search-calendar'), params)
+
+        self.assertEqual(len(response.data['calendar']), 3)
+        # O dia central já estava no cache da busca anterior, e o segundo
+        # calendário vem todo do cache
+        self.assertEqual(search.call_count, 3)
+        # Só as chamadas à Amadeus gastam a cota, não os dias do cache
+        self.assertEqual(mock_limiter.return_value.acquire.call_count, 3)
+
+    def test_calendar_rejects_invalid_periods(self):
+        url = reverse('search-calendar')
+        past = (date.today() - timedelta(days=5)).isoformat()
+        too_long = {'data_inicio': self.start.isoformat(),
+                    'data_fim': (self.start + timedelta(days=60)).isoformat()}
+
+        # Períodos fora das datas representáveis também são um 400, não um 500
+        overflows = [{'data': self.start.isoformat(), 'dias': '1000000000'},
+                     {'data': '9999-12-31', 'dias': '1'}]
+
+        for params in [{}, {'data': 'amanhã'}, {'data_inicio': past, 'data_fim': past}, too_long,
+                       *overflows]:
+            response = self.client.get(url, {'origem': 'GRU', 'destino': 'GIG', **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FlightBatchSearchTestCase(APITestCase):
+    """Busca em lote de várias consultas independentes."""
+
+    def setUp(self):
+        self.day = (date.today() + timedelta(days=20)).isoformat()
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_batch_dedupes_and_runs_queries_concurrently(self, mock_amadeus_search):
+        def search(origin, destination, day):
+            time.sleep(0.2)
+            if destination == "XXX":
+                raise RuntimeError("upstream indisponível")
+            return make_sdk_response(["450.35"] if destination == "GIG" else [])
+        mock_amadeus_search.side_effect = search
+
+        queries = [
+            {'origem': 'GRU', 'destino': 'GIG', 'data': self.day},
+            {'origem': 'gru', 'destino': 'gig', 'data': self.day},
+            {'origem': 'GRU', 'destino': 'SSA', 'data': self.day},
+            {'origem': 'GRU', 'destino': 'XXX', 'data': self.day},
+            {'origem': 'GRU', 'destino': 'GIG', 'data': '2020-01-01'},
+        ]
+        started = time.monotonic()
+        response = self.client.post(reverse('search-batch'), {'queries': queries}, format='json')
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         [200, 200, 404, 500, 400])
+        self.assertEqual(response.data['results'][1]['query'], queries[1])
+        # GRU->GIG repetida é consultada uma vez; as 3 distintas em paralelo
+        self.assertEqual(mock_amadeus_search.call_count, 3)
+        self.assertLess(elapsed, 0.2 * 3 / 2)
+
+    def test_batch_rejects_missing_or_oversized_lists(self):
+        url = reverse('search-batch')
+        query = {'origem': 'GRU', 'destino': 'GIG', 'data': self.day}
+
+        with override_settings(BATCH_SEARCH_MAX_QUERIES=2):
+            for body in [{}, {'queries': []}, {'queries': [query] * 3}]:
+                response = self.client.post(url, body, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchCoalescingTestCase(TestCase):
+    """Buscas idênticas simultâneas compartilham uma única chamada à Amadeus."""
+
+    def setUp(self):
+        offer_cache.clear()
+        metrics.registry.reset()
+
+    @patch('flights.amadeus_service._fetch_flight_offers')
+    def test_concurrent_misses_share_one_fetch(self, mock_fetch):
+        started = threading.Event()
+
+        def slow_fetch(*args):
+            started.set()
+            time.sleep(0.3)
+            return ([{'price': {'total': '100.00'}}], {})
+        mock_fetch.side_effect = slow_fetch
+
+        results = []
+
+        def search():
+            results.append(amadeus_service.search_flights_from_amadeus('GRU', 'GIG', '2025-11-20'))
+
+        threads = [threading.Thread(target=search) for _ in range(5)]
+        threads[0].start()
+        started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual([r.data[0]['price']['total'] for r in results], ['100.00'] * 5)
+        self.assertEqual(offer_cache.get_stats()['coalesced'], 4)
+
+    @patch('flights.amadeus_service._fetch_flight_offers')
+    def test_waits_for_the_fetch_of_another_worker(self, mock_fetch):
+        params = {**amadeus_service.DEFAULT_SEARCH_PARAMS}
+        key = offer_cache.make_key('FOR', 'GRU', '2025-11-20', params)
+        cache = offer_cache._get_cache()
+
+        # Outro worker segura a trava e grava a entrada pouco depois
+        cache.add(f"{key}:fetching", 1)
+        writer = threading.Timer(0.2, offer_cache.store,
+                                 args=(key, [{'price': {'total': '80.00'}}], {}))
+        writer.start()
+
+        response = amadeus_service.search_flights_from_amadeus('FOR', 'GRU', '2025-11-20')
+        writer.join()
+
+        mock_fetch.assert_not_called()
+        self.assertEqual(response.data[0]['price']['total'], '80.00')
+        self.assertEqual(offer_cache.get_stats()['coalesced_remote'], 1)
+
+
+class CircuitBreakerTestCase(APITestCase):
+    """Circuit breaker da Amadeus e fallback com a última resposta conhecida."""
+
+    def upstream_error(self):
+        raise RuntimeError("upstream indisponível")
+
+    def test_opens_on_error_rate_and_recovers_after_probe(self):
+        breaker = CircuitBreaker('teste', failure_rate=0.5, min_calls=4, open_duration=0.2)
+
+        breaker.call(lambda: 'ok')
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                breaker.call(self.upstream_error)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Aberto: falha na hora, sem chamar a função
+        upstream = MagicMock()
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(upstream)
+        upstream.assert_not_called()
+
+        # Meio-aberto: uma chamada de teste que falha reabre o circuito
+        time.sleep(0.25)
+        with self.assertRaises(RuntimeError):
+            breaker.call(self.upstream_error)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.25)
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker('teste', slow_call_rate=0.5, slow_call_duration=0.05, min_calls=2)
+        for _ in range(2):
+            breaker.call(lambda: time.sleep(0.06))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    @override_settings(FLIGHT_CACHE_TTL=60)
+    @patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+    @patch('flights.amadeus_service.amadeus_client')
+    def test_open_circuit_serves_last_known_result_as_stale(self, mock_client):
+        offer_cache.clear()
+        metrics.registry.reset()
+        breaker = CircuitBreaker('teste', min_calls=1, open_duration=60)
+        search = mock_client.get_client.return_value.shopping.flight_offers_search.get
+        search.return_value = make_sdk_response(["450.35"])
+        PriceAlert.objects.create(user_whatsapp_id="1", origin_code="GRU",
+                                  destination_code="GIG", target_price=500)
+        url = reverse('search-flights')
+        params = {'origem': 'GRU', 'destino': 'GIG',
+                  'data': (date.today() + timedelta(days=30)).isoformat()}
+
+        with patch('flights.amadeus_service.get_amadeus_breaker', return_value=breaker), \
+                patch('flights.alert_matching.trigger_matching_alerts') as trigger:
+            self.client.get(url, params)
+
+            # A entrada vence e a Amadeus cai: a falha abre o circuito
+            key = offer_cache.make_key('GRU', 'GIG', params['data'],
+                                       amadeus_service.DEFAULT_SEARCH_PARAMS)
+            cache = offer_cache._get_cache()
+            cache.set(key, {**cache.get(key), 'fetched_at': time.time() - 3600})
+            search.side_effect = RuntimeError("upstream indisponível")
+            self.client.get(url, params)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+            trigger.reset_mock()
+            response = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['stale'])
+        self.assertEqual(search.call_count, 2)
+        self.assertEqual(offer_cache.get_stats()['fallbacks'], 1)
+        # Preço antigo não dispara alertas
+        trigger.assert_not_called()
+        self.assertTrue(PriceAlert.objects.get().is_active)
+
+
+@override_settings(ALERT_SCHEDULER_MIN_INTERVAL=300, ALERT_SCHEDULER_MAX_INTERVAL=21600,
+                   PRICE_OBSERVATION_MAX_AGE=0)
+class AlertSchedulerTestCase(TestCase):
+    """Agenda adaptativa da verificação dos alertas por rota."""
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def create_alert(self, origin, destination, target_price):
+        return PriceAlert.objects.create(user_whatsapp_id=f"{origin}{destination}",
+                                         origin_code=origin, destination_code=destination,
+                                         target_price=target_price)
+
+    def test_budget_goes_to_routes_closest_to_firing(self):
+        for origin in ["AAA", "BBB", "CCC"]:
+            self.create_alert(origin, "GIG", 500)
+        # Já verificadas: AAA e CCC longe do alvo, BBB quase lá
+        for origin, last_price in [("AAA", 900), ("BBB", 510), ("CCC", 800)]:
+            RouteSchedule.objects.create(origin_code=origin, destination_code="GIG",
+                                         last_price=last_price, volatility=0.05,
+                                         next_check_at=self.now)
+        searched = []
+
+        def search(origin, destination, day):
+            searched.append(origin)
+            return make_sdk_response(["490.00"])
+
+        stats = scheduler.run_cycle('2025-11-20', search, budget=1, now=self.now)
+
+        self.assertEqual(searched, ["BBB"])
+        self.assertEqual((stats['due'], stats['checked'], stats['triggered']), (3, 1, 1))
+        # O alerta disparado vai para a fila do check-alerts
+        self.assertEqual(AlertNotification.objects.get().origin_code, "BBB")
+        # As rotas não verificadas continuam vencidas para o próximo ciclo
+        self.assertEqual(RouteSchedule.objects.filter(next_check_at__lte=self.now).count(), 2)
+
+    def test_interval_adapts_to_volatility_and_distance(self):
+        self.create_alert("GRU", "GIG", 500)
+        self.create_alert("FOR", "GRU", 500)
+        calm = RouteSchedule(origin_code="GRU", destination_code="GIG",
+                             last_price=Decimal("2000"), volatility=0.01)
+        volatile = RouteSchedule(origin_code="FOR", destination_code="GRU",
+                                 last_price=Decimal("1000"), volatility=0.01)
+
+        scheduler.update_schedule(calm, Decimal("2000"), Decimal("500"), self.now)
+        scheduler.update_schedule(volatile, Decimal("600"), Decimal("500"), self.now)
+
+        calm_interval = (calm.next_check_at - self.now).total_seconds()
+        volatile_interval = (volatile.next_check_at - self.now).total_seconds()
+        self.assertEqual(calm_interval, 21600)
+        self.assertGreater(volatile.volatility, calm.volatility)
+        self.assertLess(volatile_interval, calm_interval / 10)
+
+    def test_command_runs_a_single_cycle(self):
+        self.create_alert("GRU", "GIG", 500)
+        out = io.StringIO()
+
+        with patch('flights.management.commands.run_alert_scheduler.search_flights_from_amadeus',
+                   return_value=make_sdk_response(["800.00"])):
+            call_command('run_alert_scheduler', '--once', stdout=out)
+
+        schedule = RouteSchedule.objects.get()
+        self.assertEqual(schedule.last_price, Decimal("800.00"))
+        self.assertGreater(schedule.next_check_at, schedule.last_checked_at)
+        self.assertIn("1 de 1 rotas", out.getvalue())
+
+
+@override_settings(FLIGHT_CACHE_TTL=0, PRICE_OBSERVATION_MAX_AGE=0)
+class ShardedAlertCheckTestCase(APITestCase):
+    """Verificação de alertas dividida entre vários workers."""
+
+    ROUTES = [("GRU", "GIG"), ("FOR", "GRU"), ("MAD", "BCN"), ("LIS", "OPO"), ("JFK", "MIA")]
+
+    def setUp(self):
+        for origin, destination in self.ROUTES:
+            PriceAlert.objects.create(user_whatsapp_id=f"{origin}{destination}",
+                                      origin_code=origin, destination_code=destination,
+                                      target_price=500)
+
+    def search(self, origin, destination, day):
+        return make_sdk_response(["450.35"])
+
+    def test_concurrent_checks_notify_each_alert_once(self):
+        """
+        Garante que duas verificações simultâneas não notificam o mesmo alerta.
+        """
+        first = stream_active_alerts('2025-11-20', self.search)
+        # o primeiro worker já leu os alertas e enviou a primeira rota
+        notified = [next(first)['origin']]
+
+        # outro worker verifica tudo enquanto o primeiro está no meio
+        notified += [n['origin'] for n in check_active_alerts('2025-11-20', self.search)]
+        notified += [n['origin'] for n in first]
+
+        self.assertEqual(sorted(notified), sorted(origin for origin, _ in self.ROUTES))
+        self.assertFalse(PriceAlert.objects.filter(is_active=True).exists())
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_shards_split_routes_between_workers(self, mock_amadeus_search):
+        """
+        Garante que cada rota é verificada por exatamente uma fração.
+        """
+        mock_amadeus_search.side_effect = self.search
+        searched = []
+        for shard in range(3):
+            response = self.client.get(reverse('check-alerts'), {'shard': shard, 'shards': 3})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            searched.append({call.args[0] for call in mock_amadeus_search.call_args_list})
+            mock_amadeus_search.reset_mock()
+
+        self.assertEqual(sum(len(origins) for origins in searched), len(self.ROUTES))
+        self.assertEqual(set().union(*searched), {origin for origin, _ in self.ROUTES})
+
+        response = self.client.get(reverse('check-alerts'), {'shard': 3, 'shards': 3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_schedulers_claim_distinct_routes(self):
+        """
+        Garante que dois schedulers com a mesma lista de rotas vencidas
+        reservam rotas diferentes.
+        """
+        now = timezone.now()
+        scheduler.sync_route_schedules(self.ROUTES, now)
+        due = list(RouteSchedule.objects.order_by('pk'))
+
+        first = scheduler.claim_due_schedules(due, 3, now)
+        # o segundo leu a mesma lista antes da reserva do primeiro
+        second = scheduler.claim_due_schedules(due, 3, now)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({s.pk for s in first} & {s.pk for s in second})
+        self.assertFalse(RouteSchedule.objects.filter(next_check_at__lte=now).exists())
+
+
+@override_settings(FLIGHT_CACHE_TTL=0, METRICS_DIR='')
+@patch('flights.amadeus_service.USE_MOCK_AMADEUS', False)
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.server = FakeAmadeusServer().start()
+        amadeus_service.amadeus_client.configure(**self.server.client_options())
+
+    def tearDown(self):
+        amadeus_service.amadeus_client.configure()
+        self.server.stop()
+
+    def test_metrics_expose_request_upstream_and_parse_timings(self):
+        """
+        Garante que a busca aparece no /metrics: latência da rota, chamada à
+        Amadeus e parse das ofertas.
+        """
+        travel_date = (date.today() + timedelta(days=30)).isoformat()
+        response = self.client.get(reverse('search-flights'),
+                                   {'origem': 'GRU', 'destino': 'GIG', 'data': travel_date})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count'
+                      '{method="GET",route="api/v1/search-flights/",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_bucket'
+                      '{method="GET",route="api/v1/search-flights/",status="200",le="+Inf"} 1', body)
+        self.assertIn('amadeus_requests_total{operation="flight_offers",outcome="ok"} 1', body)
+        self.assertIn('offers_parse_duration_seconds_count 1', body)
+        self.assertIn('# TYPE flight_cache_hit_ratio gauge', body)
+
+    def test_metrics_are_summed_across_workers(self):
+        """
+        Garante que o /metrics soma os retratos gravados por todos os workers.
+        """
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        labels = {'operation': 'flight_offers', 'outcome': 'ok'}
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            other_worker = metrics.MetricsRegistry(worker_id='outro-worker')
+            other_worker.inc('amadeus_requests_total', labels, 2)
+            other_worker.observe('amadeus_request_duration_seconds', 0.02, {'operation': 'flight_offers'})
+            other_worker.flush(force=True)
+
+            metrics.inc('amadeus_requests_total', labels)
+            metrics.observe('amadeus_request_duration_seconds', 3.0, {'operation': 'flight_offers'})
+            body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('amadeus_requests_total{operation="flight_offers",outcome="ok"} 3', body)
+        self.assertIn('amadeus_request_duration_seconds_bucket'
+                      '{operation="flight_offers",le="0.025"} 1', body)
+        self.assertIn('amadeus_request_duration_seconds_count{operation="flight_offers"} 2', body)
+        self.assertEqual(sorted(os.listdir(metrics_dir)),
+                         sorted(['outro-worker.json', f'{os.getpid()}.json']))
+
+    def test_json_logs_carry_extra_fields(self):
+        """
+        Garante que os campos de `extra` viram chaves do log em JSON.
+        """
+        record = logging.makeLogRecord({
+            'name': 'flights.alert_service', 'levelname': 'WARNING',
+            'msg': "Erro ao verificar a rota", 'origin': 'GRU', 'destination': 'GIG'})
+
+        event = json.loads(JSONFormatter().format(record))
+
+        self.assertEqual(event['message'], "Erro ao verificar a rota")
+        self.assertEqual((event['origin'], event['destination']), ('GRU', 'GIG'))
+        self.assertEqual(event['level'], 'WARNING')
+
+
+class ImportTimeBudgetTestCase(TestCase):
+    """Orçamento de tempo de importação das URLs (e com elas, das views)."""
+
+    # Dependências pesadas carregadas só quando usadas
+    LAZY_MODULES = {'openai', 'amadeus', 'httpx'}
+    # Tempo cumulativo máximo de `import config.urls`, em milissegundos
+    BUDGET_MS = int(os.getenv('IMPORT_TIME_BUDGET_MS', '750'))
+
+    def test_urls_import_within_budget(self):
+        """
+        Garante que importar as views não carrega SDKs pesados nem passa do orçamento.
+        """
+        code = "import django; django.setup(); import config.urls"
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'},
+            capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        # Linhas "import time: <próprio> | <cumulativo> | <módulo>"
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, total, name = line[len('import time:'):].split('|')
+                if total.strip().isdigit():
+                    cumulative[name.strip()] = int(total) / 1000
+
+        self.assertFalse(self.LAZY_MODULES & set(cumulative))
+        self.assertLess(cumulative['config.urls'], self.BUDGET_MS)
+
+
+class PriceAlertBulkCreateTestCase(APITestCase):
+    def alert(self, user_id, origin, destination, target):
+        return {'user_whatsapp_id': user_id, 'origin_code': origin,
+                'destination_code': destination, 'target_price': target}
+
+    def test_bulk_create_ignores_duplicates(self):
+        """
+        Garante que o lote é inserido de uma vez e que alertas ativos
+        repetidos (no lote ou já cadastrados) não são criados de novo.
+        """
+        PriceAlert.objects.create(user_whatsapp_id="1", origin_code="GRU",
+                                  destination_code="GIG", target_price=400)
+        alerts = [
+            self.alert("1", "GRU", "GIG", "400.00"),  # já cadastrado
+            self.alert("1", "GIG", "GRU", "350.00"),
+            self.alert("1", "GIG", "GRU", "350"),  # repetido no lote
+            self.alert("2", "GRU", "GIG", "400.00"),
+        ]
+
+        # SELECT dos alertas existentes + transação com um único INSERT
+        # + SELECT dos alertas novos para o índice de disparo
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('create-alerts'), {'alerts': alerts},
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['criados'], response.data['ignorados']), (2, 2))
+        self.assertEqual(PriceAlert.objects.filter(is_active=True).count(), 3)
+
+        # Um alerta inativo (já disparado) não impede criar o mesmo de novo
+        PriceAlert.objects.filter(user_whatsapp_id="2").update(is_active=False)
+        response = self.client.post(reverse('create-alert'), alerts[3], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PriceAlert.objects.filter(user_whatsapp_id="2").count(), 2)
+
+    def test_bulk_create_is_all_or_nothing(self):
+        """
+        Garante que um item inválido rejeita o lote inteiro, com os erros por item.
+        """
+        alerts = [self.alert("1", "GRU", "GIG", "400.00"),
+                  self.alert("1", "GRU", "GIG", "preço")]
+
+        response = self.client.post(reverse('create-alerts'), {'alerts': alerts}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['erros'][0], {})
+        self.assertIn('target_price', response.data['erros'][1])
+        self.assertFalse(PriceAlert.objects.exists())
+
+    def test_duplicate_alert_retry_is_idempotent(self):
+        """
+        Garante que o retry de um /create-alert/ não cria um segundo alerta
+        ativo, e que a constraint barra inserções diretas repetidas.
+        """
+        data = self.alert("5585999998888", "FOR", "GRU", "500.00")
+        for _ in range(2):
+            response = self.client.post(reverse('create-alert'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PriceAlert.objects.count(), 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PriceAlert.objects.create(user_whatsapp_id="5585999998888", origin_code="FOR",
+                                      destination_code="GRU", target_price=500)
+
+
+class StubLLMClient:
+    """Cliente da OpenAI falso: devolve sempre a mesma resposta e conta as chamadas."""
+
+    def __init__(self, content):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.content = content
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+class UnderstandMessageTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_common_phrasings_skip_the_llm(self):
+        """
+        Garante que as frases comuns são resolvidas pelas regras locais, sem o modelo.
+        """
+        today = date.today()
+        next_november_20 = date(today.year, 11, 20)
+        if next_november_20 < today:
+            next_november_20 = date(today.year + 1, 11, 20)
+        expected = [
+            ("Quero passagem de Fortaleza para GRU amanhã", 'search_flight',
+             {'origin': 'FOR', 'destination': 'GRU',
+              'departure_date': (today + timedelta(days=1)).isoformat()}),
+            ("voos pra São Paulo saindo de Recife dia 20/11", 'search_flight',
+             {'origin': 'REC', 'destination': 'SAO',
+              'departure_date': next_november_20.isoformat()}),
+            ("me avise quando FOR-GRU ficar abaixo de R$ 1.250,50", 'create_alert',
+             {'origin': 'FOR', 'destination': 'GRU', 'target_price': 1250.5}),
+            ("Olá, tudo bem?", 'greeting', {}),
+        ]
+        client = StubLLMClient('{}')
+
+        with patch.object(intent_parser, 'get_llm_client', return_value=client):
+            for message, intent, entities in expected:
+                response = self.client.post(reverse('understand-message'),
+                                            {'message': message}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['source'], 'rules')
+                self.assertEqual(response.data['intent'], intent)
+                self.assertEqual({field: response.data['entities'][field] for field in entities},
+                                 entities)
+
+        self.assertEqual(client.calls, [])
+
+    def test_ambiguous_message_uses_cached_llm_answer(self):
+        """
+        Garante que mensagens ambíguas vão para o modelo uma única vez: a
+        mesma mensagem, com outra caixa, acentos ou espaços, vem do cache.
+        """
+        client = StubLLMClient(json.dumps({
+            'intent': 'search_flight',
+            'entities': {'origin': 'SAO', 'destination': 'RIO', 'departure_date': None},
+        }))
+
+        with patch.object(intent_parser, 'get_llm_client', return_value=client):
+            first = self.client.post(reverse('understand-message'),
+                                     {'message': "Quero ir de SP pro Rio na próxima sexta"},
+                                     format='json')
+            second = self.client.post(reverse('understand-message'),
+                                      {'message': "quero ir de sp  pro rio na proxima sexta"},
+                                      format='json')
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual((first.data['source'], second.data['source']), ('llm', 'cache'))
+        self.assertEqual(second.data['entities'],
+                         {'origin': 'SAO', 'destination': 'RIO', 'departure_date': None,
+                          'target_price': None})
+
+    def test_llm_failure_returns_503_and_is_not_cached(self):
+        """
+        Garante que uma resposta inválida do modelo vira 503 e não fica no cache.
+        """
+        client = StubLLMClient("isto não é JSON")
+        url = reverse('understand-message')
+
+        with patch.object(intent_parser, 'get_llm_client', return_value=client):
+            for _ in range(2):
+                response = self.client.post(url, {'message': "e aquela viagem?"}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(len(client.calls), 2)
+
+            response = self.client.post(url, {'message': "   "}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AirportIndexTestCase(APITestCase):
+    def test_index_lookup_prefix_and_fuzzy(self):
+        """
+        Garante a busca exata (sem acentos e caixa), a expansão da cidade nos
+        seus aeroportos, a busca por prefixo e a aproximada.
+        """
+        index = airport_index()
+
+        self.assertEqual(index.lookup("São Paulo"), ('GRU', 'CGH', 'VCP'))
+        self.assertEqual(index.lookup("SAO PAULO"), ('GRU', 'CGH', 'VCP'))
+        self.assertEqual(index.lookup("Campinas"), ('VCP',))
+        self.assertEqual(index.lookup("sao"), ('GRU', 'CGH', 'VCP'))
+        self.assertEqual(index.resolve("São Paulo"), 'SAO')
+        self.assertEqual(index.resolve("Galeão"), 'GIG')
+        self.assertEqual(index.resolve("gru"), 'GRU')
+        self.assertIsNone(index.resolve("Cidade Inexistente"))
+        # Nomes curtos não viram códigos: três letras passam como código se
+        # vierem em maiúsculas ou não forem o começo de um nome conhecido
+        self.assertEqual(index.resolve("Foz"), 'IGU')
+        self.assertIsNone(index.resolve("Cur"))
+        self.assertEqual(index.resolve("xyz"), 'XYZ')
+        self.assertEqual(index.resolve("SAN"), 'SAN')
+        self.assertEqual(index.resolve("MAN"), 'MAN')
+        self.assertEqual(index.resolve("CUR"), 'CUR')
+
+        self.assertIn('FLN', [airport.iata for airport in index.search("flor")])
+        self.assertEqual([airport.iata for airport in index.search("Florianoplis")], ['FLN'])
+
+    @patch('flights.views.search_flights_from_amadeus')
+    def test_search_accepts_city_names(self, mock_amadeus_search):
+        """
+        Garante que a busca aceita o nome da cidade no lugar do código IATA e
+        sugere locais parecidos para um nome desconhecido.
+        """
+        mock_amadeus_search.return_value = make_sdk_response(["450.35"])
+        travel_date = (date.today() + timedelta(days=10)).isoformat()
+
+        response = self.client.get(reverse('search-flights'), {
+            'origem': 'Fortaleza', 'destino': 'são paulo', 'data': travel_date})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_amadeus_search.assert_called_once_with('FOR', 'SAO', travel_date)
+
+        response = self.client.get(reverse('search-flights'), {
+            'origem': 'Fortalesa', 'destino': 'GRU', 'data': travel_date})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("FOR (Fortaleza)", response.data['erro'])
+
+    def test_alerts_and_autocomplete_accept_city_names(self):
+        """
+        Garante que o alerta guarda o código da cidade informada pelo nome e
+        que o autocompletar lista todos os aeroportos da cidade.
+        """
+        response = self.client.post(reverse('create-alert'), {
+            'user_whatsapp_id': '5585999998888', 'origin_code': 'Fortaleza',
+            'destination_code': 'Rio de Janeiro', 'target_price': '400.00'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        alert = PriceAlert.objects.get()
+        self.assertEqual((alert.origin_code, alert.destination_code), ('FOR', 'RIO'))
+
+        response = self.client.get(reverse('airports'), {'q': 'sao paulo'})
+
+        self.assertEqual(response.data['codigo_busca'], 'SAO')
+        self.assertEqual([airport['iata'] for airport in response.data['aeroportos']],
+                         ['GRU', 'CGH', 'VCP'])
+
+
+@override_settings(NOTIFICATION_RETRY_BASE_SECONDS=30, NOTIFICATION_MAX_ATTEMPTS=3)
+class NotificationDeliveryTestCase(APITestCase):
+    def setUp(self):
+        self.server = FakeWebhookServer().start()
+        self.settings_override = override_settings(NOTIFICATION_WEBHOOK_URL=self.server.url)
+        self.settings_override.enable()
+        self.http = notification_delivery.webhook_client()
+
+    def tearDown(self):
+        self.http.close()
+        self.settings_override.disable()
+        self.server.stop()
+
+    def queue_notification(self, user_whatsapp_id="5511999990000"):
+        PriceAlert.objects.create(user_whatsapp_id=user_whatsapp_id, origin_code="GRU",
+                                  destination_code="GIG", target_price=500)
+        return check_active_alerts('2026-12-01', lambda *args: make_sdk_response(["350.00"]))
+
+    def test_check_alerts_leaves_delivery_to_the_webhook(self):
+        """
+        Garante que, com o webhook configurado, o check-alerts só grava a
+        notificação e o entregador a envia uma única vez, com a chave de
+        idempotência.
+        """
+        self.assertEqual(self.queue_notification(), [])
+        notification = AlertNotification.objects.get()
+        self.assertIsNone(notification.delivered_at)
+        self.assertFalse(PriceAlert.objects.filter(is_active=True).exists())
+
+        stats = notification_delivery.deliver_pending(self.http)
+        notification_delivery.deliver_pending(self.http)
+
+        self.assertEqual(stats, {'delivered': 1, 'retrying': 0, 'failed': 0})
+        self.assertEqual(len(self.server.requests), 1)
+        request = self.server.requests[0]
+        self.assertEqual(request['body']['notifications'][0]['idempotency_key'],
+                         str(notification.idempotency_key))
+        self.assertEqual(request['body']['notifications'][0]['found_price'], '350.00')
+        self.assertEqual(request['headers']['Idempotency-Key'],
+                         notification_delivery.batch_idempotency_key([notification]))
+        notification.refresh_from_db()
+        self.assertIsNotNone(notification.delivered_at)
+        self.assertEqual(notification.attempts, 1)
+
+    def test_failed_batch_is_retried_with_backoff(self):
+        """
+        Garante que um lote recusado volta para a fila com backoff e é
+        reenviado com a mesma chave de idempotência só quando vencer.
+        """
+        self.server.statuses = [503]
+        self.queue_notification()
+        now = timezone.now()
+
+        with self.assertLogs('flights.notification_delivery', level='WARNING'):
+            stats = notification_delivery.deliver_pending(self.http, now=now)
+
+        self.assertEqual(stats, {'delivered': 0, 'retrying': 1, 'failed': 0})
+        notification = AlertNotification.objects.get()
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.next_attempt_at, now + timedelta(seconds=30))
+        self.assertIn("503", notification.last_error)
+
+        # Antes de vencer, nada é reenviado
+        notification_delivery.deliver_pending(self.http, now=now + timedelta(seconds=29))
+        self.assertEqual(len(self.server.requests), 1)
+
+        stats = notification_delivery.deliver_pending(self.http, now=now + timedelta(seconds=30))
+
+        self.assertEqual(stats['delivered'], 1)
+        keys = [request['body']['notifications'][0]['idempotency_key']
+                for request in self.server.requests]
+        self.assertEqual(keys, [str(notification.idempotency_key)] * 2)
+        self.assertEqual(self.server.duplicates, 0)
+
+    def test_gives_up_after_max_attempts(self):
+        """
+        Garante que o Retry-After do webhook é respeitado e que a notificação
+        é marcada como falha depois de NOTIFICATION_MAX_ATTEMPTS tentativas.
+        """
+        self.server.statuses = [429, 500, 500]
+        self.server.retry_after = 120
+        self.queue_notification()
+        now = timezone.now()
+
+        with self.assertLogs('flights.notification_delivery', level='WARNING'):
+            notification_delivery.deliver_pending(self.http, now=now)
+        notification = AlertNotification.objects.get()
+        self.assertEqual(notification.next_attempt_at, now + timedelta(seconds=120))
+
+        for _ in range(2):
+            now = AlertNotification.objects.get().next_attempt_at
+            with self.assertLogs('flights.notification_delivery', level='WARNING'):
+                stats = notification_delivery.deliver_pending(self.http, now=now)
+
+        self.assertEqual(stats, {'delivered': 0, 'retrying': 0, 'failed': 1})
+        notification.refresh_from_db()
+        self.assertEqual(notification.attempts, 3)
+        self.assertIsNotNone(notification.failed_at)
+        self.assertEqual(notification_delivery.deliver_pending(self.http, now=now)['failed'], 0)
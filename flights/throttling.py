@@ -0,0 +1,66 @@
+"""
+Limitador de taxa das chamadas à Amadeus.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: libera `rate` chamadas por segundo, com
+    rajadas de até `capacity` chamadas. Com rate <= 0 não há limite.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até haver um token disponível."""
+        if self.rate <= 0:
+            return
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    def _take(self):
+        """Tenta tirar um token; retorna a espera (segundos) se não houver."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    async def aacquire(self):
+        """Versão assíncrona de `acquire`: espera sem bloquear o event loop."""
+        if self.rate <= 0:
+            return
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_amadeus_rate_limiter():
+    """Limitador compartilhado pelo processo, configurado com a cota da Amadeus."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = TokenBucket(
+                    rate=getattr(settings, 'AMADEUS_RATE_LIMIT', 10),
+                    capacity=getattr(settings, 'AMADEUS_RATE_BURST', None)
+                )
+    return _rate_limiter
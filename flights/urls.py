@@ -1,8 +1,18 @@
 from django.urls import path
-from .views import FlightSearchView, PriceAlertCreateView, CheckAlertsView
+from .views import (
+    FlightSearchView, AsyncFlightSearchView, FlightCalendarView, FlightBatchSearchView,
+    PriceAlertCreateView, PriceAlertBulkCreateView, CheckAlertsView, CacheStatsView,
+    UnderstandMessageView, AirportSearchView)
 
 urlpatterns = [
     path('search-flights/', FlightSearchView.as_view(), name='search-flights'),
+    path('async/search-flights/', AsyncFlightSearchView.as_view(), name='async-search-flights'),
+    path('search-calendar/', FlightCalendarView.as_view(), name='search-calendar'),
+    path('search-batch/', FlightBatchSearchView.as_view(), name='search-batch'),
     path('create-alert/', PriceAlertCreateView.as_view(), name='create-alert'),
+    path('create-alerts/', PriceAlertBulkCreateView.as_view(), name='create-alerts'),
     path('check-alerts/', CheckAlertsView.as_view(), name='check-alerts'),
+    path('understand-message/', UnderstandMessageView.as_view(), name='understand-message'),
+    path('airports/', AirportSearchView.as_view(), name='airports'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
 ]
@@ -1,59 +1,118 @@
-import openai
-import os
 import json
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .amadeus_service import search_flights_from_amadeus
+from rest_framework.settings import api_settings
+from .amadeus_service import (
+    async_search_flights_from_amadeus, is_stale_response, search_flights_from_amadeus,
+    stale_details, upstream_errors)
 from datetime import datetime, date, timedelta
 from .serializers import PriceAlertSerializer
+from .alert_service import check_active_alerts, create_alerts, stream_active_alerts
+from .airports import airport_index
+from .alert_matching import match_offers
+from .intent_parser import MAX_MESSAGE_LENGTH, IntentUnavailable, parse_message
+from .offers import parse_amadeus_response
+from .search_service import date_range, search_batch, search_calendar
+from .renderers import NDJSONRenderer, dumps
+from .dashboard import KeysetPage, get_dashboard_version, route_summary
+from .price_history import flush_observations
+from . import metrics, offer_cache
 from .models import PriceAlert
-from amadeus import ResponseError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
 from django.views.generic import ListView
 
-def parse_amadeus_response(amadeus_response):
+def validate_search_params(origem, destino, data):
     """
-    Função auxiliar para transformar a resposta complexa da Amadeus
-    em uma lista simples que nossa API vai retornar.
+    Valida os parâmetros da busca. Retorna a mensagem de erro, ou None se
+    estiverem corretos.
     """
-    flights_list = []
+    if not all([origem, destino, data]):
+        return "Parâmetros 'origem', 'destino' e 'data' são obrigatórios."
 
-    carriers = {}
+    try:
+        search_date_obj = datetime.strptime(data, '%Y-%m-%d').date()
+    except ValueError:
+        return "Formato de data inválido. Use AAAA-MM-DD."
 
-    if hasattr(amadeus_response, 'dictionaries') and amadeus_response.dictionaries is not None:
-        carriers = amadeus_response.dictionaries.get('carriers', {})
+    if search_date_obj < date.today():
+        return "A data da busca não pode ser no passado."
+    return None
 
-    for offer in amadeus_response.data:
-        try:
-            # Pega o primeiro itinerário da oferta (geralmente o voo de ida)
-            itinerary = offer['itineraries'][0]
-            segments = itinerary['segments']
-
-            # obtém o primeiro e o último trecho da viagem
-            first_segment = segments[0]
-            last_segment = segments[-1]
-
-            # Calcula o número de paradas
-            stops = len(segments) - 1
-
-            carrier_code = first_segment['carrierCode']
-
-            flight_info = {
-                "origin": first_segment['departure']['iataCode'],
-                "destination": last_segment['arrival']['iataCode'],
-                "departure_time": first_segment['departure']['at'],
-                "arrival_time": last_segment['arrival']['at'],
-                "stops": stops,
-                "duration": itinerary['duration'],
-                "carrier": carriers.get(carrier_code, carrier_code),
-                "price": offer.get('price', {}).get('total')
-            }
-            flights_list.append(flight_info)
 
-        except (IndexError, KeyError) as e:
-            print(f"Erro ao processar uma oferta de voo: {e}")
-            continue
-    return flights_list
+def resolve_route(origem, destino):
+    """
+    Códigos IATA da origem e do destino, informados como código ou como nome
+    da cidade ou do aeroporto. Retorna ((origem, destino), erro); o erro
+    sugere os locais com nomes parecidos.
+    """
+    index = airport_index()
+    route = []
+    for campo, valor in (('origem', origem), ('destino', destino)):
+        code = index.resolve(valor)
+        if code is None:
+            sugestoes = ', '.join(f"{airport.iata} ({airport.city})"
+                                  for airport in index.search(valor, limit=5))
+            erro = f"Local de {campo} desconhecido ou ambíguo: '{valor}'."
+            return None, erro + (f" Você quis dizer: {sugestoes}?" if sugestoes else "")
+        route.append(code)
+    return tuple(route), None
+
+
+def parse_calendar_dates(params):
+    """
+    Lê o período do calendário: `data_inicio` e `data_fim`, ou `data` com
+    `dias` para cada lado. Retorna (datas, erro); datas passadas são
+    descartadas.
+    """
+    max_days = getattr(settings, 'CALENDAR_MAX_DAYS', 31)
+    try:
+        if params.get('data_inicio') or params.get('data_fim'):
+            start = datetime.strptime(params.get('data_inicio', ''), '%Y-%m-%d').date()
+            end = datetime.strptime(params.get('data_fim', ''), '%Y-%m-%d').date()
+        else:
+            center = datetime.strptime(params.get('data', ''), '%Y-%m-%d').date()
+            days = int(params.get('dias', 3))
+            if days < 0:
+                raise ValueError
+            if days > max_days:
+                return None, f"O período da busca pode ter no máximo {max_days} dias."
+            start, end = center - timedelta(days=days), center + timedelta(days=days)
+    except (ValueError, OverflowError):
+        # OverflowError: período fora das datas representáveis (ex: 9999-12-31)
+        return None, ("Informe 'data_inicio' e 'data_fim', ou 'data' e 'dias', "
+                      "com datas no formato AAAA-MM-DD.")
+
+    if end < start:
+        return None, "A 'data_fim' deve ser igual ou posterior à 'data_inicio'."
+
+    start = max(start, date.today())
+    if end < start:
+        return None, "O período da busca não pode estar no passado."
+
+    if (end - start).days + 1 > max_days:
+        return None, f"O período da busca pode ter no máximo {max_days} dias."
+    return date_range(start, end), None
+
+
+def parse_shard(params):
+    """
+    Lê a fração das rotas a verificar: `shard` (índice a partir de 0) e
+    `shards` (total). Retorna ((índice, total), erro), ou (None, None) sem
+    divisão.
+    """
+    if params.get('shard') is None and params.get('shards') is None:
+        return None, None
+    try:
+        index, shards = int(params.get('shard', '')), int(params.get('shards', ''))
+    except ValueError:
+        index = shards = 0
+    if not 0 <= index < shards:
+        return None, "Informe 'shard' e 'shards' inteiros, com 0 <= shard < shards."
+    return (index, shards), None
 
 
 class FlightSearchView(APIView):
@@ -65,31 +124,24 @@ class FlightSearchView(APIView):
         origem = request.query_params.get('origem', None)
         destino = request.query_params.get('destino', None)
         data = request.query_params.get('data', None)
-        print("origem: ", origem)
         # Validação simples
-        if not all([origem, destino, data]):
-            return Response(
-                {"erro": "Parâmetros 'origem', 'destino' e 'data' são obrigatórios."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        try:
-            search_date_obj = datetime.strptime(data, '%Y-%m-%d').date()
-
-            if search_date_obj < date.today():
-                return Response(
-                    {"erro": "A data da busca não pode ser no passado."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except ValueError:
-            return Response(
-                {"erro": "Formato de data inválido. Use AAAA-MM-DD."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        erro = validate_search_params(origem, destino, data)
+        if erro:
+            return Response({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+        # Aceita o nome da cidade ou do aeroporto no lugar do código IATA
+        route, erro = resolve_route(origem, destino)
+        if erro:
+            return Response({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+        origem, destino = route
 
         try:
             amadeus_response = search_flights_from_amadeus(
                 origem, destino, data)
+            # Grava o preço observado (se a busca chegou à Amadeus)
+            flush_observations()
+            if amadeus_response and not is_stale_response(amadeus_response):
+                # O preço visto já dispara os alertas da rota, sem esperar o check-alerts
+                match_offers(origem, destino, amadeus_response.data)
 
             if not amadeus_response or not amadeus_response.data:
                 return Response({"mensagem": "Nenhum voo encontrado para esta rota e data."},
@@ -100,11 +152,13 @@ class FlightSearchView(APIView):
             response_data = {
                 "route": f"{origem} -> {destino}",
                 "date": data,
-                "flight_options": parsed_flights
+                "flight_options": parsed_flights,
+                # Com o circuito da Amadeus aberto: último resultado conhecido
+                **stale_details(amadeus_response)
             }
             return Response(response_data, status=status.HTTP_200_OK)
 
-        except ResponseError as e:
+        except upstream_errors() as e:
             error_details = e.response.result if hasattr(
                 e, 'response') and hasattr(e.response, 'result') else str(e)
             return Response(
@@ -120,61 +174,292 @@ class FlightSearchView(APIView):
             )
 
 
+class AsyncFlightSearchView(View):
+    """
+    Versão assíncrona da busca de voos, para rodar sob ASGI.
+
+    Enquanto espera a Amadeus a requisição não ocupa uma thread do worker,
+    então um único processo atende centenas de buscas simultâneas.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        origem = request.GET.get('origem', None)
+        destino = request.GET.get('destino', None)
+        data = request.GET.get('data', None)
+
+        erro = validate_search_params(origem, destino, data)
+        if erro:
+            return JsonResponse({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+        route, erro = resolve_route(origem, destino)
+        if erro:
+            return JsonResponse({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+        origem, destino = route
+
+        try:
+            amadeus_response = await async_search_flights_from_amadeus(
+                origem, destino, data)
+            await sync_to_async(flush_observations)()
+            if amadeus_response and not is_stale_response(amadeus_response):
+                await sync_to_async(match_offers)(origem, destino, amadeus_response.data)
+
+            if not amadeus_response or not amadeus_response.data:
+                return JsonResponse({"mensagem": "Nenhum voo encontrado para esta rota e data."},
+                                    status=status.HTTP_404_NOT_FOUND)
+
+            response_data = {
+                "route": f"{origem} -> {destino}",
+                "date": data,
+                "flight_options": parse_amadeus_response(amadeus_response),
+                **stale_details(amadeus_response)
+            }
+            return HttpResponse(dumps(response_data), content_type='application/json',
+                                status=status.HTTP_200_OK)
+
+        except upstream_errors() as e:
+            return JsonResponse(
+                {"erro": "Falha ao consultar a API da Amadeus.",
+                    "detalhes": getattr(e, 'result', None) or str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except Exception as e:
+            return JsonResponse(
+                {"erro": "Ocorreu um erro interno inesperado no servidor.",
+                    "detalhes": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class FlightCalendarView(APIView):
+    """
+    Calendário de preços: o menor preço de cada dia do período e a melhor
+    oferta, em uma única chamada.
+    """
+
+    def get(self, request, *args, **kwargs):
+        origem = request.query_params.get('origem', None)
+        destino = request.query_params.get('destino', None)
+        if not all([origem, destino]):
+            return Response({"erro": "Parâmetros 'origem' e 'destino' são obrigatórios."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        route, erro = resolve_route(origem, destino)
+        if erro:
+            return Response({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+        origem, destino = route
+
+        dates, erro = parse_calendar_dates(request.query_params)
+        if erro:
+            return Response({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Os dias são consultados em paralelo; os já buscados vêm do cache
+        result = search_calendar(origem, destino, dates, search_flights_from_amadeus)
+
+        return Response({"route": f"{origem} -> {destino}", **result}, status=status.HTTP_200_OK)
+
+
+class FlightBatchSearchView(APIView):
+    """
+    Várias buscas independentes (ex: ida e volta, aeroportos próximos) em
+    uma única chamada. Consultas repetidas são feitas uma vez e as
+    distintas rodam em paralelo, então o tempo total fica perto da consulta
+    mais lenta.
+    """
+
+    def post(self, request, *args, **kwargs):
+        queries = request.data.get('queries') if isinstance(request.data, dict) else None
+        max_queries = getattr(settings, 'BATCH_SEARCH_MAX_QUERIES', 20)
+        if not isinstance(queries, list) or not queries:
+            return Response({"erro": "Envie uma lista 'queries' com 'origem', 'destino' e 'data'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(queries) > max_queries:
+            return Response({"erro": f"O lote pode ter no máximo {max_queries} consultas."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Consultas inválidas recebem o erro sem derrubar o lote
+        normalized = []
+        for query in queries:
+            query = query if isinstance(query, dict) else {}
+            origem, destino, data = (str(query.get(field) or '').strip()
+                                     for field in ('origem', 'destino', 'data'))
+            erro = validate_search_params(origem, destino, data)
+            route = None
+            if not erro:
+                route, erro = resolve_route(origem, destino)
+            normalized.append((query, erro, route and (*route, data)))
+
+        results = search_batch(
+            [key for _, erro, key in normalized if not erro], search_flights_from_amadeus)
+
+        parsed = {}
+        response_data = []
+        for query, erro, key in normalized:
+            if erro:
+                response_data.append({"query": query, "status": status.HTTP_400_BAD_REQUEST,
+                                      "erro": erro})
+                continue
+
+            amadeus_response, error = results[key]
+            if error is None and (not amadeus_response or not amadeus_response.data):
+                response_data.append({"query": query, "status": status.HTTP_404_NOT_FOUND,
+                                      "mensagem": "Nenhum voo encontrado para esta rota e data."})
+            elif error is None:
+                if key not in parsed:
+                    parsed[key] = parse_amadeus_response(amadeus_response)
+                response_data.append({"query": query, "status": status.HTTP_200_OK,
+                                      "route": f"{key[0]} -> {key[1]}", "date": key[2],
+                                      "flight_options": parsed[key],
+                                      **stale_details(amadeus_response)})
+            elif isinstance(error, (TimeoutError, *upstream_errors())):
+                error_details = getattr(getattr(error, 'response', None), 'result', None) or str(error)
+                response_data.append({"query": query, "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                                      "erro": "Falha ao consultar a API da Amadeus.",
+                                      "detalhes": error_details})
+            else:
+                response_data.append({"query": query,
+                                      "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                      "erro": "Ocorreu um erro interno inesperado no servidor.",
+                                      "detalhes": str(error)})
+
+        return Response({"results": response_data}, status=status.HTTP_200_OK)
+
+
 class PriceAlertCreateView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = PriceAlertSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # Reenvio de um alerta ativo igual não cria outro
+            create_alerts([serializer.validated_data])
             return Response({"mensagem": "Alerta criado com sucesso!"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PriceAlertBulkCreateView(APIView):
+    """
+    Vários alertas em uma chamada, validados juntos: se algum for
+    inválido, nenhum é criado. Alertas ativos repetidos são ignorados.
+    """
+
+    def post(self, request, *args, **kwargs):
+        alerts = request.data.get('alerts') if isinstance(request.data, dict) else None
+        max_alerts = getattr(settings, 'BULK_ALERT_MAX_SIZE', 100)
+        if not isinstance(alerts, list) or not alerts:
+            return Response({"erro": "Envie uma lista 'alerts' com os alertas a criar."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(alerts) > max_alerts:
+            return Response({"erro": f"O lote pode ter no máximo {max_alerts} alertas."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PriceAlertSerializer(data=alerts, many=True)
+        if not serializer.is_valid():
+            return Response({"erros": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        criados = create_alerts(serializer.validated_data)
+        return Response({"mensagem": "Alertas criados com sucesso!", "criados": criados,
+                         "ignorados": len(alerts) - criados}, status=status.HTTP_201_CREATED)
+
+
+class UnderstandMessageView(APIView):
+    """
+    Intenção e entidades de uma mensagem do usuário. As frases comuns são
+    resolvidas localmente; só as ambíguas vão para o modelo da OpenAI.
+    """
+
+    def post(self, request, *args, **kwargs):
+        message = request.data.get('message') if isinstance(request.data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            return Response({"erro": "Envie o texto da mensagem em 'message'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(message) > MAX_MESSAGE_LENGTH:
+            return Response({"erro": f"A mensagem pode ter no máximo {MAX_MESSAGE_LENGTH} caracteres."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result, source = parse_message(message)
+        except IntentUnavailable as e:
+            return Response({"erro": "Falha ao interpretar a mensagem.", "detalhes": str(e)},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({**result, "source": source}, status=status.HTTP_200_OK)
+
+
+class AirportSearchView(APIView):
+    """
+    Aeroportos para um texto digitado (ex: autocompletar a origem e o
+    destino): código exato, nomes com o prefixo e, sem resultado, nomes
+    parecidos. Cidades com vários aeroportos trazem todos eles.
+    """
+
+    def get(self, request, *args, **kwargs):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({"erro": "Parâmetro 'q' é obrigatório."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limite', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+
+        index = airport_index()
+        airports = index.search(q, limit)
+        codes = index.lookup(q)
+        return Response({
+            "aeroportos": [airport.as_dict() for airport in airports],
+            # Código usado na busca de voos quando `q` é um código ou nome exato
+            "codigo_busca": index.location_code(codes) if codes else None,
+        }, status=status.HTTP_200_OK)
+
+
 class CheckAlertsView(APIView):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
     def get(self, request, *args, **kwargs):
-        active_alerts = PriceAlert.objects.filter(is_active=True)
-        notifications_to_send = []
+        # Com ?shard=i&shards=n, só as rotas da fração i de n são verificadas
+        # (ex: um worker ou nó por fração)
+        shard, erro = parse_shard(request.query_params)
+        if erro:
+            return Response({"erro": erro}, status=status.HTTP_400_BAD_REQUEST)
 
         # A data da busca será sempre o dia de amanhã para garantir voos
-        search_date = date.today().replace(day=date.today().day + 1).strftime('%Y-%m-%d')
+        search_date = (date.today() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        # Com ?stream=1 ou Accept: application/x-ndjson, cada notificação é
+        # enviada assim que a rota dela é avaliada (uma linha JSON por notificação)
+        if (request.query_params.get('stream') in ('1', 'true')
+                or request.accepted_renderer.format == NDJSONRenderer.format):
+            notifications = stream_active_alerts(
+                search_date, search_flights_from_amadeus, shard)
+            return StreamingHttpResponse(
+                (json.dumps(notification) + '\n' for notification in notifications),
+                content_type=NDJSONRenderer.media_type
+            )
 
-        for alert in active_alerts:
-            print(
-                f"Verificando alerta para {alert.origin_code} -> {alert.destination_code}")
+        # Cada rota distinta é consultada uma única vez na Amadeus
+        notifications_to_send = check_active_alerts(
+            search_date, search_flights_from_amadeus, shard)
 
-            amadeus_response = search_flights_from_amadeus(
-                alert.origin_code,
-                alert.destination_code,
-                search_date
-            )
+        return Response({"notifications_to_send": notifications_to_send}, status=status.HTTP_200_OK)
 
-            if not amadeus_response or not amadeus_response.data:
-                continue  # Pula para o próximo alerta se não encontrar voos
+class CacheStatsView(APIView):
+    """
+    Expõe os contadores do cache de ofertas para dimensionar TTL e tamanho.
+    """
 
-            # Encontra o voo mais barato na resposta
-            from decimal import Decimal
-            cheapest_flight_price = min(
-                [Decimal(offer['price']['total'])
-                 for offer in amadeus_response.data]
-            )
+    def get(self, request, *args, **kwargs):
+        return Response(offer_cache.get_stats(), status=status.HTTP_200_OK)
 
-            if cheapest_flight_price <= alert.target_price:
-                print(
-                    f"PREÇO BOM ENCONTRADO! Alvo: {alert.target_price}, Encontrado: {cheapest_flight_price}")
 
-                # Adiciona à lista de notificações
-                notifications_to_send.append({
-                    'user_whatsapp_id': alert.user_whatsapp_id,
-                    'origin': alert.origin_code,
-                    'destination': alert.destination_code,
-                    'target_price': str(alert.target_price),
-                    'found_price': str(cheapest_flight_price)
-                })
+class MetricsView(View):
+    """
+    Métricas no formato texto do Prometheus, somadas entre os workers
+    (ver `flights.metrics`), mais a taxa de acertos do cache de ofertas.
+    """
 
-                # Desativa o alerta para não notificar de novo
-                alert.is_active = False
-                alert.save()
+    def get(self, request, *args, **kwargs):
+        lines = metrics.render()
+        lines += metrics.format_family('flight_cache_hit_ratio', metrics.GAUGE, [
+            ({}, offer_cache.get_stats()['hit_ratio'])])
+        return HttpResponse('\n'.join(lines) + '\n',
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        return Response({"notifications_to_send": notifications_to_send}, status=status.HTTP_200_OK)
 
 class AlertsDashboardView(ListView):
     model = PriceAlert
@@ -182,5 +467,19 @@ class AlertsDashboardView(ListView):
     context_object_name = 'alerts'
 
     def get_queryset(self):
-        return PriceAlert.objects.filter(is_active=True).order_by('-created_at')
-
+        return PriceAlert.objects.filter(is_active=True).order_by('-created_at', '-id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        cursor = self.request.GET.get('cursor', '')
+
+        # Tabela e resumo são renderizados a partir de consultas preguiçosas:
+        # com o fragmento em cache, o banco não é consultado.
+        context.update({
+            'page': KeysetPage(self.object_list, cursor),
+            'cursor': cursor,
+            'route_summary': route_summary(),
+            'dashboard_version': get_dashboard_version(),
+            'fragment_timeout': getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300),
+        })
+        return context
@@ -0,0 +1,85 @@
+"""
+Aquecimento dos workers do gunicorn (ver gunicorn.conf.py).
+
+`preload_modules` roda no master, antes do fork: importa as URLs (e com
+elas as views, que o Django só carrega na primeira requisição) e os
+módulos pesados que o projeto carrega sob demanda, para que os workers os
+herdem já carregados. `warm_up_worker` roda em cada worker antes de ele aceitar
+requisições: cria o cliente da Amadeus (ou abre o mock), os caches, o
+índice de aeroportos e o índice de disparo dos alertas, em vez de a
+primeira requisição pagar por isso. Uma etapa que falhar é só registrada;
+o worker sobe mesmo assim.
+"""
+import importlib
+import logging
+import time
+
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Carregados sob demanda pelo amadeus_service
+PRELOADED_MODULES = ('amadeus', 'amadeus.client.access_token', 'requests', 'httpx')
+
+
+def preload_modules():
+    get_resolver().url_patterns
+    for name in PRELOADED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Módulo não pré-carregado", extra={'module': name, 'error': str(e)})
+
+
+def _warm_amadeus():
+    from . import amadeus_service
+
+    if amadeus_service.USE_MOCK_AMADEUS:
+        amadeus_service.mock_store.get('GRU', 'GIG', '2000-01-01')
+    else:
+        amadeus_service.amadeus_client.get_client()
+
+
+def _warm_caches():
+    # A primeira leitura cria o backend e abre a conexão (ex: Redis, banco)
+    for alias in caches:
+        caches[alias].get('warmup')
+
+
+def _warm_airport_index():
+    from .airports import airport_index
+
+    airport_index()
+
+
+def _warm_alert_index():
+    from .alert_matching import matching_index
+
+    matching_index.sync(force=True)
+
+
+WARM_UP_STEPS = (
+    ('amadeus', _warm_amadeus),
+    ('caches', _warm_caches),
+    ('airport_index', _warm_airport_index),
+    ('alert_index', _warm_alert_index),
+)
+
+
+def warm_up_worker():
+    """Executa as etapas de aquecimento e retorna a duração (segundos) de cada uma."""
+    durations = {}
+    for name, step in WARM_UP_STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Falha no aquecimento do worker", extra={'step': name, 'error': str(e)})
+        durations[name] = round(time.perf_counter() - started, 4)
+
+    # Conexões abertas no aquecimento não devem vazar para a primeira requisição
+    close_old_connections()
+    logger.info("Worker aquecido", extra={'durations': durations})
+    return durations
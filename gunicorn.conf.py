@@ -0,0 +1,37 @@
+"""
+Configuração do gunicorn, carregada automaticamente da raiz do projeto.
+
+Com preload_app a aplicação (Django, views e dependências) é importada uma
+única vez no master; os workers herdam os módulos já carregados e sobem
+sem reimportar tudo. Antes de aceitar requisições cada worker é aquecido
+(ver `flights.warmup`).
+"""
+import glob
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def on_starting(server):
+    # Retratos de métricas de uma execução anterior (ver flights.metrics)
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            os.remove(path)
+
+
+def when_ready(server):
+    # No master, depois do preload e antes do fork dos workers
+    if preload_app:
+        from flights.warmup import preload_modules
+
+        preload_modules()
+
+
+def post_worker_init(worker):
+    from flights.warmup import warm_up_worker
+
+    warm_up_worker()